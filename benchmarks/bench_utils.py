@@ -0,0 +1,143 @@
+"""
+Utilities shared by the benchmark scripts.
+"""
+
+import functools
+import http.server
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+from typing import Iterator, List, Sequence
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+MOCK_MARQO = os.path.join(REPO_ROOT, 'helpers', 'mock_marqo.py')
+
+
+def percentile(values: Sequence[float], q: float) -> float:
+    """
+    The q-th percentile (0-100) of values, by linear interpolation.
+
+    Args:
+        values (Sequence[float]): The samples.
+        q (float): The percentile to compute.
+
+    Returns:
+        float: The percentile, or 0.0 if there are no samples.
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * q / 100
+    lo = int(k)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+@contextmanager
+def mock_marqo_server(**options) -> Iterator[str]:
+    """
+    Runs helpers/mock_marqo.py in a separate process, so its CPU use is not
+    counted against the client being measured, and yields its URL.
+
+    Args:
+        **options: Command line options of mock_marqo.py, e.g. doc_latency=0.01.
+
+    Yields:
+        str: The URL of the server.
+    """
+    port = free_port()
+    args = [sys.executable, MOCK_MARQO, '--port', str(port)]
+    for key, value in options.items():
+        if value is not None:
+            args += [f"--{key.replace('_', '-')}", str(value)]
+    proc = subprocess.Popen(args, stdout=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.time() + 10
+        while True:
+            try:
+                urllib.request.urlopen(url, timeout=1).read()
+                break
+            except OSError:
+                if time.time() > deadline or proc.poll() is not None:
+                    raise RuntimeError("mock Marqo server did not start")
+                time.sleep(0.05)
+        yield url
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+class _StaticFileHandler(http.server.SimpleHTTPRequestHandler):
+    # HTTP/1.1, so clients can keep connections alive
+    protocol_version = 'HTTP/1.1'
+
+    def __init__(self, *args, latency=0.0, connect_latency=0.0, **kwargs):
+        self.latency = latency
+        self.connect_latency = connect_latency
+        super().__init__(*args, **kwargs)
+
+    def setup(self):
+        super().setup()
+        # The cost of a new connection to a remote host (TCP and TLS handshakes)
+        time.sleep(self.connect_latency)
+
+    def send_head(self):
+        time.sleep(self.latency)
+        return super().send_head()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _QuietHTTPServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients hanging up early, e.g. on an oversized image, are expected
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+@contextmanager
+def static_file_server(directory: str, latency: float = 0.0, connect_latency: float = 0.0) -> Iterator[str]:
+    """
+    Serves the files of a directory over HTTP on a background thread, like a
+    remote image host, and yields its URL.
+
+    Args:
+        directory (str): The directory to serve.
+        latency (float, optional): Seconds added to every request. Default is 0.
+        connect_latency (float, optional): Seconds added to every new connection. Default is 0.
+
+    Yields:
+        str: The URL of the server, ending in '/'.
+    """
+    handler = functools.partial(_StaticFileHandler, directory=directory, latency=latency,
+                                connect_latency=connect_latency)
+    server = _QuietHTTPServer(('127.0.0.1', 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_port}/"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def write_json(path: str, results: List[dict]) -> None:
+    """ Writes benchmark results to a JSON file, for comparing runs. """
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
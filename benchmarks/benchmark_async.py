@@ -0,0 +1,106 @@
+"""
+Compares search throughput of the blocking marqo.Client (fanned out over a
+thread pool) with helpers.async_client.AsyncClient (a single event loop and
+a pooled HTTP session) at several concurrency levels.
+
+By default a mock Marqo server (helpers/mock_marqo.py) is started with enough
+simulated inference workers that the client side is the bottleneck; use --url
+to benchmark a real Marqo.
+
+Usage:
+    python benchmarks/benchmark_async.py
+    python benchmarks/benchmark_async.py --concurrency 1 16 128 --requests 2000 --search-latency 0.02
+"""
+
+import argparse
+import asyncio
+import itertools
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from marqo import Client
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from helpers.async_client import AsyncClient
+from bench_utils import mock_marqo_server, percentile, write_json
+from benchmark_search import DEFAULT_QUERIES, seed_index
+
+
+def run_sync(url, index_name, queries, concurrency, n_requests):
+    index = Client(url).index(index_name)
+
+    def one(q):
+        t0 = time.perf_counter()
+        index.search(q)
+        return time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = list(executor.map(one, itertools.islice(itertools.cycle(queries), n_requests)))
+    return time.perf_counter() - t0, latencies
+
+
+def run_async(url, index_name, queries, concurrency, n_requests):
+    async def main():
+        async with AsyncClient(url, max_concurrency=concurrency) as mq:
+            index = mq.index(index_name)
+            # Start each timer once the request may run, like a thread pool worker picking it up
+            slots = asyncio.Semaphore(concurrency)
+
+            async def one(q):
+                async with slots:
+                    t0 = time.perf_counter()
+                    await index.search(q)
+                    return time.perf_counter() - t0
+
+            await index.search(queries[0])  # open the session outside the measurement
+            t0 = time.perf_counter()
+            latencies = await asyncio.gather(*(one(q) for q in itertools.islice(itertools.cycle(queries), n_requests)))
+            return time.perf_counter() - t0, latencies
+
+    return asyncio.run(main())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help="Marqo URL (default: start a mock server)")
+    parser.add_argument('--index-name', default='async-benchmark')
+    parser.add_argument('--n-docs', type=int, default=20, help="synthetic documents to seed the index with")
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 16, 128])
+    parser.add_argument('--requests', type=int, default=1000, help="searches per run")
+    parser.add_argument('--search-latency', type=float, default=0.01, help="mock seconds per query embedding")
+    parser.add_argument('--inference-workers', type=int, default=256, help="mock concurrent query embeddings")
+    parser.add_argument('--json', help="also write the results to this JSON file")
+    args = parser.parse_args()
+
+    def run(url):
+        seed_index(Client(url), args.index_name, args.n_docs)
+        print(f"{'client':<6} {'conc':>5} {'requests':>9} {'qps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+              f"{'CPU s':>7}")
+        results = []
+        for concurrency in args.concurrency:
+            for name, fn in (('sync', run_sync), ('async', run_async)):
+                cpu0 = time.process_time()
+                elapsed, latencies = fn(url, args.index_name, DEFAULT_QUERIES, concurrency, args.requests)
+                r = {'client': name, 'concurrency': concurrency, 'requests': args.requests,
+                     'qps': args.requests / elapsed, 'p50_ms': percentile(latencies, 50) * 1e3,
+                     'p95_ms': percentile(latencies, 95) * 1e3, 'p99_ms': percentile(latencies, 99) * 1e3,
+                     'client_cpu_s': time.process_time() - cpu0}
+                results.append(r)
+                print(f"{name:<6} {concurrency:>5} {args.requests:>9} {r['qps']:>8.1f} {r['p50_ms']:>8.1f} "
+                      f"{r['p95_ms']:>8.1f} {r['p99_ms']:>8.1f} {r['client_cpu_s']:>7.2f}")
+        Client(url).delete_index(args.index_name)
+        if args.json:
+            write_json(args.json, results)
+
+    if args.url:
+        run(args.url)
+    else:
+        with mock_marqo_server(search_latency=args.search_latency, inference_workers=args.inference_workers) as url:
+            run(url)
+
+
+if __name__ == '__main__':
+    main()
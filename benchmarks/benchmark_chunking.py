@@ -0,0 +1,64 @@
+"""
+Microbenchmark of split_big_docs against the offset based chunk_document on
+simplewiki-sized documents.
+
+Usage:
+    python benchmarks/benchmark_chunking.py
+    python benchmarks/benchmark_chunking.py --n-docs 200 --big-chars 250000 --repeat 5
+"""
+
+import argparse
+import os
+import sys
+import timeit
+import tracemalloc
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from helpers.text_processing import split_big_docs, iter_chunks
+from synthetic_wiki import make_wiki_docs
+
+
+def peak_memory(fn):
+    """ Returns the tracemalloc peak, in bytes, of calling fn. """
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--n-docs', type=int, default=100, help="number of documents")
+    parser.add_argument('--big-fraction', type=float, default=0.3, help="fraction of documents over char_len")
+    parser.add_argument('--big-chars', type=int, default=120_000, help="length of the big documents")
+    parser.add_argument('--char-len', type=int, default=50_000, help="maximum chunk length")
+    parser.add_argument('--repeat', type=int, default=3, help="timing repeats, the best one is reported")
+    args = parser.parse_args()
+
+    docs = make_wiki_docs(args.n_docs, big_fraction=args.big_fraction, big_chars=args.big_chars)
+    total_chars = sum(len(d['content']) for d in docs)
+    print(f"{len(docs)} documents, {total_chars / 1e6:.1f}M characters, char_len={args.char_len}")
+
+    variants = {
+        'split_big_docs': lambda: split_big_docs(docs, char_len=args.char_len),
+        'chunk_document': lambda: list(iter_chunks(docs, char_len=args.char_len)),
+        'chunk_document (sentence)': lambda: list(iter_chunks(docs, char_len=args.char_len, boundary='sentence')),
+        'chunk_document (sentence, overlap=200)':
+            lambda: list(iter_chunks(docs, char_len=args.char_len, boundary='sentence', overlap=200)),
+    }
+
+    assert variants['split_big_docs']() == variants['chunk_document'](), "default chunking should match"
+
+    baseline = None
+    print(f"{'variant':<40} {'best (ms)':>10} {'speedup':>8} {'peak alloc (MiB)':>17}")
+    for name, fn in variants.items():
+        best = min(timeit.repeat(fn, number=1, repeat=args.repeat))
+        baseline = baseline or best
+        peak = peak_memory(fn)
+        print(f"{name:<40} {best * 1e3:>10.1f} {baseline / best:>7.1f}x {peak / 2 ** 20:>17.1f}")
+
+
+if __name__ == '__main__':
+    main()
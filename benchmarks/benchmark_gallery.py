@@ -0,0 +1,91 @@
+"""
+Compares the latency of rendering a gallery of search result images
+serially, as the image search guide does for its top hit, with
+helpers.result_images.render_gallery, which downloads over pooled
+keep-alive connections and decodes on a worker pool concurrently.
+
+Synthetic JPEG photos are served by local HTTP servers standing in for
+remote image hosts, with a configurable delay per request and per new
+connection, so it runs offline.
+
+Usage:
+    python benchmarks/benchmark_gallery.py
+    python benchmarks/benchmark_gallery.py --hits 20 50 --hosts 3 --latency 0.05 --connect-latency 0.1 --json gallery.json
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+from contextlib import ExitStack
+
+import numpy as np
+from PIL import Image
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from helpers.result_images import render_gallery, render_gallery_serial, pooled_session
+from bench_utils import static_file_server, write_json
+
+
+def make_images(directory, n_images, size=(1280, 960), seed=0):
+    """ Writes JPEGs of smooth gradients with noise, compressing like photos. """
+    rng = np.random.default_rng(seed)
+    w, h = size
+    names = []
+    for i in range(n_images):
+        x = np.linspace(0, 1, w)[None, :, None]
+        y = np.linspace(0, 1, h)[:, None, None]
+        colour = rng.uniform(0, 255, (1, 1, 3))
+        pixels = colour * x + (255 - colour) * y + rng.normal(0, 12, (h, w, 3))
+        name = f"photo{i}.jpg"
+        Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)).save(os.path.join(directory, name), quality=85)
+        names.append(name)
+    return names
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--hits', type=int, nargs='+', default=[20, 50], help="gallery sizes to render")
+    parser.add_argument('--hosts', type=int, default=2, help="image hosts the hits are spread over")
+    parser.add_argument('--latency', type=float, default=0.05, help="seconds added to every image request")
+    parser.add_argument('--connect-latency', type=float, default=0.05, help="seconds added to every new connection")
+    parser.add_argument('--per-host', type=int, default=8, help="downloads in flight per host")
+    parser.add_argument('--decode-workers', type=int, default=4)
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--json', help="also write the results to this JSON file")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory, ExitStack() as stack:
+        names = make_images(directory, max(args.hits))
+        hosts = [stack.enter_context(static_file_server(directory, args.latency, args.connect_latency))
+                 for _ in range(args.hosts)]
+        print(f"{'hits':>5} {'mode':<9} {'total ms':>9} {'fetched ms':>11} {'MiB':>6}")
+        for n_hits in args.hits:
+            hits = [{'_id': str(i), 'image': hosts[i % len(hosts)] + names[i]} for i in range(n_hits)]
+            session = pooled_session(per_host=args.per_host, hosts=len(hosts))
+            for mode in ['serial', 'parallel']:
+                reports = []
+                for _ in range(args.repeats):
+                    if mode == 'serial':
+                        _, report = render_gallery_serial(hits)
+                    else:
+                        # One session per gallery view, as a results page would keep
+                        _, report = render_gallery(hits, session=session, per_host=args.per_host,
+                                                   decode_workers=args.decode_workers)
+                    assert not report.errors, report.errors
+                    reports.append(report)
+                best = min(reports, key=lambda r: r.total_s)
+                print(f"{n_hits:>5} {mode:<9} {best.total_s * 1e3:>9.0f} {best.fetch_s * 1e3:>11.0f} "
+                      f"{best.bytes_downloaded / 2**20:>6.1f}")
+                results.append({'hits': n_hits, 'mode': mode, 'total_s': best.total_s, 'fetch_s': best.fetch_s,
+                                'bytes': best.bytes_downloaded})
+            serial, parallel = results[-2]['total_s'], results[-1]['total_s']
+            print(f"{n_hits:>5} speedup   {serial / parallel:>8.1f}x")
+
+    if args.json:
+        write_json(args.json, results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""
+Measures what downscaling images to the model's 224px input before indexing
+saves: the bytes Marqo downloads and its server-side indexing time.
+
+Synthetic full-size photos are written to a temporary directory and served
+by helpers.file_server.FileServer. They are indexed into a mock Marqo
+(helpers/mock_marqo.py with fetch_images, which downloads, decodes and
+resizes every image pointer like Marqo's CLIP preprocessing) twice: as they
+are, and after helpers.image_preprocessing.downscale_documents resized them
+on a process pool.
+
+Usage:
+    python benchmarks/benchmark_image_downscale.py
+    python benchmarks/benchmark_image_downscale.py --images 200 --source-size 4000 3000 --workers 8 --json downscale.json
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+from marqo import Client
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from helpers.file_server import FileServer
+from helpers.image_preprocessing import downscale_documents, DownscaleReport
+from helpers.mock_marqo import MockMarqo
+from helpers.text_processing import batched
+from bench_utils import write_json
+from benchmark_gallery import make_images
+
+
+def index_images(mq, mock, index_name, documents, batch_size):
+    """ Indexes documents and returns the server's processing seconds and the image bytes it downloaded. """
+    mq.create_index(index_name, settings_dict={"model": "ViT-B/32", "treatUrlsAndPointersAsImages": True})
+    bytes_before = mock.stats['image_bytes']
+    t0 = time.perf_counter()
+    responses = [mq.index(index_name).add_documents(batch, tensor_fields=["image"])
+                 for batch in batched(documents, batch_size)]
+    wall_s = time.perf_counter() - t0
+    assert not any(r['errors'] for r in responses), responses
+    server_s = sum(r['processingTimeMs'] for r in responses) / 1000
+    mq.delete_index(index_name)
+    return {'server_s': server_s, 'wall_s': wall_s, 'image_bytes': mock.stats['image_bytes'] - bytes_before}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--images', type=int, default=64)
+    parser.add_argument('--source-size', type=int, nargs=2, default=[3000, 2000], help="width and height of the photos")
+    parser.add_argument('--size', type=int, default=224, help="shorter side after downscaling")
+    parser.add_argument('--workers', type=int, default=None, help="downscaling processes (default: CPUs)")
+    parser.add_argument('--batch-size', type=int, default=16, help="documents per add_documents request")
+    parser.add_argument('--json', help="also write the results to this JSON file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        originals = os.path.join(root, 'originals')
+        os.makedirs(originals)
+        names = make_images(originals, args.images, size=tuple(args.source_size))
+
+        with FileServer(root) as files, MockMarqo(fetch_images=True) as mock:
+            mq = Client(mock.url)
+            documents = [{'_id': str(i), 'image': files.url_for(os.path.join(originals, name))}
+                         for i, name in enumerate(names)]
+            full = index_images(mq, mock, 'downscale-full', documents, args.batch_size)
+
+            report = DownscaleReport()
+            # Resize from the local files; the documents then point at the resized copies
+            local = [{'_id': str(i), 'image': os.path.join(originals, name)} for i, name in enumerate(names)]
+            resized = list(downscale_documents(local, os.path.join(root, 'resized'), files.url_for, size=args.size,
+                                               max_workers=args.workers, report=report))
+            assert not report.errors, report.errors
+            small = index_images(mq, mock, 'downscale-small', resized, args.batch_size)
+            small['downscale_s'] = report.elapsed
+
+    print(report.summary())
+    print(f"{'mode':<12} {'image MiB':>10} {'server s':>9} {'index s':>8} {'resize s':>9}")
+    for mode, r in [('full size', full), (f'{args.size}px', small)]:
+        print(f"{mode:<12} {r['image_bytes'] / 2**20:>10.1f} {r['server_s']:>9.2f} {r['wall_s']:>8.2f} "
+              f"{r.get('downscale_s', 0.0):>9.2f}")
+    print(f"{full['image_bytes'] / small['image_bytes']:.1f}x fewer bytes downloaded by Marqo, "
+          f"{full['server_s'] / small['server_s']:.1f}x less server time")
+    if args.json:
+        write_json(args.json, {'images': args.images, 'source_size': args.source_size, 'size': args.size,
+                               'full': full, 'downscaled': small})
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""
+Measures add_documents throughput of ingest_documents for several numbers of
+batches in flight, to help choose max_in_flight for your hardware.
+
+Needs a running Marqo instance (see the starter guides for the docker command).
+The benchmark index is deleted and re-created for every setting.
+
+Usage:
+    python benchmarks/benchmark_ingestion.py
+    python benchmarks/benchmark_ingestion.py --url http://localhost:8882 --in-flight 1 2 4 8 16 --n-docs 2000
+    python benchmarks/benchmark_ingestion.py --adaptive      # also print the adaptive batch size curve
+"""
+
+import argparse
+import logging
+import os
+import sys
+
+from marqo import Client
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from helpers.ingestion import ingest_documents, AdaptiveBatchSize
+from helpers.text_processing import iter_chunks
+from synthetic_wiki import iter_wiki_docs
+
+
+def run(mq, index_name, n_docs, batch_size, max_in_flight, model):
+    """ Re-creates the index and ingests n_docs synthetic documents into it. """
+    try:
+        mq.delete_index(index_name)
+    except Exception:
+        pass
+    mq.create_index(index_name, model=model)
+
+    documents = iter_chunks(iter_wiki_docs(n_docs, big_fraction=0), char_len=2000)
+    return ingest_documents(
+        mq.index(index_name), documents,
+        batch_size=batch_size, max_in_flight=max_in_flight,
+        tensor_fields=["title", "content"],
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default="http://localhost:8882", help="Marqo URL")
+    parser.add_argument('--index-name', default='ingestion-benchmark')
+    parser.add_argument('--model', default='hf/all_datasets_v4_MiniLM-L6')
+    parser.add_argument('--n-docs', type=int, default=1000, help="source documents to ingest per setting")
+    parser.add_argument('--batch-size', type=int, default=50)
+    parser.add_argument('--adaptive', action='store_true',
+                        help="size batches with AdaptiveBatchSize instead of --batch-size")
+    parser.add_argument('--in-flight', type=int, nargs='+', default=[1, 2, 4, 8], help="max_in_flight values to try")
+    args = parser.parse_args()
+    if args.adaptive:
+        logging.basicConfig(level=logging.INFO, format='    %(message)s')
+
+    mq = Client(args.url)
+    print(f"{'in flight':>9} {'docs':>7} {'time (s)':>9} {'docs/s':>8} {'p50 batch (s)':>14} "
+          f"{'p95 batch (s)':>14} {'errors':>7} {'retries':>8}")
+    for max_in_flight in args.in_flight:
+        batch_size = AdaptiveBatchSize() if args.adaptive else args.batch_size
+        report = run(mq, args.index_name, args.n_docs, batch_size, max_in_flight, args.model)
+        latencies = sorted(report.batch_latencies) or [0.0]
+        p50 = latencies[len(latencies) // 2]
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        n_errors = len(report.item_errors) + sum(len(b['ids']) for b in report.failed_batches)
+        print(f"{max_in_flight:>9} {report.n_docs:>7} {report.elapsed:>9.2f} {report.docs_per_second:>8.1f} "
+              f"{p50:>14.3f} {p95:>14.3f} {n_errors:>7} {report.n_retries:>8}")
+        if args.adaptive:
+            for step in batch_size.curve():
+                print(f"    budget {step['target_bytes'] / 1024:>7.0f} KiB: {step['batches']:>4} batches, "
+                      f"{step['mean_docs']:>6.1f} docs/batch, {step['mean_latency']:>6.3f}s/batch, "
+                      f"{step['docs_per_s']:>8.1f} docs/s, {step['errors']} errors")
+
+    mq.delete_index(args.index_name)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""
+Compares peak memory of the two ways of loading simplewiki.json:
+
+* eager:     read_json -> [clean_data(d) ...] -> split_big_docs (the original guide)
+* streaming: stream_documents (parses, cleans and splits one document at a time)
+* parallel:  stream_documents(processes=N) (cleans and splits on a process pool)
+
+Each path runs in a fresh interpreter so their peak RSS figures do not affect
+each other.
+
+Usage:
+    python benchmarks/benchmark_loading.py                      # synthetic dataset
+    python benchmarks/benchmark_loading.py --dataset ./starter-guides/text-search/simplewiki.json
+"""
+
+import argparse
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from helpers.text_processing import read_json, clean_data, split_big_docs, stream_documents
+from synthetic_wiki import write_wiki_json
+
+
+def load_eager(filename):
+    data = read_json(filename)
+    data = [clean_data(d) for d in data]
+    data = split_big_docs(data)
+    return len(data)
+
+
+def load_streaming(filename):
+    return sum(1 for _ in stream_documents(filename))
+
+
+def load_parallel(filename):
+    return sum(1 for _ in stream_documents(filename, processes=None))
+
+
+PATHS = {'eager': load_eager, 'streaming': load_streaming, 'parallel': load_parallel}
+
+
+def measure(name, filename, trace, queue):
+    """ Runs one loading path and reports its document count, time and memory peaks. """
+    if trace:
+        tracemalloc.start()
+    baseline_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    t0 = time.perf_counter()
+    cpu0 = time.process_time()
+    n_docs = PATHS[name](filename)
+    elapsed = time.perf_counter() - t0
+    # CPU time of this process only; pool workers are not included
+    cpu = time.process_time() - cpu0
+    peak_traced = tracemalloc.get_traced_memory()[1] if trace else None
+    # ru_maxrss is reported in kilobytes on Linux and bytes on macOS
+    scale = 1 if sys.platform == 'darwin' else 1024
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+    queue.put((n_docs, elapsed, cpu, peak_rss, baseline_rss * scale, peak_traced))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dataset', help="path to a simplewiki.json style file (default: generate one)")
+    parser.add_argument('--n-docs', type=int, default=10_000, help="documents in the generated dataset")
+    parser.add_argument('--paths', nargs='+', choices=list(PATHS), default=list(PATHS))
+    parser.add_argument('--trace', action='store_true',
+                        help="also report the tracemalloc peak (slower, Python allocations only)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = args.dataset
+        if filename is None:
+            filename = os.path.join(tmp, 'simplewiki.json')
+            write_wiki_json(filename, args.n_docs)
+        print(f"dataset: {filename} ({os.path.getsize(filename) / 2 ** 20:.1f} MiB)")
+
+        ctx = multiprocessing.get_context('spawn')
+        print(f"{'path':<10} {'docs':>8} {'time (s)':>9} {'main CPU (s)':>13} {'peak RSS (MiB)':>15} {'RSS growth (MiB)':>17}"
+              + (f" {'traced peak (MiB)':>18}" if args.trace else ''))
+        for name in args.paths:
+            queue = ctx.Queue()
+            proc = ctx.Process(target=measure, args=(name, filename, args.trace, queue))
+            proc.start()
+            n_docs, elapsed, cpu, peak_rss, baseline_rss, peak_traced = queue.get()
+            proc.join()
+            line = (f"{name:<10} {n_docs:>8} {elapsed:>9.2f} {cpu:>13.2f} {peak_rss / 2 ** 20:>15.1f} "
+                    f"{(peak_rss - baseline_rss) / 2 ** 20:>17.1f}")
+            if args.trace:
+                line += f" {peak_traced / 2 ** 20:>18.1f}"
+            print(line)
+
+
+if __name__ == '__main__':
+    main()
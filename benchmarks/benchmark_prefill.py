@@ -0,0 +1,122 @@
+"""
+Measures the prompt evaluation (prefill) time saved by PromptStateCache.
+
+Questions are replayed in a shuffled order against prompts built like the
+RAG guide's: a Background made of the sources retrieved for the question's
+topic, then the question. Questions about the same topic share their
+sources, as rephrased questions against the news index do. Each question's
+prefill is timed as the time to the first generated token under:
+
+* cold:        the model is reset before every prompt, everything is evaluated
+* llama_cpp:   llama_cpp's own reuse of the prefix shared with the previous prompt
+* state-cache: PromptStateCache restores the state saved for the prompt's Background
+
+Runs on CPU by default (--gpu-layers 0). Requires llama-cpp-python and a GGUF model.
+
+Usage:
+    python benchmarks/benchmark_prefill.py --model starter-guides/rag/models/Meta-Llama-3.1-8B-Instruct-Q4_K_M.gguf
+    python benchmarks/benchmark_prefill.py --model model.gguf --topics 4 --questions 40 --sources 5 --json prefill.json
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from helpers.llm import PromptStateCache
+from helpers.rag_context import get_context_prompt, question_offset
+from bench_utils import percentile, write_json
+from synthetic_wiki import make_paragraph
+
+MODES = ['cold', 'llama_cpp', 'state-cache']
+
+
+def make_prompts(n_topics, n_questions, n_sources, seed=0):
+    rng = random.Random(seed)
+    contexts = []
+    for t in range(n_topics):
+        context = ''
+        for i in range(n_sources):
+            text = make_paragraph(rng, 400)
+            context += f'Source {i}) Topic {t} headline {i} || {" ".join(text.split()[:60])}... \n'
+        contexts.append(context)
+    prompts = []
+    for q in range(n_questions):
+        question, context = f"Question {q}: what happened in topic {q % n_topics}?", contexts[q % n_topics]
+        prompts.append((get_context_prompt(question, context), question_offset(question, context)))
+    rng.shuffle(prompts)
+    return prompts
+
+
+def time_to_first_token(llm, prompt):
+    t0 = time.perf_counter()
+    stream = llm(prompt, max_tokens=1, stream=True)
+    next(stream)
+    elapsed = time.perf_counter() - t0
+    stream.close()
+    return elapsed
+
+
+def run_mode(llm, mode, prompts, max_bytes):
+    cache = PromptStateCache(llm, max_bytes=max_bytes) if mode == 'state-cache' else None
+    llm.reset()
+    latencies = []
+    for prompt, checkpoint in prompts:
+        t0 = time.perf_counter()
+        if mode == 'cold':
+            llm.reset()
+        elif cache is not None:
+            cache.prefill(prompt, checkpoints=[checkpoint])
+        latencies.append(time.perf_counter() - t0 + time_to_first_token(llm, prompt))
+    result = {
+        'mode': mode, 'questions': len(prompts),
+        'mean_ms': sum(latencies) / len(latencies) * 1e3,
+        'p50_ms': percentile(latencies, 50) * 1e3, 'p95_ms': percentile(latencies, 95) * 1e3,
+    }
+    if cache is not None:
+        result['cache'] = cache.stats()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model', required=True, help="path to a GGUF model")
+    parser.add_argument('--n-ctx', type=int, default=4096)
+    parser.add_argument('--gpu-layers', type=int, default=0, help="layers offloaded to the GPU (0 = CPU only)")
+    parser.add_argument('--threads', type=int, help="CPU threads (default: llama_cpp's choice)")
+    parser.add_argument('--topics', type=int, default=4, help="distinct sets of retrieved sources")
+    parser.add_argument('--questions', type=int, default=24)
+    parser.add_argument('--sources', type=int, default=5, help="sources per prompt, like search(limit=5)")
+    parser.add_argument('--max-mib', type=int, default=2048, help="PromptStateCache size limit")
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=MODES)
+    parser.add_argument('--json', help="also write the results to this JSON file")
+    args = parser.parse_args()
+
+    from llama_cpp import Llama
+    llm = Llama(model_path=args.model, n_ctx=args.n_ctx, n_gpu_layers=args.gpu_layers,
+                n_threads=args.threads, verbose=False)
+    prompts = make_prompts(args.topics, args.questions, args.sources)
+    n_tokens = sum(len(llm.tokenize(p.encode('utf-8'), special=True)) for p, _ in prompts) / len(prompts)
+    print(f"{len(prompts)} questions over {args.topics} topics, {n_tokens:.0f} prompt tokens on average")
+
+    # Warm up the model so the first measured prompt does not pay for it
+    time_to_first_token(llm, prompts[0][0])
+
+    print(f"{'mode':<12} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9} {'saved ms/question':>18}")
+    results = []
+    for mode in args.modes:
+        r = run_mode(llm, mode, prompts, args.max_mib * 2 ** 20)
+        results.append(r)
+        cold = next((c for c in results if c['mode'] == 'cold'), None)
+        saved = f"{cold['mean_ms'] - r['mean_ms']:>18.1f}" if cold else f"{'-':>18}"
+        print(f"{mode:<12} {r['mean_ms']:>9.1f} {r['p50_ms']:>9.1f} {r['p95_ms']:>9.1f} {saved}")
+        if 'cache' in r:
+            print(f"{'':<12} cache: {r['cache']}")
+    if args.json:
+        write_json(args.json, results)
+
+
+if __name__ == '__main__':
+    main()
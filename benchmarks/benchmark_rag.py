@@ -0,0 +1,214 @@
+"""
+Breaks the latency of the RAG flow of rag_open_source.py down by stage.
+
+Synthetic news articles are indexed, then each question goes through the
+guide's pipeline: a filtered Marqo search, context building (merging
+chunks and packing the hits into the token budget), prompt evaluation and
+decoding of the first paragraph. Each stage is timed separately:
+
+* load:     constructing the LLM
+* index:    create_index and add_documents
+* search:   the Marqo search of a question
+* context:  merge_chunks, select_mmr (with --mmr), pack_context and building the prompt
+* ttft:     time to first token, i.e. prompt evaluation (prefill)
+* decode:   the rest of the generation, also reported as tokens/sec
+* total:    search + context + generation of a question
+
+By default it runs offline: a mock Marqo server (helpers/mock_marqo.py)
+and a deterministic stub LLM (benchmarks/stub_llm.py) with configurable
+per-token costs, so it needs no GPU or model download. The stub's default
+costs are far below a real model's so a run takes seconds; raise
+--prefill-latency and --decode-latency (e.g. 0.002 and 0.02) to mimic an 8B
+model on a laptop GPU. Use --url for a real Marqo and --model for a real
+GGUF model (requires llama-cpp-python).
+
+Usage:
+    python benchmarks/benchmark_rag.py
+    python benchmarks/benchmark_rag.py --chunked --prompt-cache --questions 50 --json rag.json
+    python benchmarks/benchmark_rag.py --mmr --duplicates 0.5
+    python benchmarks/benchmark_rag.py --url http://localhost:8882 \\
+        --model starter-guides/rag/models/Meta-Llama-3.1-8B-Instruct-Q4_K_M.gguf
+"""
+
+import argparse
+import datetime
+import os
+import random
+import sys
+import time
+
+from marqo import Client
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from helpers.ingestion import ingest_documents
+from helpers.llm import stream_first_paragraph, PromptStateCache
+from helpers.rag_chunks import chunk_sources, merge_chunks
+from helpers.rag_context import (get_context_prompt, llama_token_counter, context_budget, pack_context,
+                                 question_offset, select_mmr)
+from bench_utils import mock_marqo_server, percentile, write_json
+from synthetic_wiki import make_paragraph
+from stub_llm import StubLlama
+
+STAGES = ['search', 'context', 'ttft', 'decode', 'total']
+
+
+def make_news_docs(n_docs, seed=0, n_days=10, duplicates=0.0):
+    """
+    Synthetic news articles shaped like the RAG guide's DOCUMENTS. A fraction
+    ``duplicates`` of them cover the same story as an earlier article of the
+    same day, with a few words changed, like several outlets reporting one event.
+    """
+    rng = random.Random(seed)
+    first_day = datetime.date(2024, 8, 1)
+    documents = []
+    for i in range(n_docs):
+        doc = {
+            '_id': str(i),
+            'date': (first_day + datetime.timedelta(days=rng.randrange(n_days))).isoformat(),
+            'website': 'www.example.com',
+            'Title': f"Headline {i}: {make_paragraph(rng, 40).split('.')[0]}",
+            'Description': make_paragraph(rng, rng.randint(800, 4000)),
+        }
+        if documents and rng.random() < duplicates:
+            original = rng.choice(documents)
+            words = original['Description'].split()
+            for _ in range(len(words) // 20):
+                words[rng.randrange(len(words))] = rng.choice(words)
+            doc.update(date=original['date'], Title=f"Headline {i}: {original['Title'].split(': ', 1)[1]}",
+                       Description=' '.join(words))
+        documents.append(doc)
+    return documents
+
+
+def make_questions(documents, n_questions, seed=0):
+    rng = random.Random(seed)
+    questions = []
+    for _ in range(n_questions):
+        doc = rng.choice(documents)
+        questions.append({'question': f"What happened in {doc['Title'].split(': ', 1)[1].lower()}?",
+                          'filter_string': f"date:{doc['date']}"})
+    return questions
+
+
+def run(mq, llm, args):
+    index_name = args.index_name
+    documents = make_news_docs(args.n_docs, duplicates=args.duplicates)
+    questions = make_questions(documents, args.questions)
+    try:
+        mq.delete_index(index_name)
+    except Exception:
+        pass
+
+    t0 = time.perf_counter()
+    mq.create_index(index_name, model=args.marqo_model)
+    to_index = list(chunk_sources(documents, char_len=args.chunk_chars, overlap=args.chunk_overlap)) \
+        if args.chunked else documents
+    ingest_documents(mq.index(index_name), to_index, batch_size=50, tensor_fields=["Title", "Description"])
+    index_s = time.perf_counter() - t0
+
+    count_tokens = llama_token_counter(llm)
+    prompt_cache = PromptStateCache(llm) if args.prompt_cache else None
+    timings = {stage: [] for stage in STAGES}
+    decode_rates, context_tokens, tokens_saved = [], [], []
+    for q in questions:
+        t_start = time.perf_counter()
+        limit = args.limit * args.mmr_fetch if args.mmr else args.limit
+        results = mq.index(index_name).search(q=q['question'], filter_string=q['filter_string'], limit=limit)
+        t_search = time.perf_counter()
+
+        hits = merge_chunks(results['hits']) if args.chunked else results['hits']
+        if args.mmr:
+            selection = select_mmr(hits, k=args.limit, count_tokens=count_tokens)
+            hits = selection.hits
+            tokens_saved.append(selection.tokens_saved)
+        budget = context_budget(count_tokens, get_context_prompt(q['question'], ''),
+                                n_ctx=args.n_ctx, max_tokens=args.max_tokens)
+        packed = pack_context(hits, count_tokens, budget)
+        prompt = get_context_prompt(q['question'], packed.text)
+        t_context = time.perf_counter()
+
+        if prompt_cache is not None:
+            prompt_cache.prefill(prompt, checkpoints=[question_offset(q['question'], packed.text)])
+        _, stats = stream_first_paragraph(llm, prompt, boundary='\n\n', max_tokens=args.max_tokens, stop=["Q:"])
+        t_end = time.perf_counter()
+
+        # Restoring cached state is part of getting to the first token
+        ttft = (t_end - t_context) - (stats.elapsed - stats.time_to_first_token)
+        timings['search'].append(t_search - t_start)
+        timings['context'].append(t_context - t_search)
+        timings['ttft'].append(ttft)
+        timings['decode'].append(stats.elapsed - stats.time_to_first_token)
+        timings['total'].append(t_end - t_start)
+        decode_rates.append(stats.tokens_per_second)
+        context_tokens.append(packed.n_tokens)
+
+    mq.delete_index(index_name)
+    return {
+        'index_s': index_s, 'documents': len(to_index), 'questions': len(questions),
+        'stages': {stage: {'mean_ms': sum(v) / len(v) * 1e3, 'p50_ms': percentile(v, 50) * 1e3,
+                           'p95_ms': percentile(v, 95) * 1e3} for stage, v in timings.items()},
+        'decode_tokens_per_s': sum(decode_rates) / len(decode_rates),
+        'mean_context_tokens': sum(context_tokens) / len(context_tokens),
+        'mmr_tokens_saved': sum(tokens_saved) / len(tokens_saved) if tokens_saved else None,
+        'prompt_cache': prompt_cache.stats() if prompt_cache is not None else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help="Marqo URL (default: start a mock server)")
+    parser.add_argument('--model', help="path to a GGUF model (default: the stub LLM)")
+    parser.add_argument('--gpu-layers', type=int, default=1, help="with --model: layers offloaded to the GPU")
+    parser.add_argument('--index-name', default='rag-benchmark')
+    parser.add_argument('--marqo-model', default='hf/e5-base-v2')
+    parser.add_argument('--n-docs', type=int, default=200, help="synthetic news articles to index")
+    parser.add_argument('--duplicates', type=float, default=0.0,
+                        help="fraction of articles that are near copies of another article")
+    parser.add_argument('--questions', type=int, default=20)
+    parser.add_argument('--limit', type=int, default=5, help="search results per question")
+    parser.add_argument('--chunked', action='store_true', help="index chunks and merge them at query time")
+    parser.add_argument('--chunk-chars', type=int, default=600)
+    parser.add_argument('--chunk-overlap', type=int, default=150)
+    parser.add_argument('--mmr', action='store_true', help="select diverse hits from an over-fetched result set")
+    parser.add_argument('--mmr-fetch', type=int, default=3, help="with --mmr: fetch this many times --limit hits")
+    parser.add_argument('--prompt-cache', action='store_true', help="use PromptStateCache")
+    parser.add_argument('--n-ctx', type=int, default=4096)
+    parser.add_argument('--max-tokens', type=int, default=512)
+    parser.add_argument('--prefill-latency', type=float, default=0.0001, help="stub seconds per prompt token")
+    parser.add_argument('--decode-latency', type=float, default=0.001, help="stub seconds per generated token")
+    parser.add_argument('--search-latency', type=float, default=0.01, help="mock seconds to embed a query")
+    parser.add_argument('--doc-latency', type=float, default=0.0, help="mock inference seconds per document")
+    parser.add_argument('--json', help="also write the results to this JSON file")
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    if args.model:
+        from llama_cpp import Llama
+        llm = Llama(model_path=args.model, n_ctx=args.n_ctx, n_gpu_layers=args.gpu_layers, verbose=False)
+    else:
+        llm = StubLlama(n_ctx=args.n_ctx, prefill_latency=args.prefill_latency, decode_latency=args.decode_latency)
+    load_s = time.perf_counter() - t0
+
+    if args.url:
+        result = run(Client(args.url), llm, args)
+    else:
+        with mock_marqo_server(search_latency=args.search_latency, doc_latency=args.doc_latency) as url:
+            result = run(Client(url), llm, args)
+    result['load_s'] = load_s
+
+    print(f"load {load_s:.2f}s, index {result['documents']} documents {result['index_s']:.2f}s, "
+          f"{result['questions']} questions, {result['mean_context_tokens']:.0f} context tokens on average")
+    print(f"{'stage':<8} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9}")
+    for stage, s in result['stages'].items():
+        print(f"{stage:<8} {s['mean_ms']:>9.1f} {s['p50_ms']:>9.1f} {s['p95_ms']:>9.1f}")
+    print(f"decode {result['decode_tokens_per_s']:.1f} tokens/s")
+    if result['mmr_tokens_saved'] is not None:
+        print(f"MMR: {result['mmr_tokens_saved']:.0f} tokens of redundant passages left out per question")
+    if result['prompt_cache']:
+        print(f"prompt cache: {result['prompt_cache']}")
+    if args.json:
+        write_json(args.json, result)
+
+
+if __name__ == '__main__':
+    main()
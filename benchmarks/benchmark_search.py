@@ -0,0 +1,156 @@
+"""
+Compares the latency of TENSOR, LEXICAL and HYBRID search.
+
+A query set is replayed against an index through each search method at
+several `limit` values and concurrency levels. For every combination it
+records p50/p95/p99 latency, queries per second and the mean response
+payload size.
+
+By default a mock Marqo server (helpers/mock_marqo.py) is started and seeded
+with synthetic Wikipedia documents; use --url to benchmark a real Marqo.
+
+Usage:
+    python benchmarks/benchmark_search.py
+    python benchmarks/benchmark_search.py --limits 1 10 50 --concurrency 1 8 32 --requests 400
+    python benchmarks/benchmark_search.py --url http://localhost:8882 --index-name text-search-open-source --no-seed
+    python benchmarks/benchmark_search.py --queries my_queries.txt --json search.json
+"""
+
+import argparse
+import itertools
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from marqo import Client
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from helpers.ingestion import ingest_documents
+from helpers.text_processing import iter_chunks, clean_data
+from bench_utils import mock_marqo_server, percentile, write_json
+from synthetic_wiki import iter_wiki_docs
+
+SEARCH_METHODS = ["TENSOR", "LEXICAL", "HYBRID"]
+
+# Queries used across the tutorials, extended with a few Wikipedia-style questions
+DEFAULT_QUERIES = [
+    "what is air made of?",
+    "What is the best outfit to wear on the moon?",
+    "marco polo",
+    "Which movie is about space exploration?",
+    "Who won gold in the women's 100 metre race at the Paris Olympics 2024?",
+    "history of the river city",
+    "music and film of the first world war",
+    "how does the government of a state work",
+    "water science light",
+    "people who travelled to a new country",
+]
+
+
+def load_queries(path):
+    """ Reads one query per line, or JSON lines with a 'q' (or 'question') field. """
+    queries = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith('{'):
+                entry = json.loads(line)
+                line = entry.get('q') or entry.get('question')
+            queries.append(line)
+    return queries
+
+
+def seed_index(mq, index_name, n_docs):
+    try:
+        mq.delete_index(index_name)
+    except Exception:
+        pass
+    mq.create_index(index_name, model='hf/all_datasets_v4_MiniLM-L6')
+    documents = iter_chunks((clean_data(d) for d in iter_wiki_docs(n_docs)), char_len=2000)
+    ingest_documents(mq.index(index_name), documents, batch_size=50, tensor_fields=["title", "content"])
+
+
+def run_cell(index, queries, search_method, limit, concurrency, n_requests):
+    """ Sends n_requests searches with the given concurrency and returns the measurements. """
+
+    def one(q):
+        t0 = time.perf_counter()
+        res = index.search(q, search_method=search_method, limit=limit)
+        return time.perf_counter() - t0, len(json.dumps(res).encode('utf-8')), len(res['hits'])
+
+    stream = itertools.islice(itertools.cycle(queries), n_requests)
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(one, stream))
+    elapsed = time.perf_counter() - t0
+
+    latencies = [r[0] for r in results]
+    return {
+        'search_method': search_method, 'limit': limit, 'concurrency': concurrency,
+        'requests': n_requests, 'qps': n_requests / elapsed,
+        'p50_ms': percentile(latencies, 50) * 1e3, 'p95_ms': percentile(latencies, 95) * 1e3,
+        'p99_ms': percentile(latencies, 99) * 1e3,
+        'mean_payload_kib': sum(r[1] for r in results) / len(results) / 1024,
+        'mean_hits': sum(r[2] for r in results) / len(results),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help="Marqo URL (default: start a mock server)")
+    parser.add_argument('--index-name', default='search-benchmark')
+    parser.add_argument('--no-seed', action='store_true', help="use the existing index as it is")
+    parser.add_argument('--n-docs', type=int, default=500, help="synthetic documents to seed the index with")
+    parser.add_argument('--queries', help="file with one query per line (default: built-in queries)")
+    parser.add_argument('--methods', nargs='+', choices=SEARCH_METHODS, default=SEARCH_METHODS)
+    parser.add_argument('--limits', type=int, nargs='+', default=[1, 10, 50])
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--requests', type=int, default=200, help="searches per combination")
+    parser.add_argument('--warmup', type=int, default=10, help="unmeasured searches per method first")
+    parser.add_argument('--search-latency', type=float, default=0.01,
+                        help="mock seconds to embed a tensor/hybrid query")
+    parser.add_argument('--lexical-latency', type=float, default=0.001, help="mock seconds per lexical search")
+    parser.add_argument('--inference-workers', type=int, default=4, help="mock concurrent query embeddings")
+    parser.add_argument('--json', help="also write the results to this JSON file")
+    args = parser.parse_args()
+
+    queries = load_queries(args.queries) if args.queries else DEFAULT_QUERIES
+
+    def run(url):
+        mq = Client(url)
+        if not args.no_seed:
+            seed_index(mq, args.index_name, args.n_docs)
+        index = mq.index(args.index_name)
+
+        print(f"{'method':<8} {'limit':>5} {'conc':>5} {'qps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+              f"{'payload KiB':>12} {'hits':>5}")
+        results = []
+        for method in args.methods:
+            for q in queries[:args.warmup]:
+                index.search(q, search_method=method)
+            for limit, concurrency in itertools.product(args.limits, args.concurrency):
+                r = run_cell(index, queries, method, limit, concurrency, args.requests)
+                results.append(r)
+                print(f"{method:<8} {limit:>5} {concurrency:>5} {r['qps']:>8.1f} {r['p50_ms']:>8.1f} "
+                      f"{r['p95_ms']:>8.1f} {r['p99_ms']:>8.1f} {r['mean_payload_kib']:>12.1f} "
+                      f"{r['mean_hits']:>5.1f}")
+
+        if not args.no_seed:
+            mq.delete_index(args.index_name)
+        if args.json:
+            write_json(args.json, results)
+
+    if args.url:
+        run(args.url)
+    else:
+        with mock_marqo_server(search_latency=args.search_latency, lexical_latency=args.lexical_latency,
+                               inference_workers=args.inference_workers) as url:
+            run(url)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+"""
+Benchmarks the ingestion steps of the open source tutorials against a local
+mock Marqo server (helpers/mock_marqo.py), so client-side regressions show up
+without running the Marqo docker image.
+
+Flows:
+* text-search:            text_search_open_source.py - streamed, chunked Wikipedia documents
+                          sent by ingest_documents with batches in flight concurrently
+* text-search-sequential: the original text search guide - add_documents(..., client_batch_size=50)
+* image-search:           image_search_open_source.py - image documents with a
+                          multimodal mapping, client_batch_size=1
+* getting-started:        getting_started_open_source.py - two documents per add_documents call
+
+For each flow it reports docs/sec, batch latency percentiles and the client's
+CPU time and peak Python memory allocations. The mock server's simulated
+inference cost is configurable.
+
+Usage:
+    python benchmarks/benchmark_tutorials.py
+    python benchmarks/benchmark_tutorials.py --doc-latency 0.005 --image-latency 0.02 --n-docs 2000
+    python benchmarks/benchmark_tutorials.py --flows text-search image-search --json results.json
+"""
+
+import argparse
+import itertools
+import os
+import sys
+import time
+import tracemalloc
+
+from marqo import Client
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from helpers.ingestion import ingest_documents
+from helpers.text_processing import batched, iter_chunks, clean_data
+from bench_utils import mock_marqo_server, percentile, write_json
+from synthetic_wiki import iter_wiki_docs
+
+# The documents added in image_search_open_source.py
+IMAGE_DOCUMENTS = [
+    {"title": "a woman on her phone taking a photo", "image": "https://raw.githubusercontent.com/marqo-ai/marqo/mainline/examples/ImageSearchGuide/data/image0.jpg"},
+    {"title": "a horse and rider jumping over a fence", "image": "https://raw.githubusercontent.com/marqo-ai/marqo/mainline/examples/ImageSearchGuide/data/image1.jpg"},
+    {"title": "an aeroplane and the moon", "image": "https://raw.githubusercontent.com/marqo-ai/marqo/mainline/examples/ImageSearchGuide/data/image2.jpg"},
+    {"title": "man stood by a traffic light", "image": "https://raw.githubusercontent.com/marqo-ai/marqo/mainline/examples/ImageSearchGuide/data/image3.jpg"},
+]
+
+# The documents added in the first step of getting_started_open_source.py
+GETTING_STARTED_DOCUMENTS = [
+    {
+        "Title": "The Travels of Marco Polo",
+        "Description": "A 13th-century travelogue describing Polo's travels",
+    },
+    {
+        "Title": "Extravehicular Mobility Unit (EMU)",
+        "Description": "The EMU is a spacesuit that provides environmental protection, "
+        "mobility, life support, and communications for astronauts",
+    },
+]
+
+
+def wiki_documents(n_docs):
+    return iter_chunks((clean_data(d) for d in iter_wiki_docs(n_docs)), char_len=5e4)
+
+
+def repeat_documents(documents, n_docs):
+    """ Cycles through documents, giving each copy a unique _id. """
+    for i, doc in enumerate(itertools.islice(itertools.cycle(documents), n_docs)):
+        yield {**doc, '_id': f"doc-{i}"}
+
+
+def sequential(index, documents, batch_size, **kwargs):
+    """ Sends batches one after another, like add_documents(..., client_batch_size=batch_size). """
+    latencies, n_docs = [], 0
+    for batch in batched(documents, batch_size):
+        t0 = time.perf_counter()
+        index.add_documents(batch, **kwargs)
+        latencies.append(time.perf_counter() - t0)
+        n_docs += len(batch)
+    return n_docs, latencies
+
+
+def concurrent(index, documents, batch_size, max_in_flight=4, **kwargs):
+    report = ingest_documents(index, documents, batch_size=batch_size, max_in_flight=max_in_flight, **kwargs)
+    return report.n_docs, report.batch_latencies
+
+
+FLOWS = {
+    'text-search': dict(
+        create={'model': 'hf/all_datasets_v4_MiniLM-L6'},
+        documents=wiki_documents,
+        run=lambda index, docs: concurrent(index, docs, 50, tensor_fields=["title", "content"]),
+    ),
+    'text-search-sequential': dict(
+        create={'model': 'hf/all_datasets_v4_MiniLM-L6'},
+        documents=wiki_documents,
+        run=lambda index, docs: sequential(index, docs, 50, tensor_fields=["title", "content"]),
+    ),
+    'image-search': dict(
+        create={'settings_dict': {"model": "ViT-B/32", "treatUrlsAndPointersAsImages": True}},
+        documents=lambda n: repeat_documents(IMAGE_DOCUMENTS, n),
+        run=lambda index, docs: sequential(
+            index, docs, 1,
+            mappings={"image_title_multimodal": {"type": "multimodal_combination",
+                                                 "weights": {"title": 0.1, "image": 0.9}}},
+            tensor_fields=["image_title_multimodal"],
+        ),
+    ),
+    'getting-started': dict(
+        create={'model': 'hf/e5-base-v2'},
+        documents=lambda n: repeat_documents(GETTING_STARTED_DOCUMENTS, n),
+        run=lambda index, docs: sequential(index, docs, len(GETTING_STARTED_DOCUMENTS),
+                                           tensor_fields=["Description"]),
+    ),
+}
+
+
+def run_flow(mq, name, n_docs):
+    flow = FLOWS[name]
+    index_name = f"benchmark-{name}"
+    try:
+        mq.delete_index(index_name)
+    except Exception:
+        pass
+    mq.create_index(index_name, **flow['create'])
+    index = mq.index(index_name)
+    # Generate the documents up front so only the ingestion itself is measured
+    documents = list(flow['documents'](n_docs))
+
+    tracemalloc.start()
+    cpu0, t0 = time.process_time(), time.perf_counter()
+    n_sent, latencies = flow['run'](index, documents)
+    elapsed, cpu = time.perf_counter() - t0, time.process_time() - cpu0
+    peak_alloc = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    mq.delete_index(index_name)
+    return {
+        'flow': name, 'docs': n_sent, 'batches': len(latencies), 'seconds': elapsed,
+        'docs_per_s': n_sent / elapsed if elapsed else 0.0,
+        'p50_ms': percentile(latencies, 50) * 1e3, 'p95_ms': percentile(latencies, 95) * 1e3,
+        'p99_ms': percentile(latencies, 99) * 1e3,
+        'client_cpu_s': cpu, 'client_cpu_pct': 100 * cpu / elapsed if elapsed else 0.0,
+        'peak_alloc_mib': peak_alloc / 2 ** 20,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--flows', nargs='+', choices=list(FLOWS), default=list(FLOWS))
+    parser.add_argument('--n-docs', type=int, default=500, help="source documents per flow")
+    parser.add_argument('--doc-latency', type=float, default=0.002, help="mock inference seconds per text document")
+    parser.add_argument('--image-latency', type=float, default=0.01, help="mock inference seconds per image")
+    parser.add_argument('--batch-overhead', type=float, default=0.005, help="mock seconds per add_documents call")
+    parser.add_argument('--inference-workers', type=int, default=2, help="mock concurrent inferences")
+    parser.add_argument('--url', help="benchmark an already running Marqo (or mock) instead of starting one")
+    parser.add_argument('--json', help="also write the results to this JSON file")
+    args = parser.parse_args()
+
+    def run(url):
+        mq = Client(url)
+        print(f"{'flow':<24} {'docs':>6} {'docs/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+              f"{'CPU s':>7} {'CPU %':>6} {'peak alloc MiB':>15}")
+        results = []
+        for name in args.flows:
+            r = run_flow(mq, name, args.n_docs)
+            results.append(r)
+            print(f"{r['flow']:<24} {r['docs']:>6} {r['docs_per_s']:>8.1f} {r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f} "
+                  f"{r['p99_ms']:>8.1f} {r['client_cpu_s']:>7.2f} {r['client_cpu_pct']:>6.1f} "
+                  f"{r['peak_alloc_mib']:>15.2f}")
+        if args.json:
+            write_json(args.json, results)
+
+    if args.url:
+        run(args.url)
+    else:
+        with mock_marqo_server(doc_latency=args.doc_latency, image_latency=args.image_latency,
+                               batch_overhead=args.batch_overhead,
+                               inference_workers=args.inference_workers) as url:
+            run(url)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""
+A deterministic stand-in for llama_cpp.Llama, so the RAG pipeline can be
+benchmarked without a GPU or a model download.
+
+It implements the parts of the Llama interface the helpers use: calling the
+model (streamed or not, with max_tokens and stop), tokenize, eval, reset and
+save_state/load_state. Prompt evaluation and decoding sleep for a fixed
+time per token, and the prefix shared with the previous prompt is reused
+like llama_cpp does, so prefill and decode costs behave like a real model's.
+The answer is the first sentence of the first Background source, or a fixed
+sentence for prompts without one.
+"""
+
+import re
+import time
+import zlib
+from array import array
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Union
+
+_PIECE = re.compile(r"\s+|\w+|[^\w\s]")
+BOS = 128000
+
+
+class StubState:
+    """ What StubLlama.save_state returns; sized like an 8B Llama 3 KV cache (128 KiB per token). """
+
+    def __init__(self, input_ids: array, n_tokens: int, bytes_per_token: int):
+        self.input_ids = array('l', input_ids[:n_tokens])
+        self.n_tokens = n_tokens
+        self.llama_state_size = n_tokens * bytes_per_token
+
+
+class StubLlama:
+    """
+    Args:
+        n_ctx (int, optional): The context window. Default is 4096.
+        prefill_latency (float, optional): Seconds to evaluate one prompt token. Default is 0.0001.
+        decode_latency (float, optional): Seconds to generate one token. Default is 0.001.
+        load_latency (float, optional): Seconds the constructor takes, like loading a model. Default is 0.
+        bytes_per_token (int, optional): Reported size of the saved state per token. Default is 128 KiB.
+    """
+
+    def __init__(self, n_ctx: int = 4096, prefill_latency: float = 0.0001, decode_latency: float = 0.001,
+                 load_latency: float = 0.0, bytes_per_token: int = 128 * 1024, **_):
+        time.sleep(load_latency)
+        self.n_ctx = n_ctx
+        self.prefill_latency = prefill_latency
+        self.decode_latency = decode_latency
+        self.bytes_per_token = bytes_per_token
+        self.input_ids = array('l', [0] * n_ctx)
+        self.n_tokens = 0
+        self.tokens_evaluated = 0
+        self._pieces: Dict[int, str] = {}
+
+    def tokenize(self, text: bytes, add_bos: bool = True, special: bool = False) -> List[int]:
+        tokens = [BOS] if add_bos else []
+        for piece in _PIECE.findall(text.decode('utf-8', errors='replace')):
+            token = zlib.crc32(piece.encode('utf-8')) % BOS
+            self._pieces[token] = piece
+            tokens.append(token)
+        return tokens
+
+    def detokenize(self, tokens: Sequence[int]) -> bytes:
+        return ''.join(self._pieces.get(t, '') for t in tokens if t != BOS).encode('utf-8')
+
+    def reset(self) -> None:
+        self.n_tokens = 0
+
+    def eval(self, tokens: Sequence[int]) -> None:
+        if self.n_tokens + len(tokens) > self.n_ctx:
+            raise ValueError(f"Requested tokens ({self.n_tokens + len(tokens)}) exceed context window of {self.n_ctx}")
+        time.sleep(self.prefill_latency * len(tokens))
+        self.input_ids[self.n_tokens:self.n_tokens + len(tokens)] = array('l', tokens)
+        self.n_tokens += len(tokens)
+        self.tokens_evaluated += len(tokens)
+
+    def save_state(self) -> StubState:
+        return StubState(self.input_ids, self.n_tokens, self.bytes_per_token)
+
+    def load_state(self, state: StubState) -> None:
+        self.input_ids[:state.n_tokens] = state.input_ids
+        self.n_tokens = state.n_tokens
+
+    @staticmethod
+    def _answer(prompt: str) -> str:
+        match = re.search(r"Source 0\) [^\n]*?\|\| ([^\n]*?[.!?])(?:\s|$)", prompt)
+        first = match.group(1).strip() if match else "I do not have enough information to answer that question."
+        return f"{first}\n\nThe sources give more detail on this. It is a stub answer of a fixed shape."
+
+    def _generate(self, prompt: str, max_tokens: Optional[int], stop: List[str]) -> Iterator[Dict[str, Any]]:
+        tokens = self.tokenize(prompt.encode('utf-8'), special=True)
+        if max_tokens is None or max_tokens <= 0:
+            max_tokens = self.n_ctx - len(tokens)
+        if len(tokens) + max_tokens > self.n_ctx:
+            raise ValueError(f"Requested tokens ({len(tokens) + max_tokens}) exceed context window of {self.n_ctx}")
+        # Reuse the prefix shared with the previous prompt, evaluating at least one token
+        prefix = 0
+        for a, b in zip(self.input_ids[:self.n_tokens], tokens):
+            if a != b:
+                break
+            prefix += 1
+        self.n_tokens = min(prefix, len(tokens) - 1)
+        self.eval(tokens[self.n_tokens:])
+
+        text = ''
+        answer = self.tokenize(self._answer(prompt).encode('utf-8'), add_bos=False)
+        for token in answer[:max_tokens]:
+            time.sleep(self.decode_latency)
+            piece = self._pieces[token]
+            if any(s in text + piece for s in stop):
+                return
+            text += piece
+            self.input_ids[self.n_tokens] = token
+            self.n_tokens += 1
+            yield {'choices': [{'text': piece, 'index': 0, 'finish_reason': None}]}
+
+    def __call__(self, prompt: str, max_tokens: Optional[int] = 16, stop: Optional[Union[str, List[str]]] = None,
+                 stream: bool = False, **_) -> Any:
+        stop = [stop] if isinstance(stop, str) else list(stop or [])
+        chunks = self._generate(prompt, max_tokens, stop)
+        if stream:
+            return chunks
+        return {'choices': [{'text': ''.join(c['choices'][0]['text'] for c in chunks), 'index': 0,
+                             'finish_reason': 'stop'}]}
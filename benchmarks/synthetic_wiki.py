@@ -0,0 +1,85 @@
+"""
+Generates synthetic documents shaped like the simplewiki.json dataset used in
+the text search starter guide, so the benchmarks can run without downloading it.
+"""
+
+import json
+import random
+from typing import Iterator, List
+
+WORDS = (
+    "the of and in to a is was for on as by with from that at his it an were are which this be "
+    "also has or had first its new after who their they one two have but not all been more other "
+    "city world war river air water made people country state government music film science light"
+).split()
+
+
+def make_paragraph(rng: random.Random, n_chars: int) -> str:
+    """
+    Builds roughly n_chars characters of sentence-like text.
+
+    Args:
+        rng (random.Random): The random generator to draw words from.
+        n_chars (int): The approximate number of characters to generate.
+
+    Returns:
+        str: The generated text.
+    """
+    parts, size = [], 0
+    while size < n_chars:
+        sentence = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(6, 20))).capitalize() + '.'
+        if rng.random() < 0.1:
+            sentence += '\n\n'
+        parts.append(sentence)
+        size += len(sentence) + 1
+    return ' '.join(parts)
+
+
+def iter_wiki_docs(n_docs: int, seed: int = 0, big_fraction: float = 0.05,
+                   big_chars: int = 120_000) -> Iterator[dict]:
+    """
+    Yields synthetic Wikipedia-like documents.
+
+    Most documents are a few thousand characters long; ``big_fraction`` of them
+    are ``big_chars`` long so that the splitting code has work to do.
+
+    Args:
+        n_docs (int): The number of documents to generate.
+        seed (int, optional): The random seed. Default is 0.
+        big_fraction (float, optional): The fraction of oversized documents. Default is 0.05.
+        big_chars (int, optional): The length of oversized documents. Default is 120k.
+
+    Yields:
+        dict: Documents with 'title', 'content', 'docDate' and 'url' fields.
+    """
+    rng = random.Random(seed)
+    for i in range(n_docs):
+        n_chars = big_chars if rng.random() < big_fraction else rng.randint(500, 8000)
+        yield {
+            'title': f"Article {i} - Wikipedia",
+            'content': make_paragraph(rng, n_chars),
+            'docDate': 20240000 + i % 1000,
+            'url': f"https://simple.wikipedia.org/wiki/Article_{i}",
+        }
+
+
+def make_wiki_docs(n_docs: int, **kwargs) -> List[dict]:
+    """ Returns a list of synthetic documents, see iter_wiki_docs. """
+    return list(iter_wiki_docs(n_docs, **kwargs))
+
+
+def write_wiki_json(filename: str, n_docs: int, **kwargs) -> None:
+    """
+    Writes synthetic documents to a JSON array file without holding them all in memory.
+
+    Args:
+        filename (str): Where to write the file.
+        n_docs (int): The number of documents to generate.
+    """
+    with open(filename, 'w', encoding='utf-8') as f:
+        f.write('[')
+        for i, doc in enumerate(iter_wiki_docs(n_docs, **kwargs)):
+            if i:
+                f.write(',\n')
+            json.dump(doc, f)
+        f.write(']')
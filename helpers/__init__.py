@@ -0,0 +1,6 @@
+"""
+Reusable helper modules for the Marqo tutorials.
+
+The tutorial scripts add the repository root to ``sys.path`` and import
+from here, e.g. ``from helpers.text_processing import stream_documents``.
+"""
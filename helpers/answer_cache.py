@@ -0,0 +1,154 @@
+import math
+import operator
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+def _normalise(vector: List[float]) -> List[float]:
+    norm = math.sqrt(sum(v * v for v in vector))
+    return [v / norm for v in vector] if norm else list(vector)
+
+
+def _question_key(question: str) -> str:
+    return ' '.join(question.lower().split())
+
+
+class SemanticAnswerCache:
+    """
+    Caches generated RAG answers and serves them for questions that mean the
+    same thing as a cached question.
+
+    Questions are embedded through Marqo (``index.embed``), with the
+    index's own model. A question whose embedding has a cosine similarity of
+    at least ``threshold`` with a cached question asked under the same
+    filter_string gets that question's answer, skipping the search and the
+    generation. Identical questions (ignoring case and whitespace) are
+    answered without the embedding round trip.
+
+        cache = SemanticAnswerCache(mq.index(index_name), threshold=0.92)
+        answer = cache.get_or_generate(question, lambda: rag_answer(question), filter_string=f"date:{date}")
+        print(cache.stats())
+
+    The right threshold depends on the model: too low and different
+    questions share an answer, too high and rephrasings miss. Lookups
+    compare against every cached question with the same filter, so keep
+    max_entries in the low thousands.
+
+    Args:
+        index: The Marqo index used to embed questions, e.g. ``mq.index(index_name)``.
+        threshold (float, optional): Minimum cosine similarity for a hit. Default is 0.92.
+        max_entries (int, optional): Maximum number of cached answers, least recently used are evicted. Default is 1024.
+        ttl (float, optional): Seconds an answer stays valid, None for no expiry. Default is None.
+    """
+
+    def __init__(self, index, threshold: float = 0.92, max_entries: int = 1024, ttl: Optional[float] = None):
+        if max_entries < 1:
+            raise ValueError("max_entries must be at least 1")
+        self.index = index
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.exact_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Seconds the cached answers took to produce, summed over the hits
+        self.seconds_saved = 0.0
+        # (filter_string, question key) -> (expires, embedding, answer, seconds to produce)
+        self._entries: "OrderedDict[Tuple[Optional[str], str], Tuple[float, List[float], Any, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def embed(self, question: str) -> List[float]:
+        """ The normalised Marqo embedding of a question. """
+        return _normalise(self.index.embed(question)['embeddings'][0])
+
+    def _expired(self, entry) -> bool:
+        return self.ttl is not None and time.monotonic() >= entry[0]
+
+    def _hit(self, key, entry) -> Any:
+        self._entries.move_to_end(key)
+        self.hits += 1
+        self.seconds_saved += entry[3]
+        return entry[2]
+
+    def lookup(self, question: str, filter_string: Optional[str] = None) -> Tuple[Optional[Any], Optional[List[float]]]:
+        """
+        Finds a cached answer for the question.
+
+        Returns:
+            The cached answer, or None, and the question's embedding if it had to be computed.
+        """
+        key = (filter_string, _question_key(question))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and not self._expired(entry):
+                self.exact_hits += 1
+                return self._hit(key, entry), None
+
+        embedding = self.embed(question)
+        with self._lock:
+            best_key, best_similarity = None, self.threshold
+            for k, entry in list(self._entries.items()):
+                if k[0] != filter_string:
+                    continue
+                if self._expired(entry):
+                    del self._entries[k]
+                    continue
+                similarity = sum(map(operator.mul, embedding, entry[1]))
+                if similarity >= best_similarity:
+                    best_key, best_similarity = k, similarity
+            if best_key is not None:
+                return self._hit(best_key, self._entries[best_key]), embedding
+            self.misses += 1
+            return None, embedding
+
+    def put(self, question: str, answer: Any, filter_string: Optional[str] = None,
+            embedding: Optional[List[float]] = None, seconds: float = 0.0) -> None:
+        """
+        Caches an answer.
+
+        Args:
+            question (str): The question answered.
+            answer: The answer.
+            filter_string (str, optional): The filter_string the answer's search used.
+            embedding (list, optional): The question's embedding from lookup, computed if not given.
+            seconds (float, optional): The time it took to produce the answer, for the stats.
+        """
+        if embedding is None:
+            embedding = self.embed(question)
+        key = (filter_string, _question_key(question))
+        with self._lock:
+            expires = time.monotonic() + self.ttl if self.ttl is not None else 0.0
+            self._entries[key] = (expires, embedding, answer, seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_generate(self, question: str, generate: Callable[[], Any],
+                        filter_string: Optional[str] = None) -> Any:
+        """ The cached answer to the question, or the result of generate(), which is then cached. """
+        answer, embedding = self.lookup(question, filter_string)
+        if answer is not None:
+            return answer
+        t0 = time.perf_counter()
+        answer = generate()
+        self.put(question, answer, filter_string, embedding, seconds=time.perf_counter() - t0)
+        return answer
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """ Hit/miss counters, the generation time saved and current size. """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits, 'exact_hits': self.exact_hits, 'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'seconds_saved': self.seconds_saved,
+                'entries': len(self._entries), 'evictions': self.evictions,
+            }
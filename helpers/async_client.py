@@ -0,0 +1,214 @@
+"""
+An asyncio-native Marqo client covering the operations used in the tutorials.
+
+It mirrors the blocking ``marqo.Client`` API with coroutines and sends every
+request through one pooled aiohttp session, so many searches or batches can
+be in flight from a single event loop without a thread per request:
+
+    async with AsyncClient("http://localhost:8882", max_concurrency=64) as mq:
+        await mq.create_index("my-first-index", model="hf/e5-base-v2")
+        await mq.index("my-first-index").add_documents(documents, tensor_fields=["Description"])
+        results = await asyncio.gather(*(mq.index("my-first-index").search(q) for q in queries))
+
+Requires ``pip install aiohttp``.
+"""
+
+import asyncio
+import json
+from typing import Any, Dict, List, Optional
+
+from marqo import Client
+from marqo.errors import MarqoWebError, BackendCommunicationError, BackendTimeoutError
+from marqo.models.create_index_settings import IndexSettings
+
+try:
+    import aiohttp
+except ImportError:  # pragma: no cover - optional dependency
+    aiohttp = None
+
+# Search arguments of marqo.Index.search and the request body fields they map to
+SEARCH_FIELDS = {
+    'searchable_attributes': 'searchableAttributes', 'limit': 'limit', 'offset': 'offset',
+    'search_method': 'searchMethod', 'show_highlights': 'showHighlights', 'reranker': 'reRanker',
+    'filter_string': 'filter', 'attributes_to_retrieve': 'attributesToRetrieve', 'boost': 'boost',
+    'image_download_headers': 'image_download_headers', 'media_download_headers': 'mediaDownloadHeaders',
+    'context': 'context', 'score_modifiers': 'scoreModifiers', 'model_auth': 'modelAuth',
+    'ef_search': 'efSearch', 'approximate': 'approximate', 'text_query_prefix': 'textQueryPrefix',
+    'hybrid_parameters': 'hybridParameters', 'rerank_depth': 'rerankDepth', 'facets': 'facets',
+    'track_total_hits': 'trackTotalHits', 'approximate_threshold': 'approximateThreshold',
+    'language': 'language', 'sort_by': 'sortBy', 'relevance_cutoff': 'relevanceCutoff',
+    'interpolation_method': 'interpolationMethod', 'collapse_fields': 'collapseFields',
+}
+
+# add_documents arguments and the request body fields they map to
+ADD_DOCUMENTS_FIELDS = {
+    'tensor_fields': 'tensorFields', 'use_existing_tensors': 'useExistingTensors', 'mappings': 'mappings',
+    'model_auth': 'modelAuth', 'image_download_headers': 'imageDownloadHeaders',
+    'media_download_headers': 'mediaDownloadHeaders', 'text_chunk_prefix': 'textChunkPrefix',
+}
+
+
+def _camel(name: str) -> str:
+    first, *rest = name.split('_')
+    return first + ''.join(part.capitalize() for part in rest)
+
+
+def _body(kwargs: Dict[str, Any], fields: Dict[str, str]) -> Dict[str, Any]:
+    unknown = set(kwargs) - set(fields)
+    if unknown:
+        raise TypeError(f"unexpected arguments: {sorted(unknown)}")
+    return {fields[k]: v for k, v in kwargs.items() if v is not None}
+
+
+class AsyncClient:
+    """
+    An asyncio Marqo client.
+
+    Args:
+        url (str, optional): The Marqo URL. Default is 'http://localhost:8882'.
+        api_key (str, optional): Marqo Cloud API key.
+        max_concurrency (int, optional): Maximum number of requests in flight. Default is 64.
+        timeout (float, optional): Seconds before a request times out, None for no timeout. Default is None.
+    """
+
+    def __init__(self, url: str = "http://localhost:8882", api_key: Optional[str] = None,
+                 max_concurrency: int = 64, timeout: Optional[float] = None):
+        if aiohttp is None:
+            raise ImportError("AsyncClient requires aiohttp, install it with `pip install aiohttp`")
+        # The blocking client resolves which URL serves an index (this differs per index on Marqo Cloud)
+        self._sync = Client(url, api_key=api_key)
+        self._mapping = self._sync.config.instance_mapping
+        self._headers = {'x-api-key': api_key} if api_key else {}
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._max_concurrency = max_concurrency
+        self._timeout = timeout
+        self._session = None
+        self._base_urls: Dict[str, str] = {}
+
+    async def __aenter__(self) -> 'AsyncClient':
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def _get_session(self):
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self._max_concurrency),
+                timeout=aiohttp.ClientTimeout(total=self._timeout),
+                headers={'Content-Type': 'application/json', **self._headers},
+                json_serialize=json.dumps,
+            )
+        return self._session
+
+    async def _base_url(self, index_name: str = '') -> str:
+        if index_name not in self._base_urls:
+            loop = asyncio.get_running_loop()
+            if index_name:
+                url = await loop.run_in_executor(None, self._mapping.get_index_base_url, index_name)
+            else:
+                url = self._mapping.get_control_base_url()
+            self._base_urls[index_name] = url
+        return self._base_urls[index_name]
+
+    async def request(self, method: str, path: str, body: Any = None, index_name: str = '') -> Any:
+        """
+        Sends a request to Marqo and returns the decoded JSON response.
+
+        Raises:
+            MarqoWebError: For error responses, like the blocking client.
+        """
+        url = f"{await self._base_url(index_name)}/{path}"
+        data = json.dumps(body) if body is not None else None
+        async with self._semaphore:
+            try:
+                async with self._get_session().request(method, url, data=data) as response:
+                    text = await response.text()
+                    status = response.status
+            except asyncio.TimeoutError as e:
+                raise BackendTimeoutError(str(e)) from e
+            except aiohttp.ClientConnectionError as e:
+                raise BackendCommunicationError(str(e)) from e
+        try:
+            content = json.loads(text) if text else None
+        except json.JSONDecodeError:
+            content = text
+        if status >= 400:
+            if isinstance(content, dict):
+                raise MarqoWebError(message=content, code=content.get('code'), error_type=content.get('type'),
+                                    status_code=status)
+            raise MarqoWebError(message=text, code='unhandled_error', error_type='unhandled_error_type',
+                                status_code=status)
+        return content
+
+    async def create_index(self, index_name: str, settings_dict: Optional[dict] = None, **settings) -> Dict[str, Any]:
+        """
+        Creates an index. Takes the same settings as ``marqo.Client.create_index``,
+        e.g. ``model='hf/e5-base-v2'`` or ``settings_dict={...}``.
+        """
+        index_settings = IndexSettings(settingsDict=settings_dict,
+                                       **{_camel(k): v for k, v in settings.items()})
+        return await self.request('POST', f"indexes/{index_name}", index_settings.generate_request_body())
+
+    async def delete_index(self, index_name: str) -> Dict[str, Any]:
+        return await self.index(index_name).delete()
+
+    async def get_indexes(self) -> Dict[str, List[Dict[str, str]]]:
+        response = await self.request('GET', 'indexes')
+        return {"results": [{"indexName": i["indexName"]} for i in response["results"]]}
+
+    def index(self, index_name: str) -> 'AsyncIndex':
+        return AsyncIndex(self, index_name)
+
+
+class AsyncIndex:
+    """ The asyncio counterpart of ``marqo.Index``, created with ``AsyncClient.index``. """
+
+    def __init__(self, client: AsyncClient, index_name: str):
+        self.client = client
+        self.index_name = index_name
+
+    async def _request(self, method: str, path: str, body: Any = None) -> Any:
+        return await self.client.request(method, path, body, index_name=self.index_name)
+
+    async def add_documents(self, documents: List[Dict[str, Any]], client_batch_size: Optional[int] = None,
+                            **kwargs) -> Any:
+        """
+        Adds documents. With client_batch_size the batches are sent concurrently
+        (up to the client's max_concurrency) and a list of responses is returned.
+        """
+        body = _body(kwargs, ADD_DOCUMENTS_FIELDS)
+        path = f"indexes/{self.index_name}/documents"
+        if client_batch_size is None:
+            return await self._request('POST', path, {"documents": documents, **body})
+        if client_batch_size <= 0:
+            raise ValueError("client_batch_size must be at least 1")
+        batches = [documents[i:i + client_batch_size] for i in range(0, len(documents), client_batch_size)]
+        return list(await asyncio.gather(
+            *(self._request('POST', path, {"documents": batch, **body}) for batch in batches)))
+
+    async def search(self, q: Optional[Any] = None, **kwargs) -> Dict[str, Any]:
+        """ Searches the index, takes the same arguments as ``marqo.Index.search``. """
+        kwargs.setdefault('search_method', 'TENSOR')
+        return await self._request('POST', f"indexes/{self.index_name}/search",
+                                   {"q": q, **_body(kwargs, SEARCH_FIELDS)})
+
+    async def get_document(self, document_id: str, expose_facets: Optional[bool] = None) -> Dict[str, Any]:
+        path = f"indexes/{self.index_name}/documents/{document_id}"
+        if expose_facets is not None:
+            path += f"?expose_facets={expose_facets}"
+        return await self._request('GET', path)
+
+    async def get_stats(self) -> Dict[str, Any]:
+        return await self._request('GET', f"indexes/{self.index_name}/stats")
+
+    async def delete_documents(self, ids: List[str]) -> Dict[str, Any]:
+        return await self._request('POST', f"indexes/{self.index_name}/documents/delete-batch", ids)
+
+    async def delete(self) -> Dict[str, Any]:
+        return await self._request('DELETE', f"indexes/{self.index_name}")
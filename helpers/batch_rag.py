@@ -0,0 +1,311 @@
+"""
+Answers a file of questions with RAG: Marqo retrieval runs concurrently,
+ahead of the single llama_cpp generator, through a bounded prefetch queue.
+
+Questions are read from JSON lines, one object per line with a
+``question`` and optionally an ``id`` and a ``filter_string``:
+
+    {"id": "q1", "question": "Who won the women's 100m at Paris 2024?", "filter_string": "date:2024-08-03"}
+
+Each answer is appended to the output file as soon as it is generated, so a
+crash loses nothing; running again skips the questions already answered.
+
+Usage:
+    python helpers/batch_rag.py --questions questions.jsonl --output answers.jsonl \
+        --model starter-guides/rag/models/Meta-Llama-3.1-8B-Instruct-Q4_K_M.gguf --index-name news-index-open-source
+"""
+
+import argparse
+import json
+import logging
+import math
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set
+
+if __name__ == '__main__':
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from helpers.llm import stream_first_paragraph, PromptStateCache, BackgroundLoader, StartupTimeline
+from helpers.rag_context import get_context_prompt, llama_token_counter, context_budget, pack_context, question_offset
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class BatchRAGReport:
+    """ Summary of a run_batch_rag run. """
+    n_answered: int = 0
+    n_failed: int = 0
+    # Questions left out because the output file already has their answer
+    n_skipped: int = 0
+    elapsed: float = 0.0
+    retrieval_latencies: List[float] = field(default_factory=list)
+    generation_latencies: List[float] = field(default_factory=list)
+
+    @property
+    def questions_per_second(self) -> float:
+        return self.n_answered / self.elapsed if self.elapsed else 0.0
+
+    def summary(self) -> str:
+        def p(values, q):
+            values = sorted(values)
+            return values[min(len(values) - 1, int(q / 100 * len(values)))] if values else 0.0
+
+        r, g = self.retrieval_latencies, self.generation_latencies
+        return (f"answered {self.n_answered} questions ({self.n_skipped} already answered skipped, "
+                f"{self.n_failed} failed) in {self.elapsed:.2f}s ({self.questions_per_second:.2f} questions/s); "
+                f"retrieval p50 {p(r, 50):.3f}s p95 {p(r, 95):.3f}s, generation p50 {p(g, 50):.3f}s p95 {p(g, 95):.3f}s")
+
+
+def iter_questions(path: str) -> Iterator[Dict[str, Any]]:
+    """
+    Reads questions from a JSON lines file.
+
+    Yields:
+        dict: Each line's object, with 'id' defaulting to the line number.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        for n, line in enumerate(f):
+            line = line.strip()
+            if line:
+                entry = json.loads(line)
+                entry.setdefault('id', n)
+                yield entry
+
+
+def answered_ids(path: str) -> Set[Any]:
+    """
+    The ids of the questions an output file already has answers for.
+
+    A torn last line, from a crash mid-write, is cut off so that appending
+    continues on a fresh line. Failed questions are not counted, so they are retried.
+    """
+    ids = set()
+    if not os.path.exists(path):
+        return ids
+    good = 0
+    with open(path, 'rb') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                break
+            if not line.endswith(b'\n'):
+                break
+            good += len(line)
+            if 'error' not in entry:
+                ids.add(entry['id'])
+    if good != os.path.getsize(path):
+        with open(path, 'r+b') as f:
+            f.truncate(good)
+    return ids
+
+
+def marqo_searcher(index, limit: int = 5, **search_kwargs) -> Callable[[Dict[str, Any]], Dict[str, Any]]:
+    """ A search function for run_batch_rag, searching index with each question and its filter_string. """
+    def search(question: Dict[str, Any]) -> Dict[str, Any]:
+        return index.search(q=question['question'], filter_string=question.get('filter_string'),
+                            limit=limit, **search_kwargs)
+    return search
+
+
+class RAGGenerator:
+    """
+    A generate function for run_batch_rag: packs the hits into the token
+    budget and streams the first paragraph of the answer, like the RAG guide.
+
+    Args:
+        llm: A llama_cpp.Llama model, or a BackgroundLoader of one, waited for at the first question.
+        n_ctx (int, optional): The model's context window. Default is 4096.
+        max_tokens (int, optional): Maximum tokens of an answer. Default is 512.
+        prompt_cache (bool, optional): Reuse the evaluated Background of earlier prompts. Default is True.
+        title_field (str, optional): The hit field used as source title. Default is 'Title'.
+        text_field (str, optional): The hit field used as source passage. Default is 'Description'.
+    """
+
+    def __init__(self, llm, n_ctx: int = 4096, max_tokens: int = 512, prompt_cache: bool = True,
+                 title_field: str = 'Title', text_field: str = 'Description'):
+        self._llm = llm
+        self.llm = None
+        self.n_ctx = n_ctx
+        self.max_tokens = max_tokens
+        self.use_prompt_cache = prompt_cache
+        self.prompt_cache = None
+        self.title_field = title_field
+        self.text_field = text_field
+
+    def load(self):
+        """ The model, waiting for it first if it is still loading; run_batch_rag calls this before timing. """
+        if self.llm is None:
+            self.llm = self._llm.result() if isinstance(self._llm, BackgroundLoader) else self._llm
+            self.count_tokens = llama_token_counter(self.llm)
+            if self.use_prompt_cache:
+                self.prompt_cache = PromptStateCache(self.llm)
+        return self.llm
+
+    def __call__(self, question: Dict[str, Any], results: Dict[str, Any]) -> Dict[str, Any]:
+        llm = self.load()
+        budget = context_budget(self.count_tokens, get_context_prompt(question['question'], ''),
+                                n_ctx=self.n_ctx, max_tokens=self.max_tokens)
+        packed = pack_context(results['hits'], self.count_tokens, budget,
+                              title_field=self.title_field, text_field=self.text_field)
+        prompt = get_context_prompt(question['question'], packed.text)
+        if self.prompt_cache is not None:
+            self.prompt_cache.prefill(prompt, checkpoints=[question_offset(question['question'], packed.text)])
+        answer, stats = stream_first_paragraph(llm, prompt, boundary='\n\n', max_tokens=self.max_tokens,
+                                               stop=["Q:"])
+        return {'answer': answer, 'sources': [s['_id'] for s in packed.sources],
+                'context_tokens': packed.n_tokens, 'time_to_first_token': stats.time_to_first_token,
+                'tokens': stats.n_tokens}
+
+
+def run_batch_rag(questions: Iterable[Dict[str, Any]], search: Callable[[Dict[str, Any]], Dict[str, Any]],
+                  generate: Callable[[Dict[str, Any], Dict[str, Any]], Dict[str, Any]], output_path: str,
+                  max_searches_in_flight: int = 8, prefetch: int = 16,
+                  on_answer: Optional[Callable[[Dict[str, Any]], None]] = None,
+                  timeline: Optional[StartupTimeline] = None) -> BatchRAGReport:
+    """
+    Answers questions, searching ahead of the generator and appending each answer to output_path.
+
+    Up to ``prefetch`` questions are retrieved ahead of the one being
+    generated, by ``max_searches_in_flight`` threads, so generation never
+    waits for Marqo once the queue is full, and memory stays bounded however
+    many questions there are. Answers are written in question order, one JSON
+    line each, flushed and fsynced immediately. Questions already answered in
+    output_path are skipped; questions whose search or generation failed are
+    written with an 'error' and retried by the next run.
+
+    Args:
+        questions (iterable of dict): Questions with 'id', 'question' and optionally 'filter_string'.
+        search (callable): Takes a question and returns its search results, e.g. marqo_searcher(index).
+        generate (callable): Takes a question and its search results and returns a dict with the 'answer',
+            e.g. RAGGenerator(LLM). Called on this thread only. If it has a load() method, as RAGGenerator
+            does, that is called first, so waiting for a model still loading is not timed as generation.
+        output_path (str): The JSON lines file the answers are appended to.
+        max_searches_in_flight (int, optional): Concurrent searches. Default is 8.
+        prefetch (int, optional): Questions retrieved ahead of the generator. Default is 16.
+        on_answer (callable, optional): Called with each written record.
+        timeline (StartupTimeline, optional): Records the search phase, from the first search to the last,
+            and the generation phase, from the first generation to the last, as two spans.
+
+    Returns:
+        BatchRAGReport: Throughput and per-question retrieval and generation latencies.
+    """
+    if prefetch < 1 or max_searches_in_flight < 1:
+        raise ValueError("prefetch and max_searches_in_flight must be at least 1")
+    report = BatchRAGReport()
+    done = answered_ids(output_path)
+
+    def todo():
+        for question in questions:
+            if question['id'] in done:
+                report.n_skipped += 1
+            else:
+                yield question
+
+    def timed_search(question):
+        t0 = time.perf_counter()
+        results = search(question)
+        return results, t0, time.perf_counter()
+
+    # (start, end) of the search and generation phases
+    phases = {'search': [math.inf, -math.inf], 'generate': [math.inf, -math.inf]}
+
+    def record_phase(name, start, end):
+        bounds = phases[name]
+        bounds[0], bounds[1] = min(bounds[0], start), max(bounds[1], end)
+
+    pending = deque()
+    remaining = todo()
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_searches_in_flight) as executor, \
+            open(output_path, 'a', encoding='utf-8') as out:
+
+        def fill():
+            while len(pending) < prefetch:
+                question = next(remaining, None)
+                if question is None:
+                    return
+                pending.append((question, executor.submit(timed_search, question)))
+
+        fill()
+        while pending:
+            question, future = pending.popleft()
+            fill()
+            record = {'id': question['id'], 'question': question['question'],
+                      'filter_string': question.get('filter_string')}
+            try:
+                results, s0, s1 = future.result()
+                retrieval = s1 - s0
+                record_phase('search', s0, s1)
+                record['retrieval_s'] = retrieval
+                if hasattr(generate, 'load'):
+                    generate.load()
+                t1 = time.perf_counter()
+                record.update(generate(question, results))
+                record['generation_s'] = time.perf_counter() - t1
+                record_phase('generate', t1, t1 + record['generation_s'])
+                report.retrieval_latencies.append(retrieval)
+                report.generation_latencies.append(record['generation_s'])
+                report.n_answered += 1
+            except Exception as e:
+                logger.warning(f"question {question['id']} failed: {e}")
+                record['error'] = str(e)
+                report.n_failed += 1
+            out.write(json.dumps(record) + '\n')
+            out.flush()
+            os.fsync(out.fileno())
+            if on_answer is not None:
+                on_answer(record)
+            report.elapsed = time.perf_counter() - t0
+
+    report.elapsed = time.perf_counter() - t0
+    if timeline is not None:
+        for name, (start, end) in phases.items():
+            if start <= end:
+                timeline.add(name, start, end)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--questions', required=True, help="JSON lines file of questions")
+    parser.add_argument('--output', required=True, help="JSON lines file the answers are appended to")
+    parser.add_argument('--model', required=True, help="path to a GGUF model")
+    parser.add_argument('--url', default='http://localhost:8882', help="Marqo URL")
+    parser.add_argument('--api-key', help="Marqo Cloud API key")
+    parser.add_argument('--index-name', default='news-index-open-source')
+    parser.add_argument('--limit', type=int, default=5, help="search results per question")
+    parser.add_argument('--searches-in-flight', type=int, default=8)
+    parser.add_argument('--prefetch', type=int, default=16, help="questions retrieved ahead of generation")
+    parser.add_argument('--n-ctx', type=int, default=4096)
+    parser.add_argument('--max-tokens', type=int, default=512)
+    parser.add_argument('--gpu-layers', type=int, default=1)
+    args = parser.parse_args()
+
+    from llama_cpp import Llama
+    from marqo import Client
+
+    # Searches start filling the prefetch queue while the model loads; the timeline shows the overlap
+    timeline = StartupTimeline()
+    loader = BackgroundLoader(lambda: Llama(model_path=args.model, n_ctx=args.n_ctx,
+                                            n_gpu_layers=args.gpu_layers, verbose=False),
+                              timeline=timeline, name='load LLM')
+    mq = Client(args.url, api_key=args.api_key)
+    report = run_batch_rag(
+        iter_questions(args.questions), marqo_searcher(mq.index(args.index_name), limit=args.limit),
+        RAGGenerator(loader, n_ctx=args.n_ctx, max_tokens=args.max_tokens), args.output,
+        max_searches_in_flight=args.searches_in_flight, prefetch=args.prefetch,
+        on_answer=lambda r: print(f"{r['id']}: {r.get('answer', r.get('error'))}"),
+        timeline=timeline,
+    )
+    print(report.summary())
+    print(timeline.summary())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""
+Serves a local directory over HTTP, so files on disk can be used as Marqo
+image pointers:
+
+    with FileServer('/data/images', host='0.0.0.0', public_host='host.docker.internal') as server:
+        doc = {'image': server.url_for('/data/images/cats/001.jpg')}
+
+Marqo downloads image pointers itself, so the URLs must be reachable from
+the Marqo server. By default the server only listens on 127.0.0.1, which is
+enough when Marqo runs directly on this machine. A docker container cannot
+reach that interface: for Marqo running in docker on the same machine opt in
+with ``host='0.0.0.0'`` and ``public_host='host.docker.internal'`` (add
+``--add-host=host.docker.internal:host-gateway`` to ``docker run`` on
+Linux), or use the machine's address on the network otherwise. Anything that
+can reach the port can then read every file under the directory.
+
+Run it on its own with ``python helpers/file_server.py /data/images --port 8000``,
+adding ``--host 0.0.0.0 --public-host host.docker.internal`` for docker.
+"""
+
+import argparse
+import functools
+import os
+import posixpath
+import sys
+import threading
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import quote
+
+
+class _Handler(SimpleHTTPRequestHandler):
+    # HTTP/1.1, so Marqo can keep connections alive across images
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # Marqo downloads the images of a batch in parallel
+    request_queue_size = 1024
+
+    def handle_error(self, request, client_address):
+        # Clients hanging up mid-download are expected
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class FileServer:
+    """
+    A static file server for a directory, running on a background thread.
+
+    Args:
+        directory (str): The directory to serve.
+        host (str, optional): Interface to listen on. Default is '127.0.0.1', this machine only;
+            use '0.0.0.0' for Marqo in docker or on another machine.
+        port (int, optional): Port to listen on, 0 picks a free one. Default is 0.
+        public_host (str, optional): The host name put in URLs. Default is '127.0.0.1'.
+    """
+
+    def __init__(self, directory: str, host: str = '127.0.0.1', port: int = 0, public_host: Optional[str] = None):
+        self.directory = os.path.abspath(directory)
+        handler = functools.partial(_Handler, directory=self.directory)
+        self.server = _Server((host, port), handler)
+        self.public_host = public_host or '127.0.0.1'
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.public_host}:{self.server.server_address[1]}/"
+
+    def url_for(self, path: str) -> str:
+        """ The URL of a file inside the served directory. """
+        relative = os.path.relpath(os.path.abspath(path), self.directory)
+        if relative.startswith('..'):
+            raise ValueError(f"{path} is outside {self.directory}")
+        return self.url + quote(posixpath.join(*relative.split(os.sep)))
+
+    def start(self) -> 'FileServer':
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self) -> 'FileServer':
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a directory of images for Marqo to download.")
+    parser.add_argument('directory')
+    parser.add_argument('--host', default='127.0.0.1',
+                        help="interface to listen on, 0.0.0.0 for Marqo in docker or on another machine")
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--public-host', default=None, help="host name in the URLs, e.g. host.docker.internal")
+    args = parser.parse_args()
+    server = FileServer(args.directory, host=args.host, port=args.port, public_host=args.public_host)
+    print(f"serving {server.directory} at {server.url}", flush=True)
+    try:
+        server.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,295 @@
+"""
+An on-disk cache of the images behind search results, so showing the same
+hits again reads them from local disk instead of downloading them again:
+
+    cache = ImageCache('.image_cache', max_bytes=512 * 2**20)
+    img = cache.open_image(top_result['image'])          # downloaded once
+    thumb = cache.thumbnail(top_result['image'], (256, 256))
+
+Images are stored content-addressed, under the SHA-256 of their bytes, so
+URLs serving the same image share one file. Entries younger than max_age
+are served without a request; older ones are revalidated with
+If-None-Match/If-Modified-Since, and a 304 keeps the stored file. When the
+cache grows past max_bytes the least recently used images, and their
+thumbnails, are deleted; images being read by get, open_image or thumbnail
+on another thread are kept until they have been read.
+
+open_image and thumbnail require Pillow (``pip install pillow``).
+"""
+
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+import requests
+
+try:
+    from PIL import Image
+except ImportError:  # pragma: no cover - optional dependency
+    Image = None
+
+
+class ImageCache:
+    """
+    Args:
+        directory (str): Where images, thumbnails and the index are stored; created if missing.
+        max_bytes (int, optional): Size cap of the stored images and thumbnails. Default is 512 MiB.
+        max_age (float, optional): Seconds an entry is used without revalidation, 0 to always
+            revalidate, None to never revalidate. Default is 3600.
+        timeout (float, optional): Seconds to wait for an image host. Default is 10.
+        session (requests.Session, optional): The session to download with, for pooled connections.
+    """
+
+    INDEX = 'index.json'
+
+    def __init__(self, directory: str, max_bytes: int = 512 * 2**20, max_age: Optional[float] = 3600.0,
+                 timeout: float = 10.0, session: Optional[requests.Session] = None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.timeout = timeout
+        self.session = session or requests.Session()
+        self.hits = 0
+        self.revalidated = 0
+        self.downloads = 0
+        self.bytes_downloaded = 0
+        self.evictions = 0
+        os.makedirs(os.path.join(directory, 'blobs'), exist_ok=True)
+        os.makedirs(os.path.join(directory, 'thumbs'), exist_ok=True)
+        # url -> {'sha256', 'size', 'etag', 'last_modified', 'content_type', 'checked', 'used'}
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        # sha256 -> {thumbnail name: size}
+        self._thumbs: Dict[str, Dict[str, int]] = {}
+        # sha256 -> readers of the image, which _evict leaves alone
+        self._pins: Dict[str, int] = {}
+        # Set when _evict had to skip pinned images, so the cache is still over max_bytes
+        self._evict_pending = False
+        self._lock = threading.RLock()
+        self._load()
+
+    def _load(self):
+        path = os.path.join(self.directory, self.INDEX)
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                self._entries, self._thumbs = data['entries'], data['thumbs']
+            except (ValueError, KeyError):
+                # A damaged index; the files are re-downloaded as needed
+                self._entries, self._thumbs = {}, {}
+        # Drop entries whose file has gone, e.g. deleted by hand, and the thumbnails of images no longer cached
+        self._entries = {url: e for url, e in self._entries.items() if os.path.exists(self._blob_path(e['sha256']))}
+        cached = {e['sha256'] for e in self._entries.values()}
+        for sha256 in [sha256 for sha256 in self._thumbs if sha256 not in cached]:
+            for name in self._thumbs.pop(sha256):
+                self._remove(self._thumb_path(name))
+
+    def flush(self) -> None:
+        """ Writes the index to disk; called after every download and eviction. """
+        with self._lock:
+            path = os.path.join(self.directory, self.INDEX)
+            tmp = path + '.tmp'
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump({'entries': self._entries, 'thumbs': self._thumbs}, f)
+            os.replace(tmp, path)
+
+    def _blob_path(self, sha256: str) -> str:
+        return os.path.join(self.directory, 'blobs', sha256[:2], sha256)
+
+    def _thumb_path(self, name: str) -> str:
+        return os.path.join(self.directory, 'thumbs', name)
+
+    @staticmethod
+    def _write(path: str, data: bytes) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def size(self) -> int:
+        """ Bytes stored, counting each image once however many URLs share it. """
+        with self._lock:
+            blobs = {e['sha256']: e['size'] for e in self._entries.values()}
+            return sum(blobs.values()) + sum(sum(t.values()) for t in self._thumbs.values())
+
+    def _fresh(self, entry: Dict[str, Any]) -> bool:
+        return self.max_age is None or time.time() - entry['checked'] < self.max_age
+
+    def path(self, url: str) -> str:
+        """
+        The local path of url's image, downloading or revalidating it first if needed.
+
+        The file may be evicted once other images are added to the cache; when
+        other threads add images, read through get, open_image or thumbnail instead.
+
+        Raises:
+            requests.HTTPError: If the image cannot be downloaded and is not cached.
+        """
+        with self._pinned(url) as (path, _):
+            return path
+
+    @contextmanager
+    def _pinned(self, url: str, timeout: Optional[float] = None) -> Iterator[Tuple[str, str]]:
+        """ The local path and sha256 of url's image, as for path, kept from eviction until exit. """
+        path, sha256 = self._fetch(url, timeout)
+        try:
+            yield path, sha256
+        finally:
+            with self._lock:
+                self._pins[sha256] -= 1
+                if not self._pins[sha256]:
+                    del self._pins[sha256]
+                    if self._evict_pending:
+                        self._evict()
+                        self.flush()
+
+    def _fetch(self, url: str, timeout: Optional[float] = None) -> Tuple[str, str]:
+        # Returns with the image pinned, so no other thread evicts it before the caller reads it
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is not None and self._fresh(entry):
+                entry['used'] = time.time()
+                self.hits += 1
+                return self._pin(entry['sha256'])
+            headers = {}
+            if entry is not None:
+                if entry.get('etag'):
+                    headers['If-None-Match'] = entry['etag']
+                if entry.get('last_modified'):
+                    headers['If-Modified-Since'] = entry['last_modified']
+
+        # Download outside the lock, so other images are served meanwhile
+        response = self.session.get(url, headers=headers, timeout=self.timeout if timeout is None else timeout)
+        with self._lock:
+            now = time.time()
+            if response.status_code == 304 and entry is not None:
+                if os.path.exists(self._blob_path(entry['sha256'])):
+                    entry.update(checked=now, used=now)
+                    self._entries[url] = entry
+                    self.revalidated += 1
+                    self.flush()
+                    return self._pin(entry['sha256'])
+                # Evicted while revalidating; downloaded again below
+                self._entries.pop(url, None)
+            else:
+                response.raise_for_status()
+                data = response.content
+                sha256 = hashlib.sha256(data).hexdigest()
+                if not os.path.exists(self._blob_path(sha256)):
+                    self._write(self._blob_path(sha256), data)
+                self._entries[url] = {
+                    'sha256': sha256, 'size': len(data), 'etag': response.headers.get('ETag'),
+                    'last_modified': response.headers.get('Last-Modified'),
+                    'content_type': response.headers.get('Content-Type'), 'checked': now, 'used': now,
+                }
+                self.downloads += 1
+                self.bytes_downloaded += len(data)
+                pinned = self._pin(sha256)
+                self._evict()
+                self.flush()
+                return pinned
+        return self._fetch(url, timeout)
+
+    def _pin(self, sha256: str) -> Tuple[str, str]:
+        self._pins[sha256] = self._pins.get(sha256, 0) + 1
+        return self._blob_path(sha256), sha256
+
+    def get(self, url: str, timeout: Optional[float] = None) -> bytes:
+        """ The bytes of url's image, from the cache when possible; timeout overrides the cache's timeout. """
+        with self._pinned(url, timeout) as (path, _), open(path, 'rb') as f:
+            return f.read()
+
+    def open_image(self, url: str):
+        """ url's image as a PIL Image, from the cache when possible. """
+        if Image is None:
+            raise ImportError("ImageCache.open_image requires Pillow, install it with `pip install pillow`")
+        with self._pinned(url) as (path, _):
+            img = Image.open(path)
+            img.load()
+        return img
+
+    def thumbnail(self, url: str, size: Tuple[int, int] = (256, 256)):
+        """
+        A thumbnail of url's image fitting in size, as a PIL Image. Thumbnails
+        are stored as JPEG next to the image and evicted with it.
+        """
+        if Image is None:
+            raise ImportError("ImageCache.thumbnail requires Pillow, install it with `pip install pillow`")
+        with self._pinned(url) as (path, sha256):
+            name = f"{sha256}_{size[0]}x{size[1]}.jpg"
+            with self._lock:
+                if name in self._thumbs.get(sha256, {}) and os.path.exists(self._thumb_path(name)):
+                    thumb = Image.open(self._thumb_path(name))
+                    thumb.load()
+                    return thumb
+            img = Image.open(path)
+            img.thumbnail(size)
+            thumb = img.convert('RGB')
+            buffer = io.BytesIO()
+            thumb.save(buffer, format='JPEG', quality=85)
+            with self._lock:
+                self._write(self._thumb_path(name), buffer.getvalue())
+                self._thumbs.setdefault(sha256, {})[name] = buffer.tell()
+                self._evict()
+                self.flush()
+        return thumb
+
+    def _evict(self) -> None:
+        """ Deletes least recently used images, with their thumbnails, until the cache fits max_bytes. """
+        self._evict_pending = False
+        total = self.size()
+        if total <= self.max_bytes:
+            return
+        last_used: Dict[str, float] = {}
+        for e in self._entries.values():
+            last_used[e['sha256']] = max(last_used.get(e['sha256'], 0.0), e['used'])
+        for sha256 in sorted(last_used, key=last_used.get):
+            if total <= self.max_bytes:
+                break
+            if sha256 in self._pins:
+                # Being read; evicted once the last reader is done, if still needed
+                self._evict_pending = True
+                continue
+            urls = [url for url, e in self._entries.items() if e['sha256'] == sha256]
+            total -= self._entries[urls[0]]['size']
+            for url in urls:
+                del self._entries[url]
+            for name, n_bytes in self._thumbs.pop(sha256, {}).items():
+                total -= n_bytes
+                self._remove(self._thumb_path(name))
+            self._remove(self._blob_path(sha256))
+            self.evictions += 1
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def clear(self) -> None:
+        """ Deletes every cached image and thumbnail. """
+        with self._lock:
+            for e in self._entries.values():
+                self._remove(self._blob_path(e['sha256']))
+            for thumbs in self._thumbs.values():
+                for name in thumbs:
+                    self._remove(self._thumb_path(name))
+            self._entries, self._thumbs = {}, {}
+            self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            requests_served = self.hits + self.revalidated + self.downloads
+            return {
+                'hits': self.hits, 'revalidated': self.revalidated, 'downloads': self.downloads,
+                'hit_rate': (self.hits + self.revalidated) / requests_served if requests_served else 0.0,
+                'bytes_downloaded': self.bytes_downloaded, 'evictions': self.evictions,
+                'entries': len(self._entries), 'bytes': self.size(),
+            }
@@ -0,0 +1,223 @@
+"""
+Indexes a folder of images from local disk into a Marqo image index.
+
+The directory tree is walked lazily, so millions of files never sit in
+memory at once. The files are served by a local static HTTP server
+(helpers.file_server.FileServer), and their URLs are the image pointers
+Marqo downloads. A sidecar caption next to an image (``cat.txt`` for
+``cat.jpg``) becomes the ``caption`` field, and a sidecar ``cat.json`` adds
+its fields to the document. Images with a caption are embedded through a
+``multimodal_combination`` of image and caption; images without one, from
+the image alone.
+
+Batches go to add_documents with a bounded number in flight
+(helpers.ingestion.ingest_documents). Every acknowledged image is recorded
+in a resume manifest, so running the same command again after a crash
+skips what is already indexed and picks up new or changed files.
+
+Marqo must be able to reach the file server, which only listens on
+127.0.0.1 unless --host says otherwise. With Marqo in docker on this
+machine, start the container with
+``--add-host=host.docker.internal:host-gateway`` and pass
+``--host 0.0.0.0 --public-host host.docker.internal``. Keep --port and
+--public-host the same between runs, since the pointers, and so the manifest
+entries, contain them.
+
+Usage:
+    python helpers/image_folder.py /data/photos --index-name photos --create \\
+        --host 0.0.0.0 --public-host host.docker.internal
+    python helpers/image_folder.py /data/photos --index-name photos --url https://api.marqo.ai --api-key KEY \\
+        --host 0.0.0.0 --public-host 203.0.113.7 --port 8000
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sys
+import time
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+if __name__ == '__main__':
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from helpers.file_server import FileServer
+from helpers.ingestion import ingest_documents, IngestionManifest, IngestionReport
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.gif', '.bmp', '.tif', '.tiff')
+
+
+def walk_images(root: str, extensions: Sequence[str] = IMAGE_EXTENSIONS) -> Iterator[os.DirEntry]:
+    """
+    Yields the image files under root, depth first, in name order within each directory.
+
+    Only one directory listing per level is held at a time, and the order
+    is stable between runs. Hidden files and directories are skipped.
+    """
+    extensions = tuple(e.lower() for e in extensions)
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as it:
+                entries = sorted((e for e in it if not e.name.startswith('.')), key=lambda e: e.name)
+        except OSError as e:
+            logger.warning(f"cannot list {directory}: {e}")
+            continue
+        subdirectories = []
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                subdirectories.append(entry.path)
+            elif entry.name.lower().endswith(extensions) and entry.is_file():
+                yield entry
+        # Reversed, so subdirectories are popped in name order
+        stack.extend(reversed(subdirectories))
+
+
+def read_sidecars(path: str, caption_field: str = 'caption') -> Dict[str, Any]:
+    """ The fields from an image's sidecar files: ``{stem}.txt`` as caption_field and ``{stem}.json`` as is. """
+    stem = os.path.splitext(path)[0]
+    fields: Dict[str, Any] = {}
+    if os.path.exists(stem + '.json'):
+        with open(stem + '.json', 'r', encoding='utf-8') as f:
+            fields.update(json.load(f))
+    if os.path.exists(stem + '.txt'):
+        with open(stem + '.txt', 'r', encoding='utf-8') as f:
+            caption = f.read().strip()
+        if caption:
+            fields[caption_field] = caption
+    return fields
+
+
+def folder_documents(root: str, url_for, image_field: str = 'image', caption_field: str = 'caption',
+                     sidecars: bool = True, extensions: Sequence[str] = IMAGE_EXTENSIONS) -> Iterator[dict]:
+    """
+    Yields a document per image under root, lazily.
+
+    Each document has a stable ``_id`` derived from the image's path relative
+    to root, the image pointer ``url_for(path)`` in image_field, the relative
+    ``path``, the file's ``modified`` time (so a replaced image is indexed
+    again), and the sidecar fields.
+
+    Args:
+        root (str): The directory to walk.
+        url_for (callable): Maps a file path to its image pointer, e.g. FileServer.url_for.
+        image_field (str, optional): The field holding the image pointer. Default is 'image'.
+        caption_field (str, optional): The field a .txt sidecar is read into. Default is 'caption'.
+        sidecars (bool, optional): Read .txt and .json sidecars. Default is True.
+        extensions (sequence of str, optional): The image file extensions. Default is IMAGE_EXTENSIONS.
+    """
+    for entry in walk_images(root, extensions):
+        relative = os.path.relpath(entry.path, root).replace(os.sep, '/')
+        doc = {
+            '_id': hashlib.sha1(relative.encode('utf-8')).hexdigest(),
+            'path': relative,
+            'modified': int(entry.stat().st_mtime),
+        }
+        if sidecars:
+            try:
+                doc.update(read_sidecars(entry.path, caption_field))
+            except (OSError, ValueError) as e:
+                logger.warning(f"ignoring the sidecars of {relative}: {e}")
+        doc[image_field] = url_for(entry.path)
+        yield doc
+
+
+def image_mappings(image_field: str = 'image', caption_field: str = 'caption',
+                   caption_weight: float = 0.1) -> Dict[str, Any]:
+    """ The add_documents arguments embedding each image together with its caption, when it has one. """
+    name = f"{image_field}_{caption_field}_multimodal"
+    return {
+        'mappings': {
+            name: {
+                'type': 'multimodal_combination',
+                'weights': {caption_field: caption_weight, image_field: 1.0 - caption_weight},
+            }
+        },
+        'tensor_fields': [name],
+    }
+
+
+def ingest_image_folder(root: str, index, server: FileServer, manifest_path: Optional[str] = None,
+                        image_field: str = 'image', caption_field: str = 'caption', caption_weight: float = 0.1,
+                        sidecars: bool = True, batch_size: int = 64, max_in_flight: int = 4,
+                        on_batch_done=None, **add_documents_kwargs) -> IngestionReport:
+    """
+    Indexes every image under root, served by server, into index.
+
+    Args:
+        root (str): The directory to walk; must be inside the server's directory.
+        index: The Marqo index, e.g. ``mq.index(index_name)``, created with treatUrlsAndPointersAsImages.
+        server (FileServer): The running file server Marqo downloads the images from.
+        manifest_path (str, optional): The resume manifest; already indexed, unchanged images are skipped.
+        image_field, caption_field, sidecars: As for folder_documents.
+        caption_weight (float, optional): The caption's weight in the multimodal combination. Default is 0.1.
+        batch_size (int, optional): Documents per add_documents call. Default is 64.
+        max_in_flight (int, optional): add_documents calls in flight. Default is 4.
+        on_batch_done (callable, optional): Called with (batch, response) for every acknowledged batch.
+        **add_documents_kwargs: Passed to add_documents, overriding the multimodal mapping if given.
+
+    Returns:
+        IngestionReport: Throughput, errors and the number of images skipped by the manifest.
+    """
+    kwargs = {**image_mappings(image_field, caption_field, caption_weight), **add_documents_kwargs}
+    manifest = IngestionManifest(manifest_path, settings={'index': getattr(index, 'index_name', None), **kwargs}) \
+        if manifest_path else None
+    documents = folder_documents(root, server.url_for, image_field, caption_field, sidecars)
+    return ingest_documents(index, documents, batch_size=batch_size, max_in_flight=max_in_flight,
+                            manifest=manifest, on_batch_done=on_batch_done, **kwargs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('root', help="the directory of images")
+    parser.add_argument('--url', default='http://localhost:8882', help="Marqo URL")
+    parser.add_argument('--api-key', help="Marqo Cloud API key")
+    parser.add_argument('--index-name', required=True)
+    parser.add_argument('--create', action='store_true', help="create the index if it does not exist")
+    parser.add_argument('--model', default='open_clip/ViT-B-32/laion2b_s34b_b79k', help="with --create")
+    parser.add_argument('--host', default='127.0.0.1',
+                        help="interface the local file server listens on, 0.0.0.0 for Marqo in docker")
+    parser.add_argument('--port', type=int, default=8000, help="port of the local file server")
+    parser.add_argument('--public-host', default='127.0.0.1', help="host name Marqo reaches this machine by")
+    parser.add_argument('--manifest', help="resume manifest (default: {index name}.manifest.jsonl)")
+    parser.add_argument('--no-sidecars', action='store_true', help="ignore .txt and .json sidecar files")
+    parser.add_argument('--caption-weight', type=float, default=0.1)
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--in-flight', type=int, default=4, help="add_documents calls in flight")
+    args = parser.parse_args()
+
+    from marqo import Client
+    from marqo.errors import MarqoWebError
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+    mq = Client(args.url, api_key=args.api_key)
+    if args.create:
+        try:
+            mq.create_index(args.index_name, model=args.model, treat_urls_and_pointers_as_images=True)
+        except MarqoWebError as e:
+            if e.status_code != 409:
+                raise
+
+    progress = {'images': 0, 't0': time.perf_counter()}
+
+    def on_batch_done(batch: List[dict], response: Any):
+        progress['images'] += len(batch)
+        rate = progress['images'] / (time.perf_counter() - progress['t0'])
+        logger.info(f"{progress['images']} images indexed ({rate:.1f}/s), last {batch[-1]['path']}")
+
+    with FileServer(args.root, host=args.host, port=args.port, public_host=args.public_host) as server:
+        report = ingest_image_folder(args.root, mq.index(args.index_name), server,
+                                     manifest_path=args.manifest or f"{args.index_name}.manifest.jsonl",
+                                     sidecars=not args.no_sidecars, caption_weight=args.caption_weight,
+                                     batch_size=args.batch_size, max_in_flight=args.in_flight,
+                                     on_batch_done=on_batch_done)
+    print(report.summary())
+    for error in report.item_errors[:10]:
+        print(error)
+
+
+if __name__ == '__main__':
+    main()
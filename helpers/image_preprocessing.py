@@ -0,0 +1,208 @@
+"""
+Downscales images to the model's input resolution before they are indexed.
+
+Marqo downloads and decodes every image pointer at full size, although CLIP
+models such as ``ViT-B/32`` and ``open_clip/ViT-B-32`` only see a 224px
+input: the image is resized so its shorter side is 224 and centre-cropped.
+Doing that resize ahead of time, once, on a process pool, means Marqo
+downloads and decodes a small JPEG instead of a multi-megabyte photo:
+
+    with FileServer('resized', host='0.0.0.0', public_host='host.docker.internal') as server:
+        report = DownscaleReport()
+        docs = downscale_documents(documents, 'resized', server.url_for, size=input_size('ViT-B/32'),
+                                   report=report)
+        ingest_documents(mq.index(index_name), docs, tensor_fields=['image'])
+        print(report.summary())
+
+Images keep their aspect ratio, with the shorter side at ``size``, so the
+server's own resize is a no-op and its centre crop sees the same pixels;
+smaller images are only re-encoded. Sources are local paths or http(s)
+URLs. Each output file is named after its source and settings, and for
+local files their modification time and size, so an interrupted run resumes
+without redoing the images already written, and edited images are redone.
+
+``url_for`` decides how Marqo reaches the resized files: through a
+helpers.file_server.FileServer as above, or as file paths when the output
+directory is mounted into the Marqo container (Marqo also accepts local
+paths as image pointers), e.g. ``lambda path: '/resized/' + os.path.basename(path)``.
+
+Requires Pillow (``pip install pillow``).
+"""
+
+import hashlib
+import io
+import os
+import time
+import urllib.request
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+try:
+    from PIL import Image
+except ImportError:  # pragma: no cover - optional dependency
+    Image = None
+
+
+def input_size(model: str) -> int:
+    """ The input resolution of a CLIP model: 336 for the @336px variants, 224 otherwise. """
+    return 336 if '336' in model else 224
+
+
+@dataclass
+class DownscaleReport:
+    """ Summary of a downscale_documents run. """
+    n_images: int = 0
+    # Images already resized, by an earlier run or for an earlier document
+    n_skipped: int = 0
+    bytes_in: int = 0
+    bytes_out: int = 0
+    elapsed: float = 0.0
+    # Images left as they were: {'source': ..., 'error': ...}
+    errors: List[Dict[str, Any]] = field(default_factory=list)
+
+    def summary(self) -> str:
+        ratio = self.bytes_in / self.bytes_out if self.bytes_out else 0.0
+        n_resized = self.n_images - self.n_skipped - len(self.errors)
+        return (f"resized {n_resized} of {self.n_images} images ({self.n_skipped} already done, "
+                f"{len(self.errors)} failed) in {self.elapsed:.2f}s, "
+                f"{self.bytes_in / 2**20:.1f} MiB to {self.bytes_out / 2**20:.1f} MiB ({ratio:.1f}x smaller)")
+
+
+def downscale_bytes(data: bytes, size: int = 224, quality: int = 90) -> bytes:
+    """ Re-encodes an image as a JPEG whose shorter side is at most size pixels. """
+    if Image is None:
+        raise ImportError("downscaling requires Pillow, install it with `pip install pillow`")
+    img = Image.open(io.BytesIO(data))
+    scale = size / min(img.size)
+    if scale < 1:
+        target = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+        # Let JPEG decode at a reduced scale first, then resample like the model's preprocessing
+        img.draft('RGB', target)
+        img = img.convert('RGB').resize(target, Image.BICUBIC, reducing_gap=3.0)
+    else:
+        img = img.convert('RGB')
+    out = io.BytesIO()
+    img.save(out, format='JPEG', quality=quality)
+    return out.getvalue()
+
+
+def output_path(output_dir: str, source: str, size: int, quality: int) -> str:
+    """
+    Where the resized image of source is written.
+
+    For a local source the name also covers the file's modification time and
+    size, so an image edited in place is resized again. A URL is assumed not
+    to change.
+    """
+    key = f"{source}|{size}|{quality}"
+    if not source.startswith(('http://', 'https://')):
+        try:
+            stat = os.stat(source)
+            key += f"|{stat.st_mtime_ns}|{stat.st_size}"
+        except OSError:
+            # Left to the worker, which reports the missing file
+            pass
+    digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+    return os.path.join(output_dir, digest[:2], f"{digest}.jpg")
+
+
+def _downscale_file(source: str, destination: str, size: int, quality: int, timeout: float) -> Tuple[int, int]:
+    """ Runs on a worker process; returns the bytes read and written. """
+    if source.startswith(('http://', 'https://')):
+        with urllib.request.urlopen(source, timeout=timeout) as response:
+            data = response.read()
+    else:
+        with open(source, 'rb') as f:
+            data = f.read()
+    resized = downscale_bytes(data, size, quality)
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    tmp = f"{destination}.{os.getpid()}.tmp"
+    with open(tmp, 'wb') as f:
+        f.write(resized)
+    os.replace(tmp, destination)
+    return len(data), len(resized)
+
+
+def downscale_documents(documents: Iterable[dict], output_dir: str, url_for: Callable[[str], str],
+                        image_fields: Sequence[str] = ('image',), size: int = 224, quality: int = 90,
+                        max_workers: Optional[int] = None, window: int = 256, timeout: float = 30.0,
+                        report: Optional[DownscaleReport] = None) -> Iterator[dict]:
+    """
+    Yields the documents, in order, with their images resized and their pointers replaced by url_for.
+
+    Up to ``window`` documents are resized ahead of the one being yielded, on
+    a pool of ``max_workers`` processes. An image that cannot be read or
+    decoded keeps its original pointer and is recorded in report.errors.
+
+    Args:
+        documents (iterable of dict): The documents.
+        output_dir (str): Where the resized images are written.
+        url_for (callable): Maps the path of a resized image to the pointer Marqo will use.
+        image_fields (sequence of str, optional): The fields holding image paths or URLs. Default is ('image',).
+        size (int, optional): The shorter side of the resized images, see input_size. Default is 224.
+        quality (int, optional): JPEG quality. Default is 90.
+        max_workers (int, optional): Worker processes. Default is the number of CPUs.
+        window (int, optional): Documents resized ahead. Default is 256.
+        timeout (float, optional): Seconds to wait for a source URL. Default is 30.
+        report (DownscaleReport, optional): Filled in as images are resized.
+    """
+    if Image is None:
+        raise ImportError("downscaling requires Pillow, install it with `pip install pillow`")
+    report = report if report is not None else DownscaleReport()
+    t0 = time.perf_counter()
+
+    # Resizes in flight by destination, so a source repeated within the window is resized once
+    in_flight: Dict[str, Any] = {}
+
+    def submit(executor, doc):
+        jobs = {}
+        for name in image_fields:
+            source = doc.get(name)
+            if not isinstance(source, str):
+                continue
+            destination = output_path(output_dir, source, size, quality)
+            if destination in in_flight:
+                jobs[name] = (source, destination, in_flight[destination], False)
+            elif os.path.exists(destination):
+                jobs[name] = (source, destination, None, False)
+            else:
+                future = executor.submit(_downscale_file, source, destination, size, quality, timeout)
+                in_flight[destination] = future
+                jobs[name] = (source, destination, future, True)
+        return jobs
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        queue = deque()
+        remaining = iter(documents)
+        while True:
+            while len(queue) < window:
+                doc = next(remaining, None)
+                if doc is None:
+                    break
+                queue.append((doc, submit(executor, doc)))
+            if not queue:
+                break
+            doc, jobs = queue.popleft()
+            doc = dict(doc)
+            for name, (source, destination, future, first) in jobs.items():
+                report.n_images += 1
+                try:
+                    n_in, n_out = future.result() if future is not None else (0, 0)
+                except Exception as e:
+                    if first:
+                        report.errors.append({'source': source, 'error': f"{type(e).__name__}: {e}"})
+                    continue
+                finally:
+                    if first:
+                        in_flight.pop(destination, None)
+                if first:
+                    report.bytes_in += n_in
+                    report.bytes_out += n_out
+                else:
+                    report.n_skipped += 1
+                doc[name] = url_for(destination)
+            report.elapsed = time.perf_counter() - t0
+            yield doc
+    report.elapsed = time.perf_counter() - t0
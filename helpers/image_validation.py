@@ -0,0 +1,270 @@
+"""
+Checks the image pointers of documents before they are sent to Marqo.
+
+Marqo downloads and embeds every image pointer while it indexes a batch, so
+a dead or slow URL stalls the whole batch and its error only shows up
+afterwards. Checking every pointer first, concurrently, quarantines the
+documents with a bad image and lets the rest be sent in large batches:
+
+    valid, report = validate_documents(documents, image_fields=['image'])
+    print(report.summary())
+    report.write_quarantine(os.path.join(output_dir, 'quarantine.jsonl'))
+    mq.index(index_name).add_documents(valid, client_batch_size=64, ...)
+
+A pointer passes when it is an http(s) URL that answers 200 within the
+timeout with an image content type, is at most max_bytes, and decodes. A
+local path, as Marqo accepts from a mounted directory and as
+helpers.image_preprocessing.downscale_documents can produce, passes when the
+file exists on this machine, has an image extension, is at most max_bytes
+and decodes; check it where the paths are the same as for Marqo, or validate
+the original URLs before downscaling.
+For corpora too big for memory, iter_valid_documents does the same over a
+bounded window of documents and can feed
+helpers.ingestion.ingest_documents directly.
+
+Decoding requires Pillow (``pip install pillow``); without it, or with
+decode=False, pointers are checked up to their content type and size.
+"""
+
+import io
+import json
+import mimetypes
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+from urllib.parse import urlsplit
+
+import requests
+
+from helpers.result_images import pooled_session
+
+try:
+    from PIL import Image
+except ImportError:  # pragma: no cover - optional dependency
+    Image = None
+
+
+@dataclass
+class ImageCheck:
+    """ The outcome of checking one image pointer. """
+    url: str
+    ok: bool = False
+    status: Optional[int] = None
+    content_type: Optional[str] = None
+    n_bytes: int = 0
+    width: Optional[int] = None
+    height: Optional[int] = None
+    elapsed: float = 0.0
+    error: Optional[str] = None
+
+
+@dataclass
+class ValidationReport:
+    """ Summary of a validate_documents or iter_valid_documents run. """
+    n_docs: int = 0
+    n_valid: int = 0
+    n_checks: int = 0
+    # The longest a check took
+    slowest: float = 0.0
+    elapsed: float = 0.0
+    # Failed checks by URL
+    failed_checks: Dict[str, ImageCheck] = field(default_factory=dict)
+    # Documents left out: {'_id': ..., 'field': ..., 'url': ..., 'error': ..., 'document': ...}
+    quarantined: List[Dict[str, Any]] = field(default_factory=list)
+
+    def summary(self) -> str:
+        reasons = defaultdict(int)
+        for q in self.quarantined:
+            reasons[q['error'].split(':')[0]] += 1
+        return (f"checked {self.n_checks} image URLs of {self.n_docs} documents in {self.elapsed:.2f}s "
+                f"(slowest {self.slowest:.2f}s), {self.n_valid} valid, {len(self.quarantined)} quarantined"
+                + (f": {dict(reasons)}" if reasons else ""))
+
+    def write_quarantine(self, path: str) -> None:
+        """ Writes the quarantined documents and why, one JSON line each, to review or retry later. """
+        with open(path, 'w', encoding='utf-8') as f:
+            for q in self.quarantined:
+                f.write(json.dumps(q, default=str) + '\n')
+
+
+def _download(url: str, check: ImageCheck, session: Optional[requests.Session], timeout: float,
+              max_bytes: int) -> bytes:
+    with (session or requests).get(url, timeout=timeout, stream=True) as response:
+        check.status = response.status_code
+        check.content_type = response.headers.get('Content-Type', '').split(';')[0].strip() or None
+        if response.status_code != 200:
+            raise ValueError(f"HTTP {response.status_code}")
+        if not (check.content_type or '').startswith('image/'):
+            raise ValueError(f"content type {check.content_type}")
+        if int(response.headers.get('Content-Length') or 0) > max_bytes:
+            raise ValueError(f"too large: {response.headers['Content-Length']} bytes")
+        data = bytearray()
+        for chunk in response.iter_content(64 * 1024):
+            data += chunk
+            if len(data) > max_bytes:
+                raise ValueError(f"too large: more than {max_bytes} bytes")
+    return bytes(data)
+
+
+def _read_local(path: str, check: ImageCheck, max_bytes: int) -> bytes:
+    if not os.path.isfile(path):
+        raise ValueError("not an http(s) URL or existing file")
+    check.content_type = mimetypes.guess_type(path)[0]
+    if not (check.content_type or '').startswith('image/'):
+        raise ValueError(f"content type {check.content_type}")
+    n_bytes = os.path.getsize(path)
+    if n_bytes > max_bytes:
+        raise ValueError(f"too large: {n_bytes} bytes")
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def check_image(url: Any, session: Optional[requests.Session] = None, timeout: float = 10.0,
+                max_bytes: int = 20 * 2**20, decode: bool = True) -> ImageCheck:
+    """
+    Checks that an image pointer can be downloaded, or read from disk, and decoded, as Marqo will.
+
+    Args:
+        url: The image pointer, an http(s) URL or a local path.
+        session (requests.Session, optional): The session to download with.
+        timeout (float, optional): Seconds to wait for the host, per connect and per read. Default is 10.
+        max_bytes (int, optional): The largest image accepted. Default is 20 MiB.
+        decode (bool, optional): Also decode the image, when Pillow is installed. Default is True.
+
+    Returns:
+        ImageCheck: ok is True if the pointer passed; otherwise error says why.
+    """
+    check = ImageCheck(url=url)
+    t0 = time.perf_counter()
+    try:
+        if not isinstance(url, str):
+            raise ValueError("not an http(s) URL or existing file")
+        if urlsplit(url).scheme in ('http', 'https'):
+            data = _download(url, check, session, timeout, max_bytes)
+        else:
+            data = _read_local(url, check, max_bytes)
+        check.n_bytes = len(data)
+        if decode and Image is not None:
+            try:
+                img = Image.open(io.BytesIO(data))
+                check.width, check.height = img.size
+                # A reduced-scale decode is enough to catch truncated or corrupt files
+                img.draft('RGB', (64, 64))
+                img.load()
+            except Exception as e:
+                raise ValueError(f"undecodable: {e}")
+        check.ok = True
+    except requests.Timeout:
+        check.error = f"timeout: no response within {timeout}s"
+    except requests.RequestException as e:
+        check.error = f"unreachable: {type(e).__name__}"
+    except (OSError, ValueError) as e:
+        check.error = str(e)
+    check.elapsed = time.perf_counter() - t0
+    return check
+
+
+def iter_valid_documents(documents: Iterable[dict], image_fields: Sequence[str] = ('image',),
+                         report: Optional[ValidationReport] = None, max_workers: int = 32, per_host: int = 8,
+                         window: int = 256, timeout: float = 10.0, max_bytes: int = 20 * 2**20,
+                         decode: bool = True) -> Iterator[dict]:
+    """
+    Yields, in order, the documents whose image pointers all pass check_image,
+    and records the others in report.quarantined.
+
+    Up to ``window`` documents are checked ahead of the one being yielded, by
+    ``max_workers`` threads, with at most ``per_host`` requests to any one host.
+    A URL repeated within the window is checked once.
+
+    Args:
+        documents (iterable of dict): The documents.
+        image_fields (sequence of str, optional): The fields holding image pointers. Default is ('image',).
+        report (ValidationReport, optional): Filled in as documents are checked.
+        max_workers (int, optional): Checks in flight. Default is 32.
+        per_host (int, optional): Checks in flight to any one host. Default is 8.
+        window (int, optional): Documents checked ahead. Default is 256.
+        timeout, max_bytes, decode: As for check_image.
+    """
+    report = report if report is not None else ValidationReport()
+    session = pooled_session(per_host=per_host)
+    host_slots: Dict[str, threading.Semaphore] = defaultdict(lambda: threading.Semaphore(per_host))
+    lock = threading.Lock()
+    # One check per distinct URL in the window, shared by the documents pointing at it
+    futures: Dict[str, Any] = {}
+    users: Dict[str, int] = defaultdict(int)
+
+    def limited_check(url):
+        with lock:
+            slots = host_slots[urlsplit(url).netloc if isinstance(url, str) else '']
+        with slots:
+            return check_image(url, session=session, timeout=timeout, max_bytes=max_bytes, decode=decode)
+
+    def submit(executor, doc) -> List[Tuple[str, Any]]:
+        pending = []
+        for name in image_fields:
+            if name in doc:
+                url = doc[name]
+                key = url if isinstance(url, str) else repr(url)
+                if key not in futures:
+                    futures[key] = executor.submit(limited_check, url)
+                    report.n_checks += 1
+                users[key] += 1
+                pending.append((name, key))
+        return pending
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        queue = deque()
+        remaining = iter(documents)
+        while True:
+            while len(queue) < window:
+                doc = next(remaining, None)
+                if doc is None:
+                    break
+                queue.append((doc, submit(executor, doc)))
+            if not queue:
+                break
+            doc, pending = queue.popleft()
+            report.n_docs += 1
+            failed = None
+            for name, key in pending:
+                check = futures[key].result()
+                users[key] -= 1
+                if not users[key]:
+                    del users[key], futures[key]
+                    report.slowest = max(report.slowest, check.elapsed)
+                    if not check.ok:
+                        report.failed_checks[key] = check
+                if not check.ok and failed is None:
+                    failed = (name, check)
+            report.elapsed = time.perf_counter() - t0
+            if failed is None:
+                report.n_valid += 1
+                yield doc
+            else:
+                name, check = failed
+                report.quarantined.append({'_id': doc.get('_id'), 'field': name, 'url': check.url,
+                                           'error': check.error, 'document': doc})
+    report.elapsed = time.perf_counter() - t0
+
+
+def validate_documents(documents: Iterable[dict], image_fields: Sequence[str] = ('image',),
+                       **kwargs) -> Tuple[List[dict], ValidationReport]:
+    """
+    Checks the image pointers of all documents concurrently.
+
+    Args:
+        documents (iterable of dict): The documents.
+        image_fields (sequence of str, optional): The fields holding image pointers. Default is ('image',).
+        **kwargs: As for iter_valid_documents, e.g. timeout or max_workers.
+
+    Returns:
+        tuple: The valid documents, in order, and the ValidationReport with the quarantined ones.
+    """
+    report = ValidationReport()
+    valid = list(iter_valid_documents(documents, image_fields, report=report, **kwargs))
+    return valid, report
@@ -0,0 +1,479 @@
+import hashlib
+import json
+import logging
+import os
+import statistics
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from marqo.errors import MarqoWebError
+
+from helpers.text_processing import batched
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class IngestionReport:
+    """ Summary of an ingest_documents run. """
+    n_docs: int = 0
+    n_batches: int = 0
+    n_retries: int = 0
+    # Documents left out because the manifest shows they are already indexed
+    n_skipped: int = 0
+    elapsed: float = 0.0
+    batch_latencies: List[float] = field(default_factory=list)
+    # Items the server rejected: {'_id': ..., 'status': ..., 'error': ...}
+    item_errors: List[Dict[str, Any]] = field(default_factory=list)
+    # Batches that still failed after all retries: {'ids': [...], 'error': ...}
+    failed_batches: List[Dict[str, Any]] = field(default_factory=list)
+
+    @property
+    def docs_per_second(self) -> float:
+        return self.n_docs / self.elapsed if self.elapsed else 0.0
+
+    def summary(self) -> str:
+        latencies = sorted(self.batch_latencies)
+        p50 = latencies[len(latencies) // 2] if latencies else 0.0
+        return (f"indexed {self.n_docs} docs ({self.n_skipped} unchanged docs skipped) in {self.n_batches} batches in {self.elapsed:.2f}s "
+                f"({self.docs_per_second:.1f} docs/s, median batch latency {p50:.2f}s), "
+                f"{len(self.item_errors)} item errors, {len(self.failed_batches)} failed batches, "
+                f"{self.n_retries} retries")
+
+
+def is_retryable(error: Exception) -> bool:
+    """
+    Whether an add_documents error is worth retrying: timeouts, connection
+    errors, 429 and 5xx responses are; client errors such as a bad field name are not.
+    """
+    if isinstance(error, MarqoWebError):
+        status = error.status_code
+        return status is None or int(status) == 429 or int(status) >= 500
+    return isinstance(error, (ConnectionError, TimeoutError))
+
+
+def _item_errors(response: Any) -> List[Dict[str, Any]]:
+    """ Extracts the rejected items from an add_documents response. """
+    if isinstance(response, list):
+        return [e for r in response for e in _item_errors(r)]
+    if not isinstance(response, dict) or not response.get('errors'):
+        return []
+    return [
+        {'_id': item.get('_id'), 'status': item.get('status'),
+         'error': item.get('error') or item.get('message')}
+        for item in response.get('items', [])
+        if item.get('status', 200) >= 400 or item.get('error')
+    ]
+
+
+class AdaptiveBatchSize:
+    """
+    Chooses add_documents batch sizes from payload bytes and observed latency.
+
+    Batches are filled up to a byte budget rather than a fixed number of
+    documents, so long Wikipedia chunks and short titles both produce
+    sensibly sized requests. The budget starts small and is multiplied by
+    ``growth`` after every ``batches_per_step`` batches for as long as
+    throughput (bytes per second) keeps improving by more than ``plateau``.
+    After that it stays at the best budget found. A timeout, a 5xx or 429
+    response, or a batch slower than ``max_latency`` halves the budget,
+    and the halved budget becomes the new maximum.
+
+    Pass an instance as ``batch_size`` to ingest_documents. Every step is
+    logged at INFO level, and ``curve()`` returns the measured throughput
+    per budget for tuning.
+
+    Args:
+        initial_bytes (int, optional): Starting batch budget in bytes. Default is 64 KiB.
+        min_bytes (int, optional): Smallest budget. Default is 4 KiB.
+        max_bytes (int, optional): Largest budget. Default is 16 MiB.
+        max_docs (int, optional): Upper bound on documents per batch. Default is 128, the default
+            maximum batch size of a Marqo server.
+        growth (float, optional): Budget multiplier while throughput improves. Default is 2.0.
+        plateau (float, optional): Relative throughput gain below which growth stops. Default is 0.1.
+        batches_per_step (int, optional): Batches measured at each budget before deciding. Default is 3.
+        max_latency (float, optional): Batch latency in seconds that counts as too slow. Default is 30.
+    """
+
+    def __init__(self, initial_bytes: int = 64 * 1024, min_bytes: int = 4 * 1024,
+                 max_bytes: int = 16 * 1024 * 1024, max_docs: int = 128, growth: float = 2.0,
+                 plateau: float = 0.1, batches_per_step: int = 3, max_latency: float = 30.0):
+        self.target_bytes = initial_bytes
+        self.min_bytes = min_bytes
+        self.max_bytes = max_bytes
+        self.max_docs = max_docs
+        self.growth = growth
+        self.plateau = plateau
+        self.batches_per_step = batches_per_step
+        self.max_latency = max_latency
+        self.settled = False
+        # One entry per observed batch: target_bytes, n_docs, n_bytes, latency, bytes_per_s, docs_per_s, error
+        self.history: List[Dict[str, Any]] = []
+        self._step: List[Dict[str, Any]] = []
+        self._best = (0.0, initial_bytes)
+        # Payload bytes of the batch most recently returned by take()
+        self.last_batch_bytes = 0
+
+    @staticmethod
+    def payload_bytes(doc: dict) -> int:
+        """ The size of a document once serialised into the request body. """
+        return len(json.dumps(doc, ensure_ascii=False, default=str).encode('utf-8'))
+
+    def take(self, documents: Iterator[dict]) -> Tuple[List[dict], int]:
+        """
+        Builds the next batch from an iterator of documents.
+
+        Args:
+            documents (Iterator[dict]): Where to read documents from.
+
+        Returns:
+            tuple: The batch, empty once the iterator is exhausted, and the budget it was built
+            under, to pass back to observe.
+        """
+        batch, n_bytes = [], 0
+        for doc in documents:
+            batch.append(doc)
+            n_bytes += self.payload_bytes(doc)
+            if n_bytes >= self.target_bytes or len(batch) >= self.max_docs:
+                break
+        self.last_batch_bytes = n_bytes
+        return batch, self.target_bytes
+
+    def observe(self, n_docs: int, n_bytes: int, latency: float, overloaded: bool = False,
+                target_bytes: Optional[int] = None) -> None:
+        """
+        Feeds back the outcome of a batch.
+
+        With several batches in flight, batches built under an earlier budget
+        finish after the budget has changed. They are kept in the history but
+        left out of the decision to grow, so every budget is judged only by
+        batches of its own size.
+
+        Args:
+            n_docs (int): Documents in the batch.
+            n_bytes (int): Payload bytes of the batch.
+            latency (float): Round trip time of the batch in seconds.
+            overloaded (bool, optional): Whether the batch hit a timeout, 5xx or 429 response.
+            target_bytes (int, optional): The budget the batch was built under, as returned by take().
+                Default is the current budget.
+        """
+        if target_bytes is None:
+            target_bytes = self.target_bytes
+        entry = {
+            'target_bytes': target_bytes, 'n_docs': n_docs, 'n_bytes': n_bytes, 'latency': latency,
+            'bytes_per_s': n_bytes / latency if latency else 0.0,
+            'docs_per_s': n_docs / latency if latency else 0.0, 'error': overloaded,
+        }
+        self.history.append(entry)
+
+        if overloaded or latency > self.max_latency:
+            # A batch larger than the current budget failed under a budget already halved since
+            if target_bytes <= self.target_bytes:
+                self._resize(self.target_bytes / 2, ceiling=True,
+                             reason='server overloaded' if overloaded else f'batch took {latency:.1f}s')
+            return
+        if self.settled or target_bytes != self.target_bytes:
+            return
+
+        self._step.append(entry)
+        if len(self._step) < self.batches_per_step:
+            return
+        throughput = sum(e['n_bytes'] for e in self._step) / sum(e['latency'] for e in self._step)
+        logger.info(f"batch budget {self.target_bytes / 1024:.0f} KiB: "
+                    f"{throughput / 1024:.0f} KiB/s, "
+                    f"{sum(e['n_docs'] for e in self._step) / sum(e['latency'] for e in self._step):.1f} docs/s")
+
+        best_throughput, best_bytes = self._best
+        if throughput > best_throughput * (1 + self.plateau) and self.target_bytes < self.max_bytes:
+            self._best = (throughput, self.target_bytes)
+            self._resize(self.target_bytes * self.growth, reason='throughput still improving')
+        else:
+            if throughput > best_throughput:
+                self._best = (throughput, self.target_bytes)
+            self.settled = True
+            self._resize(self._best[1], reason='throughput plateaued')
+
+    def _resize(self, target: float, reason: str, ceiling: bool = False):
+        target = int(min(max(target, self.min_bytes), self.max_bytes))
+        if ceiling:
+            # Never grow back towards a size the server could not handle
+            self.max_bytes = target
+        if target != self.target_bytes:
+            logger.info(f"batch budget {self.target_bytes / 1024:.0f} KiB -> {target / 1024:.0f} KiB ({reason})")
+        self.target_bytes = target
+        self._step = []
+
+    def curve(self) -> List[Dict[str, float]]:
+        """
+        The throughput measured at each batch budget, in the order they were tried.
+
+        Returns:
+            List[dict]: One entry per budget with target_bytes, batches, mean_docs,
+            mean_latency, bytes_per_s, docs_per_s and errors.
+        """
+        curve = {}
+        for e in self.history:
+            c = curve.setdefault(e['target_bytes'], {'batches': 0, 'docs': 0, 'bytes': 0, 'time': 0.0, 'errors': 0})
+            c['batches'] += 1
+            c['docs'] += e['n_docs']
+            c['bytes'] += e['n_bytes']
+            c['time'] += e['latency']
+            c['errors'] += e['error']
+        return [
+            {'target_bytes': t, 'batches': c['batches'], 'mean_docs': c['docs'] / c['batches'],
+             'mean_latency': c['time'] / c['batches'],
+             'bytes_per_s': c['bytes'] / c['time'] if c['time'] else 0.0,
+             'docs_per_s': c['docs'] / c['time'] if c['time'] else 0.0, 'errors': c['errors']}
+            for t, c in curve.items()
+        ]
+
+
+def content_hash(doc: dict) -> str:
+    """ A stable hash of a document's content, independent of key order. """
+    payload = json.dumps(doc, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class IngestionManifest:
+    """
+    An append-only record, on disk, of the documents an index has acknowledged.
+
+    Each line of the file is ``{"_id": ..., "hash": ...}`` and is written as
+    soon as the batch containing the document is acknowledged, so a crashed
+    run can be resumed: documents whose id and content hash are already in
+    the manifest are skipped, and only new or modified documents are sent
+    (Marqo replaces a document when it is added again with the same ``_id``).
+
+    The first line stores the add_documents settings the manifest was built
+    with. If they change (e.g. different tensor_fields), the manifest is
+    reset, because every document would need to be re-embedded anyway.
+
+    Only documents with an ``_id`` can be tracked; see
+    ``helpers.text_processing.assign_ids``.
+
+    Raises:
+        ValueError: If the manifest file exists but its header line is damaged.
+    """
+
+    def __init__(self, path: str, settings: Optional[dict] = None):
+        self.path = path
+        self.settings = json.loads(json.dumps(settings or {}, sort_keys=True, default=str))
+        self.hashes: Dict[str, str] = {}
+        self.n_skipped = 0
+        self._load()
+
+    def __len__(self) -> int:
+        return len(self.hashes)
+
+    def __contains__(self, doc: dict) -> bool:
+        return self.hashes.get(doc.get('_id')) == content_hash(doc)
+
+    def _load(self):
+        compact = True
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                try:
+                    header = f.readline()
+                    header = json.loads(header) if header else {}
+                except ValueError as e:
+                    raise ValueError(f"manifest {self.path} has a damaged header line; delete it to start a "
+                                     f"fresh manifest (every document is then sent again)") from e
+                if isinstance(header, dict) and header.get('settings') == self.settings:
+                    lines, torn = 0, False
+                    for line in f:
+                        try:
+                            entry = json.loads(line)
+                        except json.JSONDecodeError:
+                            # A torn final line from a crash mid-write; everything before it is intact
+                            torn = True
+                            break
+                        self.hashes[entry['_id']] = entry['hash']
+                        lines += 1
+                    # Rewrite only to drop a torn line or superseded entries
+                    compact = torn or lines > 2 * len(self.hashes)
+                else:
+                    logger.info(f"manifest {self.path} was written with different settings, starting over")
+        if compact:
+            self._rewrite()
+
+    def _rewrite(self):
+        # Write to a temporary file first so a crash never leaves a half-written manifest
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({'settings': self.settings}) + '\n')
+            for _id, h in self.hashes.items():
+                f.write(json.dumps({'_id': _id, 'hash': h}) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+    def clear(self):
+        """ Forgets every recorded document, e.g. after the index was re-created. """
+        self.hashes = {}
+        self._rewrite()
+
+    def filter_new(self, documents: Iterable[dict]) -> Iterator[dict]:
+        """
+        Yields only documents that are not in the manifest with the same content hash.
+
+        Args:
+            documents (Iterable[dict]): The documents to check.
+
+        Yields:
+            dict: New or modified documents, and documents without an ``_id``.
+        """
+        for doc in documents:
+            if doc.get('_id') is not None and doc in self:
+                self.n_skipped += 1
+            else:
+                yield doc
+
+    def record(self, batch: List[dict], response: Any) -> None:
+        """
+        Records the documents of an acknowledged batch, leaving out items the server rejected.
+
+        Args:
+            batch (List[dict]): The documents sent to add_documents.
+            response: The add_documents response for the batch.
+        """
+        rejected = {e['_id'] for e in _item_errors(response)}
+        entries = []
+        for doc in batch:
+            _id = doc.get('_id')
+            if _id is not None and _id not in rejected:
+                h = content_hash(doc)
+                self.hashes[_id] = h
+                entries.append(json.dumps({'_id': _id, 'hash': h}))
+        if entries:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write('\n'.join(entries) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+
+
+def ingest_documents(index, documents: Iterable[dict], batch_size: Union[int, AdaptiveBatchSize] = 50,
+                     max_in_flight: int = 4,
+                     max_retries: int = 3, retry_backoff: float = 1.0, slowdown_factor: float = 2.0,
+                     on_batch_done: Optional[Callable[[List[dict], Any], None]] = None,
+                     manifest: Optional[IngestionManifest] = None,
+                     **add_documents_kwargs) -> IngestionReport:
+    """
+    Sends documents to a Marqo index with several add_documents batches in flight at once.
+
+    Documents are pulled from ``documents`` only when a slot is free, so a
+    generator is never read further ahead than ``max_in_flight`` batches. The
+    number of batches in flight backs off when the server slows down: it is
+    halved when a batch fails with a retryable error and reduced by one when a
+    batch takes ``slowdown_factor`` times longer than the recent median. It
+    grows back by one after a run of healthy batches.
+
+    Args:
+        index: The Marqo index, e.g. ``mq.index(index_name)``.
+        documents (Iterable[dict]): The documents to add. May be a generator.
+        batch_size (int or AdaptiveBatchSize, optional): Documents per add_documents call, or an
+            AdaptiveBatchSize that sizes each batch from payload bytes and latency. Default is 50.
+        max_in_flight (int, optional): Maximum number of concurrent batches. Default is 4.
+        max_retries (int, optional): Retries per batch for retryable errors. Default is 3.
+        retry_backoff (float, optional): Seconds to wait before the first retry, doubled each time. Default is 1.0.
+        slowdown_factor (float, optional): Batch latency, relative to the recent median, treated as
+            a sign the server is overloaded. Default is 2.0.
+        on_batch_done (Callable, optional): Called from the calling thread with (batch, response)
+            for every batch the server acknowledged.
+        manifest (IngestionManifest, optional): If given, documents already in the manifest are
+            skipped and acknowledged documents are recorded in it.
+        **add_documents_kwargs: Passed through to ``index.add_documents``, e.g. tensor_fields.
+
+    Returns:
+        IngestionReport: Throughput, latencies and the per-item and per-batch errors.
+    """
+    if max_in_flight < 1:
+        raise ValueError("max_in_flight must be at least 1")
+
+    report = IngestionReport()
+    if manifest is not None:
+        documents = manifest.filter_new(documents)
+        skipped_before = manifest.n_skipped
+
+    def send(batch):
+        # Runs on a worker thread; retries are done here so a retrying batch keeps its slot
+        attempt = 0
+        while True:
+            t0 = time.perf_counter()
+            try:
+                response = index.add_documents(batch, **add_documents_kwargs)
+                return response, time.perf_counter() - t0, attempt, None
+            except Exception as e:
+                if attempt >= max_retries or not is_retryable(e):
+                    return None, time.perf_counter() - t0, attempt, e
+                logger.warning(f"add_documents batch of {len(batch)} docs failed ({e!r}), retrying")
+                time.sleep(retry_backoff * 2 ** attempt)
+                attempt += 1
+
+    limit = max_in_flight
+    healthy_streak = 0
+    recent = deque(maxlen=20)
+    pending = {}
+    adaptive = batch_size if isinstance(batch_size, AdaptiveBatchSize) else None
+    if adaptive is not None:
+        documents = iter(documents)
+        # Each batch travels with the budget it was built under, see AdaptiveBatchSize.observe
+        batches = iter(lambda: adaptive.take(documents), None)  # ends with an empty batch
+    else:
+        batches = ((batch, None) for batch in batched(documents, batch_size))
+    exhausted = False
+
+    t_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        while pending or not exhausted:
+            while not exhausted and len(pending) < limit:
+                batch, budget = next(batches, (None, None))
+                if not batch:
+                    exhausted = True
+                else:
+                    n_bytes = adaptive.last_batch_bytes if adaptive is not None else 0
+                    pending[executor.submit(send, batch)] = batch, n_bytes, budget
+            if not pending:
+                break
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                batch, n_bytes, budget = pending.pop(future)
+                response, latency, retries, error = future.result()
+                report.n_retries += retries
+                overloaded = bool(retries) or (error is not None and is_retryable(error))
+                if adaptive is not None:
+                    adaptive.observe(len(batch), n_bytes, latency, overloaded=overloaded, target_bytes=budget)
+
+                if error is not None:
+                    report.failed_batches.append({'ids': [d.get('_id') for d in batch], 'error': repr(error)})
+                    logger.error(f"add_documents batch of {len(batch)} docs failed: {error!r}")
+                else:
+                    report.n_docs += len(batch)
+                    report.n_batches += 1
+                    report.batch_latencies.append(latency)
+                    report.item_errors.extend(_item_errors(response))
+                    if manifest is not None:
+                        manifest.record(batch, response)
+                    if on_batch_done is not None:
+                        on_batch_done(batch, response)
+
+                # Backpressure: shrink the window when the server struggles, grow it back slowly
+                slow = len(recent) >= 5 and latency > slowdown_factor * statistics.median(recent)
+                if overloaded:
+                    limit, healthy_streak = max(1, limit // 2), 0
+                elif slow:
+                    limit, healthy_streak = max(1, limit - 1), 0
+                else:
+                    healthy_streak += 1
+                    if healthy_streak >= limit and limit < max_in_flight:
+                        limit, healthy_streak = limit + 1, 0
+                if error is None:
+                    recent.append(latency)
+
+    report.elapsed = time.perf_counter() - t_start
+    if manifest is not None:
+        report.n_skipped = manifest.n_skipped - skipped_before
+    return report
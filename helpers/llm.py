@@ -0,0 +1,319 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+
+@dataclass
+class GenerationStats:
+    """ Timings of one streamed generation. """
+    n_tokens: int = 0
+    # Seconds from sending the prompt to the first token; this covers prompt evaluation (prefill)
+    time_to_first_token: float = 0.0
+    # Seconds from sending the prompt to the last token consumed
+    elapsed: float = 0.0
+    # Whether generation was cut short at the paragraph boundary
+    stopped_early: bool = False
+
+    @property
+    def tokens_per_second(self) -> float:
+        """ Decode speed: tokens after the first, over the time spent generating them. """
+        decode_time = self.elapsed - self.time_to_first_token
+        return (self.n_tokens - 1) / decode_time if self.n_tokens > 1 and decode_time > 0 else 0.0
+
+    def summary(self) -> str:
+        return (f"{self.n_tokens} tokens, time to first token {self.time_to_first_token:.2f}s, "
+                f"{self.tokens_per_second:.1f} tokens/s, total {self.elapsed:.2f}s"
+                + (" (stopped at the paragraph boundary)" if self.stopped_early else ""))
+
+
+def print_token(text: str) -> None:
+    """ An on_token callback writing text to stdout as soon as it arrives. """
+    sys.stdout.write(text)
+    sys.stdout.flush()
+
+
+def stream_first_paragraph(llm: Callable, prompt: str, boundary: str = '\n\n',
+                           on_token: Optional[Callable[[str], None]] = None,
+                           **generate_kwargs: Any) -> Tuple[str, GenerationStats]:
+    """
+    Streams a completion and stops generating at the end of its first paragraph.
+
+    Tokens are passed to on_token as they arrive. Once the text (ignoring
+    leading whitespace) contains the boundary, the llama_cpp stream is
+    closed, so the rest of the answer is never generated instead of being
+    generated and then thrown away.
+
+    Args:
+        llm: A llama_cpp.Llama model, or any callable with the same streaming interface.
+        prompt (str): The prompt.
+        boundary (str, optional): The text that ends the first paragraph. Default is '\\n\\n'.
+        on_token (callable, optional): Called with each new piece of the answer, e.g. print_token.
+        **generate_kwargs: Passed to the model, e.g. max_tokens=512, stop=["Q:"].
+
+    Returns:
+        The first paragraph, stripped, and its GenerationStats.
+    """
+    stats = GenerationStats()
+    text, emitted = '', 0
+    t0 = time.perf_counter()
+    stream = llm(prompt, stream=True, **generate_kwargs)
+    try:
+        for chunk in stream:
+            now = time.perf_counter() - t0
+            if stats.n_tokens == 0:
+                stats.time_to_first_token = now
+            stats.n_tokens += 1
+            stats.elapsed = now
+            text += chunk['choices'][0]['text']
+
+            paragraph = text.lstrip()
+            end = paragraph.find(boundary)
+            if end >= 0:
+                paragraph = paragraph[:end]
+            # Hold back trailing whitespace, it may turn out to be the start of the boundary
+            visible = paragraph.rstrip()
+            if on_token is not None and len(visible) > emitted:
+                on_token(visible[emitted:])
+                emitted = len(visible)
+            if end >= 0:
+                stats.stopped_early = True
+                break
+    finally:
+        # Closing the generator stops llama_cpp from evaluating further tokens
+        close = getattr(stream, 'close', None)
+        if close is not None:
+            close()
+
+    paragraph = text.lstrip()
+    return paragraph.split(boundary, 1)[0].strip(), stats
+
+
+def _common_prefix(a: Sequence[int], b: Sequence[int]) -> int:
+    n = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        n += 1
+    return n
+
+
+class PromptStateCache:
+    """
+    Saves llama_cpp evaluation state at shared prompt prefixes and restores it,
+    so prompts starting with an already evaluated prefix skip its prefill.
+
+    Call prefill before generating. It restores the longest cached prefix of
+    the prompt, then evaluates and saves the state at each checkpoint, e.g.
+    after each Background source of a RAG prompt. llama_cpp then only
+    evaluates the rest of the prompt when it is called (see
+    helpers.rag_context for get_context_prompt and question_offset):
+
+        prompt = get_context_prompt(question, context)
+        cache = PromptStateCache(LLM, max_bytes=2 * 2 ** 30)
+        cache.prefill(prompt, checkpoints=[question_offset(question, context)])
+        LLM(prompt, max_tokens=512)
+
+    llama_cpp on its own only reuses the prefix shared with the previous
+    prompt; this cache keeps many prefixes, such as the same sources
+    retrieved for different phrasings of a question. States hold the
+    model's KV cache for their tokens (around 128 KiB per token for an 8B
+    Llama 3), so they are evicted least recently used first once their
+    total size exceeds max_bytes.
+
+    A cache belongs to one model and is not thread safe, like the model itself.
+
+    Args:
+        llm: A llama_cpp.Llama model.
+        max_bytes (int, optional): Maximum total size of the saved states. Default is 2 GiB.
+        min_tokens (int, optional): Checkpoints shorter than this are not saved. Default is 16.
+    """
+
+    def __init__(self, llm, max_bytes: int = 2 * 2 ** 30, min_tokens: int = 16):
+        self.llm = llm
+        self.max_bytes = max_bytes
+        self.min_tokens = min_tokens
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Prompt tokens whose prefill was skipped
+        self.tokens_reused = 0
+        self.n_bytes = 0
+        self._states: "OrderedDict[Tuple[int, ...], Any]" = OrderedDict()
+
+    def _tokenize(self, text: str) -> List[int]:
+        # The same tokenization llama_cpp applies to a completion prompt
+        return self.llm.tokenize(text.encode('utf-8'), special=True)
+
+    def _store(self, key: Tuple[int, ...], state) -> None:
+        size = state.llama_state_size
+        if size > self.max_bytes:
+            return
+        self._states[key] = state
+        self.n_bytes += size
+        while self.n_bytes > self.max_bytes:
+            _, evicted = self._states.popitem(last=False)
+            self.n_bytes -= evicted.llama_state_size
+            self.evictions += 1
+
+    def prefill(self, prompt: str, checkpoints: Iterable[int] = ()) -> int:
+        """
+        Prepares the model to generate from prompt.
+
+        Args:
+            prompt (str): The prompt about to be generated from.
+            checkpoints (iterable of int, optional): Character offsets into the prompt
+                where the evaluation state is saved for reuse by later prompts.
+
+        Returns:
+            The number of prompt tokens whose evaluation was skipped.
+        """
+        llm = self.llm
+        tokens = self._tokenize(prompt)
+        lengths = set()
+        for offset in checkpoints:
+            prefix = self._tokenize(prompt[:offset])
+            # A prefix may tokenize differently on its own, only its exact tokens can be reused
+            if len(prefix) >= self.min_tokens and tokens[:len(prefix)] == prefix:
+                lengths.add(len(prefix))
+
+        # The model still holds the state of the previous prompt, which may share a prefix
+        current = _common_prefix(llm.input_ids[:llm.n_tokens].tolist(), tokens)
+        best = max((k for k in self._states if len(k) > current and tuple(tokens[:len(k)]) == k),
+                   key=len, default=None)
+        if best is not None:
+            llm.load_state(self._states[best])
+            self._states.move_to_end(best)
+            current = len(best)
+            self.hits += 1
+        else:
+            self.misses += 1
+        reused = current
+
+        for n in sorted(lengths):
+            if n <= current:
+                continue
+            # llama_cpp drops the evaluated tokens after n_tokens from its KV cache when evaluating
+            llm.n_tokens = current
+            llm.eval(tokens[current:n])
+            current = n
+            self._store(tuple(tokens[:n]), llm.save_state())
+
+        self.tokens_reused += reused
+        return reused
+
+    def clear(self) -> None:
+        self._states.clear()
+        self.n_bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """ Hit/miss counters and current size. """
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits, 'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'entries': len(self._states), 'mib': self.n_bytes / 2 ** 20,
+            'evictions': self.evictions, 'tokens_reused': self.tokens_reused,
+        }
+
+
+class StartupTimeline:
+    """
+    Records when the steps of a pipeline start and end, to show how much of
+    their time overlapped:
+
+        timeline = StartupTimeline()
+        with timeline.span('create index'):
+            mq.create_index(index_name)
+        print(timeline.summary())
+
+    Waiting spans (wait=True), such as blocking on a model still loading,
+    are shown but not counted as work.
+    """
+
+    def __init__(self):
+        self.t0 = time.perf_counter()
+        # (name, start, end, wait), in seconds since the timeline was created
+        self.spans: List[Tuple[str, float, float, bool]] = []
+        self._lock = threading.Lock()
+
+    def add(self, name: str, start: float, end: float, wait: bool = False) -> None:
+        """ Records a span from perf_counter() timestamps. """
+        with self._lock:
+            self.spans.append((name, start - self.t0, end - self.t0, wait))
+
+    @contextmanager
+    def span(self, name: str, wait: bool = False) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, start, time.perf_counter(), wait)
+
+    @property
+    def wall_clock(self) -> float:
+        """ Seconds from the start of the timeline to the end of its last span. """
+        return max((end for _, _, end, _ in self.spans), default=0.0)
+
+    @property
+    def work(self) -> float:
+        """ The total seconds of the non-waiting spans, what running them one after another would take. """
+        return sum(end - start for _, start, end, wait in self.spans if not wait)
+
+    def summary(self, width: int = 40) -> str:
+        total = self.wall_clock or 1.0
+        lines = []
+        for name, start, end, wait in sorted(self.spans, key=lambda s: s[1]):
+            a, b = int(start / total * width), max(int(start / total * width) + 1, int(end / total * width))
+            bar = ' ' * a + ('.' if wait else '#') * (b - a)
+            lines.append(f"{name:<24} {start:>7.2f}s -> {end:>7.2f}s |{bar:<{width}}|")
+        lines.append(f"wall clock {self.wall_clock:.2f}s, sequential {self.work:.2f}s, "
+                     f"overlap saved {max(0.0, self.work - self.wall_clock):.2f}s")
+        return '\n'.join(lines)
+
+
+class BackgroundLoader:
+    """
+    Runs a slow load, such as constructing a llama_cpp.Llama model, on a
+    background thread, so other work can run while it loads:
+
+        loader = BackgroundLoader(lambda: Llama(model_path=...), timeline=timeline, name='load LLM')
+        ...                       # create the index, add documents, search
+        LLM = loader.result()     # blocks only if the model is still loading
+
+    llama_cpp loads through ctypes, which releases the GIL, so the load
+    overlaps with Python work and Marqo requests alike.
+
+    Args:
+        load (callable): Called without arguments on the background thread; its result is returned by result().
+        timeline (StartupTimeline, optional): Records the load, and any time spent waiting for it.
+        name (str, optional): The name of the load on the timeline. Default is 'load model'.
+    """
+
+    def __init__(self, load: Callable[[], Any], timeline: Optional[StartupTimeline] = None,
+                 name: str = 'load model'):
+        self.timeline = timeline
+        self.name = name
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='background-loader')
+        self._future = executor.submit(self._run, load)
+        executor.shutdown(wait=False)
+
+    def _run(self, load: Callable[[], Any]) -> Any:
+        if self.timeline is None:
+            return load()
+        with self.timeline.span(self.name):
+            return load()
+
+    def done(self) -> bool:
+        return self._future.done()
+
+    def result(self) -> Any:
+        """ The loaded object, waiting for the load to finish first if needed. Re-raises errors of the load. """
+        if self.timeline is None or self._future.done():
+            return self._future.result()
+        with self.timeline.span(f"wait for {self.name}", wait=True):
+            return self._future.result()
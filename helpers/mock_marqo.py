@@ -0,0 +1,482 @@
+"""
+A local stand-in for the Marqo HTTP API, for benchmarking the tutorials offline.
+
+It implements the endpoints the tutorials use (creating and deleting indexes,
+add_documents, search, get_document(s), get_stats, delete_documents, embed)
+with an in-memory store and simulated inference cost: every add_documents
+request holds one of ``inference_workers`` slots for
+``batch_overhead + doc_latency * documents`` seconds (``image_latency`` per
+image pointer), and every tensor or hybrid search holds one for
+``search_latency`` seconds. Embeddings are deterministic hashed
+bag-of-words vectors, so searches return stable, roughly sensible results.
+With ``fetch_images`` it also downloads every image pointer and decodes and
+resizes it to 224px like Marqo's CLIP preprocessing (decoding needs
+Pillow), so the cost of large source images shows up in processingTimeMs
+and in the ``image_bytes`` stat.
+
+Run it in place of the docker container so the unmodified tutorials talk to it:
+
+    python helpers/mock_marqo.py --port 8882 --doc-latency 0.01
+
+or start it from Python:
+
+    with MockMarqo(doc_latency=0.01) as server:
+        mq = Client(server.url)
+"""
+
+import argparse
+import functools
+import hashlib
+import io
+import json
+import math
+import re
+import socket
+import threading
+import time
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlparse, unquote, parse_qs
+
+try:
+    from PIL import Image
+except ImportError:  # pragma: no cover - optional dependency
+    Image = None
+
+# Reported to clients; the Python client warns when the server is older than it supports
+MARQO_VERSION = "2.24.0"
+VECTOR_DIM = 64
+TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_RE.findall(str(text).lower())
+
+
+@functools.lru_cache(maxsize=1 << 16)
+def _token_slot(token: str):
+    h = int.from_bytes(hashlib.md5(token.encode('utf-8')).digest()[:4], 'little')
+    return h % VECTOR_DIM, 1.0 if h & 1 << 31 else -1.0
+
+
+def embed_text(text: str) -> List[float]:
+    """ A deterministic, normalised hashed bag-of-words vector standing in for a model embedding. """
+    vector = [0.0] * VECTOR_DIM
+    for token in tokenize(text):
+        slot, sign = _token_slot(token)
+        vector[slot] += sign
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+
+def embed_query(q: Any) -> List[float]:
+    """ Embeds a string query or a weighted dict query the way Marqo combines them. """
+    if isinstance(q, dict):
+        vector = [0.0] * VECTOR_DIM
+        for text, weight in q.items():
+            vector = [v + weight * e for v, e in zip(vector, embed_text(text))]
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+    return embed_text(q)
+
+
+def is_pointer(value: Any) -> bool:
+    return isinstance(value, str) and value.startswith(('http://', 'https://'))
+
+
+_FILTER_TOKEN = re.compile(r'\s*(\(|\)|AND\b|OR\b|[^\s():]+:(?:\([^)]*\)|\[[^\]]*\]|"[^"]*"|[^\s()]+))')
+
+
+def matches_filter(doc: dict, filter_string: Optional[str]) -> bool:
+    """
+    Evaluates the subset of Marqo's filter DSL the tutorials use: ``field:value``,
+    ``field:(value with spaces)`` and ``field:[low TO high]`` terms joined by AND / OR,
+    where AND binds tighter than OR, grouped with parentheses.
+    """
+    if not filter_string:
+        return True
+    tokens, end = [], 0
+    for match in _FILTER_TOKEN.finditer(filter_string):
+        if match.start() != end:
+            break
+        tokens.append(match.group(1))
+        end = match.end()
+    if filter_string[end:].strip():
+        raise ValueError(f"cannot parse filter {filter_string!r} at {filter_string[end:]!r}")
+
+    def parse_or(i):
+        value, i = parse_and(i)
+        while i < len(tokens) and tokens[i] == 'OR':
+            right, i = parse_and(i + 1)
+            value = value or right
+        return value, i
+
+    def parse_and(i):
+        value, i = parse_atom(i)
+        while i < len(tokens) and tokens[i] == 'AND':
+            right, i = parse_atom(i + 1)
+            value = value and right
+        return value, i
+
+    def parse_atom(i):
+        if i >= len(tokens) or tokens[i] in (')', 'AND', 'OR'):
+            raise ValueError(f"cannot parse filter {filter_string!r}")
+        if tokens[i] == '(':
+            value, i = parse_or(i + 1)
+            if i >= len(tokens) or tokens[i] != ')':
+                raise ValueError(f"unbalanced parentheses in filter {filter_string!r}")
+            return value, i + 1
+        return _matches_term(doc, tokens[i]), i + 1
+
+    value, i = parse_or(0)
+    if i != len(tokens):
+        raise ValueError(f"cannot parse filter {filter_string!r}")
+    return value
+
+
+def _matches_term(doc: dict, term: str) -> bool:
+    field, _, value = term.partition(':')
+    actual = doc.get(field)
+    if actual is None:
+        return False
+    range_match = re.fullmatch(r'\[\s*(\S+)\s+TO\s+(\S+)\s*\]', value)
+    if range_match:
+        low, high = range_match.groups()
+        return (low == '*' or str(actual) >= low) and (high == '*' or str(actual) <= high)
+    return str(actual) == value.strip('()"')
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # The default backlog of 5 drops connections when many clients connect at once
+    request_queue_size = 1024
+
+
+class MockIndex:
+    def __init__(self, name: str, settings: dict):
+        self.name = name
+        self.settings = settings
+        self.documents: Dict[str, dict] = {}
+        self.vectors: Dict[str, List[float]] = {}
+        self.tokens: Dict[str, Counter] = {}
+        self.lock = threading.Lock()
+        self._next_id = 0
+
+    def add(self, docs: List[dict], tensor_fields: List[str]) -> List[dict]:
+        items = []
+        with self.lock:
+            for doc in docs:
+                if '_id' not in doc:
+                    self._next_id += 1
+                    doc = {**doc, '_id': f"mock-{self._next_id}"}
+                _id = str(doc['_id'])
+                text = ' '.join(str(v) for k, v in doc.items() if k != '_id' and not is_pointer(v))
+                tensor_text = ' '.join(str(doc[f]) for f in tensor_fields if f in doc) or text
+                self.documents[_id] = doc
+                self.vectors[_id] = embed_text(tensor_text)
+                self.tokens[_id] = Counter(tokenize(text))
+                items.append({'_id': _id, 'result': 'created', 'status': 201})
+        return items
+
+    def get(self, _id: str, expose_facets: bool = False) -> dict:
+        doc = self.documents.get(_id)
+        if doc is None:
+            return {'_id': _id, '_found': False}
+        doc = {**doc, '_found': True}
+        if expose_facets:
+            doc['_tensor_facets'] = [{'_embedding': self.vectors[_id]}]
+        return doc
+
+    def delete(self, ids: List[str]) -> List[dict]:
+        items = []
+        with self.lock:
+            for _id in ids:
+                found = self.documents.pop(_id, None) is not None
+                self.vectors.pop(_id, None)
+                self.tokens.pop(_id, None)
+                items.append({'_id': _id, 'status': 200 if found else 404,
+                              'result': 'deleted' if found else 'not_found'})
+        return items
+
+    def search(self, body: dict) -> List[dict]:
+        q = body.get('q') or ''
+        method = str(body.get('searchMethod', 'TENSOR')).upper()
+        limit, offset = body.get('limit', 10), body.get('offset', 0)
+        with self.lock:
+            candidates = [i for i, d in self.documents.items() if matches_filter(d, body.get('filter'))]
+            scored = []
+            if method in ('TENSOR', 'HYBRID'):
+                query_vector = embed_query(q)
+                tensor = {i: sum(a * b for a, b in zip(query_vector, self.vectors[i])) for i in candidates}
+            if method in ('LEXICAL', 'HYBRID'):
+                terms = tokenize(' '.join(q) if isinstance(q, dict) else q)
+                lexical = {i: sum(self.tokens[i][t] for t in terms) for i in candidates}
+            for i in candidates:
+                if method == 'LEXICAL':
+                    score = float(lexical[i])
+                    if not score:
+                        continue
+                elif method == 'HYBRID':
+                    score = 0.5 * tensor[i] + 0.5 * min(1.0, lexical[i] / 10)
+                else:
+                    score = tensor[i]
+                scored.append((score, i))
+            scored.sort(reverse=True)
+            hits = []
+            for score, i in scored[offset:offset + limit]:
+                doc = self.documents[i]
+                hit = {**doc, '_id': i, '_score': score}
+                if method != 'LEXICAL' and body.get('showHighlights', True):
+                    field = next((k for k, v in doc.items() if k != '_id' and isinstance(v, str)), None)
+                    hit['_highlights'] = [{field: doc[field][:200]}] if field else []
+                attributes = body.get('attributesToRetrieve')
+                if attributes is not None:
+                    hit = {k: v for k, v in hit.items() if k in attributes or k.startswith('_')}
+                hits.append(hit)
+            return hits
+
+
+class MockMarqo:
+    """
+    An in-process mock Marqo server.
+
+    Args:
+        host (str, optional): Interface to listen on. Default is '127.0.0.1'.
+        port (int, optional): Port to listen on, 0 picks a free one. Default is 0.
+        doc_latency (float, optional): Simulated inference seconds per text document. Default is 0.
+        image_latency (float, optional): Simulated seconds per image pointer in a document. Default is doc_latency.
+        batch_overhead (float, optional): Fixed simulated seconds per add_documents request. Default is 0.
+        search_latency (float, optional): Simulated query embedding seconds per tensor/hybrid search. Default is 0.
+        lexical_latency (float, optional): Simulated seconds per lexical search. Default is 0.
+        inference_workers (int, optional): Requests that can be "inferring" at the same time. Default is 1.
+        fetch_images (bool, optional): Download, decode and resize image pointers. Default is False.
+        image_download_threads (int, optional): Images of a request downloaded at the same time. Default is 8.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, doc_latency: float = 0.0,
+                 image_latency: Optional[float] = None, batch_overhead: float = 0.0,
+                 search_latency: float = 0.0, lexical_latency: float = 0.0, inference_workers: int = 1,
+                 fetch_images: bool = False, image_download_threads: int = 8):
+        self.doc_latency = doc_latency
+        self.image_latency = doc_latency if image_latency is None else image_latency
+        self.batch_overhead = batch_overhead
+        self.search_latency = search_latency
+        self.lexical_latency = lexical_latency
+        self.inference = threading.BoundedSemaphore(inference_workers)
+        self.fetch_images = fetch_images
+        self.image_download_threads = image_download_threads
+        self.indexes: Dict[str, MockIndex] = {}
+        self.stats = Counter()
+        self._stats_lock = threading.Lock()
+
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def setup(self):
+                super().setup()
+                # Headers and body are written separately; without this, Nagle's algorithm adds ~40ms per response
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            def log_message(self, format, *args):
+                pass
+
+            def _handle(self, method):
+                length = int(self.headers.get('Content-Length') or 0)
+                raw = self.rfile.read(length) if length else b''
+                mock.count('requests')
+                mock.count('bytes_received', len(raw))
+                try:
+                    body = json.loads(raw) if raw else None
+                    url = urlparse(self.path)
+                    status, response = mock.route(method, url.path, body, parse_qs(url.query))
+                except Exception as e:
+                    status, response = 500, {'message': repr(e), 'code': 'internal', 'type': 'internal'}
+                payload = json.dumps(response).encode('utf-8')
+                mock.count('bytes_sent', len(payload))
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_GET(self):
+                self._handle('GET')
+
+            def do_POST(self):
+                self._handle('POST')
+
+            def do_PUT(self):
+                self._handle('PUT')
+
+            def do_DELETE(self):
+                self._handle('DELETE')
+
+        self.server = _Server((host, port), Handler)
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, key: str, n: int = 1):
+        with self._stats_lock:
+            self.stats[key] += n
+
+    def simulate(self, seconds: float):
+        """ Occupies an inference worker for the given time. """
+        if seconds > 0:
+            with self.inference:
+                time.sleep(seconds)
+
+    def start(self) -> 'MockMarqo':
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self) -> 'MockMarqo':
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    @staticmethod
+    def error(status: int, code: str, message: str):
+        return status, {'message': message, 'code': code, 'type': 'invalid_request', 'link': ''}
+
+    def route(self, method: str, path: str, body: Any, query: Optional[Dict[str, List[str]]] = None):
+        parts = [unquote(p) for p in path.strip('/').split('/') if p]
+        if not parts:
+            return 200, {'message': 'Welcome to Marqo', 'version': MARQO_VERSION}
+        if parts == ['indexes']:
+            return 200, {'results': [{'indexName': name} for name in self.indexes]}
+        if parts[0] in ('models', 'device', 'health'):
+            return 200, {'models': [], 'status': 'green'}
+        if parts[0] != 'indexes' or len(parts) < 2:
+            return self.error(404, 'not_found', f"unknown path {path}")
+
+        name, rest = parts[1], parts[2:]
+        if not rest and method == 'POST':
+            if name in self.indexes:
+                return self.error(409, 'index_already_exists', f"index {name} already exists")
+            self.indexes[name] = MockIndex(name, body or {})
+            return 200, {'acknowledged': True, 'index': name}
+
+        index = self.indexes.get(name)
+        if index is None:
+            return self.error(404, 'index_not_found', f"index {name} not found")
+
+        if not rest and method == 'DELETE':
+            del self.indexes[name]
+            return 200, {'acknowledged': True}
+        if rest == ['documents'] and method == 'POST':
+            return self.add_documents(index, body)
+        if rest == ['documents', 'delete-batch']:
+            return 200, {'index_name': name, 'status': 'succeeded', 'type': 'documentDeletion',
+                         'items': index.delete(body or []), 'details': {}}
+        expose_facets = (query or {}).get('expose_facets', ['false'])[0].lower() == 'true'
+        if rest == ['documents'] and method == 'GET':
+            return 200, {'results': [index.get(_id, expose_facets) for _id in body or []]}
+        if rest[:1] == ['documents'] and len(rest) == 2:
+            doc = index.get(rest[1], expose_facets)
+            if not doc.pop('_found'):
+                return self.error(404, 'document_not_found', f"document {rest[1]} not found")
+            return 200, doc
+        if rest == ['search']:
+            method_name = str(body.get('searchMethod', 'TENSOR')).upper()
+            t0 = time.perf_counter()
+            self.simulate(self.lexical_latency if method_name == 'LEXICAL' else self.search_latency)
+            hits = index.search(body)
+            self.count('searches')
+            return 200, {'hits': hits, 'query': body.get('q'), 'limit': body.get('limit', 10),
+                         'offset': body.get('offset', 0),
+                         'processingTimeMs': (time.perf_counter() - t0) * 1000}
+        if rest == ['embed']:
+            content = body.get('content')
+            contents = content if isinstance(content, list) else [content]
+            self.simulate(self.search_latency * len(contents))
+            return 200, {'content': content, 'embeddings': [embed_query(c) for c in contents],
+                         'processingTimeMs': 0}
+        if rest == ['stats']:
+            return 200, {'numberOfDocuments': len(index.documents), 'numberOfVectors': len(index.vectors)}
+        if rest == ['settings']:
+            return 200, index.settings
+        if rest == ['health']:
+            return 200, {'status': 'green'}
+        return self.error(404, 'not_found', f"unknown path {path}")
+
+    def load_image(self, url: str) -> int:
+        """ Downloads an image pointer and preprocesses it like Marqo's CLIP models; returns its size in bytes. """
+        with urllib.request.urlopen(url, timeout=10) as response:
+            data = response.read()
+        if Image is not None:
+            img = Image.open(io.BytesIO(data)).convert('RGB')
+            scale = 224 / min(img.size)
+            img.resize((max(224, round(img.width * scale)), max(224, round(img.height * scale))), Image.BICUBIC)
+        self.count('image_bytes', len(data))
+        return len(data)
+
+    def add_documents(self, index: MockIndex, body: dict):
+        t0 = time.perf_counter()
+        docs = body.get('documents', [])
+        tensor_fields = body.get('tensorFields') or []
+        n_images = sum(1 for d in docs for v in d.values() if is_pointer(v))
+        failed = {}
+        if self.fetch_images and n_images:
+            pointers = [(n, v) for n, d in enumerate(docs) for v in d.values() if is_pointer(v)]
+            with ThreadPoolExecutor(max_workers=self.image_download_threads) as executor:
+                futures = [(n, v, executor.submit(self.load_image, v)) for n, v in pointers]
+                for n, v, future in futures:
+                    try:
+                        future.result()
+                    except Exception as e:
+                        failed.setdefault(n, f"Could not find image found at `{v}`. Reason: {e!r}")
+        self.simulate(self.batch_overhead + self.doc_latency * (len(docs) - n_images) +
+                      self.image_latency * n_images)
+        items = index.add([d for n, d in enumerate(docs) if n not in failed], tensor_fields)
+        for n in sorted(failed):
+            items.insert(n, {'_id': str(docs[n].get('_id', '')), 'status': 400, 'code': 'invalid_argument',
+                             'error': failed[n]})
+        self.count('documents', len(docs) - len(failed))
+        self.count('images', n_images)
+        return 200, {'errors': bool(failed), 'index_name': index.name, 'items': items,
+                     'processingTimeMs': (time.perf_counter() - t0) * 1000}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a mock Marqo server for offline benchmarking.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8882)
+    parser.add_argument('--doc-latency', type=float, default=0.0, help="simulated seconds per text document")
+    parser.add_argument('--image-latency', type=float, default=None, help="simulated seconds per image")
+    parser.add_argument('--batch-overhead', type=float, default=0.0, help="simulated seconds per add_documents call")
+    parser.add_argument('--search-latency', type=float, default=0.0, help="simulated seconds per tensor search")
+    parser.add_argument('--lexical-latency', type=float, default=0.0, help="simulated seconds per lexical search")
+    parser.add_argument('--inference-workers', type=int, default=1, help="concurrent simulated inferences")
+    parser.add_argument('--fetch-images', action='store_true', help="download, decode and resize image pointers")
+    args = parser.parse_args()
+
+    server = MockMarqo(host=args.host, port=args.port, doc_latency=args.doc_latency,
+                       image_latency=args.image_latency, batch_overhead=args.batch_overhead,
+                       search_latency=args.search_latency, lexical_latency=args.lexical_latency,
+                       inference_workers=args.inference_workers, fetch_images=args.fetch_images)
+    print(f"mock Marqo listening on {server.url}", flush=True)
+    try:
+        server.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server.server_close()
+
+
+if __name__ == '__main__':
+    main()
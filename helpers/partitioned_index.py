@@ -0,0 +1,213 @@
+import datetime
+import re
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+from marqo.errors import MarqoWebError
+
+Date = Union[str, datetime.date]
+
+PERIODS = {
+    'month': lambda d: f"{d.year:04d}-{d.month:02d}",
+    'year': lambda d: f"{d.year:04d}",
+}
+
+# The partition keys each period produces, to tell partitions from other indexes sharing the base name
+PERIOD_KEYS = {
+    'month': re.compile(r'\d{4}-(0[1-9]|1[0-2])'),
+    'year': re.compile(r'\d{4}'),
+}
+
+
+def _to_date(value: Date) -> datetime.date:
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, datetime.date):
+        return value
+    return datetime.date.fromisoformat(str(value)[:10])
+
+
+def _period_bounds(period: str, key: str) -> Tuple[datetime.date, datetime.date]:
+    """ The first and last day of a partition. """
+    if period == 'year':
+        year = int(key)
+        return datetime.date(year, 1, 1), datetime.date(year, 12, 31)
+    year, month = map(int, key.split('-'))
+    first = datetime.date(year, month, 1)
+    next_month = datetime.date(year + month // 12, month % 12 + 1, 1)
+    return first, next_month - datetime.timedelta(days=1)
+
+
+class PartitionedIndex:
+    """
+    A set of Marqo indexes, one per month (or year) of a date field, used like one index.
+
+    Documents are written to the partition of their date, named
+    ``{base_name}-{YYYY-MM}``; the partition is created on first use. A
+    search for a date or a date range only searches the partitions it
+    overlaps, in parallel, and merges their hits by score. Partitions only
+    partly inside the range are filtered on the date field; partitions fully
+    inside it are searched without a date filter. Dropping old news
+    deletes whole indexes instead of deleting documents one by one:
+
+        news = PartitionedIndex(mq, 'news-index', create_settings={'model': 'hf/e5-base-v2'})
+        news.add_documents(DOCUMENTS, tensor_fields=["Title", "Description"])
+        results = news.search(question, start='2024-08-01', end='2024-08-03', limit=5)
+        news.drop_before('2024-01-01')
+
+    Dates are ISO strings ('2024-08-03') or datetime.date objects. Scores
+    are merged as they are, which suits TENSOR search since every partition
+    uses the same model; lexical scores are only comparable between
+    similar partitions.
+
+    Args:
+        mq (marqo.Client): The Marqo client.
+        base_name (str): The prefix of the partition index names.
+        date_field (str, optional): The document field holding the date. Default is 'date'.
+        period (str, optional): 'month' or 'year'. Default is 'month'.
+        create_settings (dict, optional): Keyword arguments for mq.create_index of new partitions.
+        max_workers (int, optional): Partitions searched at the same time. Default is 8.
+    """
+
+    def __init__(self, mq, base_name: str, date_field: str = 'date', period: str = 'month',
+                 create_settings: Optional[Dict[str, Any]] = None, max_workers: int = 8):
+        if period not in PERIODS:
+            raise ValueError(f"period must be one of {sorted(PERIODS)}")
+        self.mq = mq
+        self.base_name = base_name
+        self.date_field = date_field
+        self.period = period
+        self.create_settings = create_settings or {}
+        self.max_workers = max_workers
+        self._partitions: Optional[Dict[str, str]] = None
+        self._lock = threading.Lock()
+
+    def partition_key(self, date: Date) -> str:
+        """ The period a date belongs to, e.g. '2024-08'. """
+        return PERIODS[self.period](_to_date(date))
+
+    def index_name(self, key: str) -> str:
+        return f"{self.base_name}-{key}"
+
+    def partitions(self, refresh: bool = False) -> Dict[str, str]:
+        """ The existing partitions, as {period key: index name}, sorted by period. """
+        with self._lock:
+            if self._partitions is None or refresh:
+                prefix = f"{self.base_name}-"
+                partitions = {}
+                for index in self.mq.get_indexes()['results']:
+                    name = index['indexName']
+                    key = name[len(prefix):]
+                    if name.startswith(prefix) and PERIOD_KEYS[self.period].fullmatch(key):
+                        partitions[key] = name
+                self._partitions = dict(sorted(partitions.items()))
+            return dict(self._partitions)
+
+    def _ensure_partition(self, key: str) -> str:
+        if key not in self.partitions():
+            name = self.index_name(key)
+            try:
+                self.mq.create_index(name, **self.create_settings)
+            except MarqoWebError as e:
+                # Another writer may have created it in the meantime
+                if e.status_code != 409:
+                    raise
+            with self._lock:
+                self._partitions[key] = name
+                self._partitions = dict(sorted(self._partitions.items()))
+        return self.index_name(key)
+
+    def add_documents(self, documents: Iterable[dict], **add_documents_kwargs) -> Dict[str, Any]:
+        """
+        Adds documents to the partitions of their dates, creating missing partitions.
+
+        Args:
+            documents (iterable of dict): Documents with a date field.
+            **add_documents_kwargs: Passed to add_documents, e.g. tensor_fields or client_batch_size.
+
+        Returns:
+            dict: The add_documents response of each partition written, by period key.
+        """
+        by_partition: Dict[str, List[dict]] = defaultdict(list)
+        for doc in documents:
+            by_partition[self.partition_key(doc[self.date_field])].append(doc)
+        responses = {}
+        for key, docs in sorted(by_partition.items()):
+            index_name = self._ensure_partition(key)
+            responses[key] = self.mq.index(index_name).add_documents(docs, **add_documents_kwargs)
+        return responses
+
+    def _date_filter(self, key: str, start: Optional[datetime.date], end: Optional[datetime.date]) -> Optional[str]:
+        """ The filter restricting a partition to the range, or None if the whole partition is in it. """
+        first, last = _period_bounds(self.period, key)
+        lo, hi = max(first, start or first), min(last, end or last)
+        if lo == first and hi == last:
+            return None
+        days = [lo + datetime.timedelta(days=i) for i in range((hi - lo).days + 1)]
+        return '(' + ' OR '.join(f"{self.date_field}:{d.isoformat()}" for d in days) + ')'
+
+    def search(self, q: Optional[Any] = None, date: Optional[Date] = None, start: Optional[Date] = None,
+               end: Optional[Date] = None, limit: int = 10, filter_string: Optional[str] = None,
+               **search_kwargs) -> Dict[str, Any]:
+        """
+        Searches the partitions covering a date or a date range and merges the hits by score.
+
+        Args:
+            q: The query, as for marqo.Index.search.
+            date (optional): Only search this day.
+            start (optional): The first day of the range; the earliest partition if not given.
+            end (optional): The last day of the range; the latest partition if not given.
+            limit (int, optional): The number of merged hits to return. Default is 10.
+            filter_string (str, optional): An additional filter, combined with the date range.
+            **search_kwargs: Passed to search, e.g. search_method.
+
+        Returns:
+            dict: {'hits': [...], 'partitions': [searched index names], 'processingTimeMs': ...};
+            each hit has its partition's index name in '_index'.
+        """
+        if date is not None:
+            start = end = date
+        start = _to_date(start) if start is not None else None
+        end = _to_date(end) if end is not None else None
+        lo_key = self.partition_key(start) if start else None
+        hi_key = self.partition_key(end) if end else None
+        targets = {k: name for k, name in self.partitions().items()
+                   if (lo_key is None or k >= lo_key) and (hi_key is None or k <= hi_key)}
+
+        def search_partition(key):
+            filters = [f for f in (self._date_filter(key, start, end), filter_string) if f]
+            combined = ' AND '.join(f"({f})" for f in filters) if filters else None
+            res = self.mq.index(targets[key]).search(q, limit=limit, filter_string=combined, **search_kwargs)
+            for hit in res['hits']:
+                hit['_index'] = targets[key]
+            return res
+
+        if not targets:
+            return {'hits': [], 'partitions': [], 'processingTimeMs': 0}
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(targets))) as executor:
+            responses = list(executor.map(search_partition, targets))
+        hits = sorted((h for r in responses for h in r['hits']), key=lambda h: h.get('_score', 0.0), reverse=True)
+        return {
+            'hits': hits[:limit], 'partitions': list(targets.values()),
+            'processingTimeMs': max(r.get('processingTimeMs', 0) for r in responses),
+        }
+
+    def drop_partition(self, key: str) -> None:
+        """ Deletes a partition's index, e.g. drop_partition('2023-01'). """
+        name = self.partitions().get(key)
+        if name is not None:
+            self.mq.delete_index(name)
+            with self._lock:
+                self._partitions.pop(key, None)
+
+    def drop_before(self, date: Date) -> List[str]:
+        """ Deletes the partitions that end before date, and returns their index names. """
+        key = self.partition_key(date)
+        dropped = []
+        for k, name in self.partitions().items():
+            if k < key:
+                self.drop_partition(k)
+                dropped.append(name)
+        return dropped
@@ -0,0 +1,87 @@
+from collections import defaultdict
+from typing import Any, Dict, Iterable, Iterator, List
+
+from helpers.text_processing import chunk_spans
+
+
+def chunk_sources(documents: Iterable[dict], field: str = 'Description', char_len: int = 600,
+                  overlap: int = 150, boundary: str = 'sentence') -> Iterator[dict]:
+    """
+    Splits RAG source documents into overlapping chunks that remember where they came from.
+
+    Every document, short ones included, becomes one or more chunks. Each
+    chunk is a copy of its document with ``field`` cut down to the chunk
+    text, an ``_id`` of ``{parent _id}_{n}``, and the fields
+    ``parent_id``, ``chunk_index``, ``chunk_start`` and ``chunk_end``
+    (character offsets into the parent's field), which merge_chunks uses to
+    reassemble the spans retrieved for a query. Index the chunks instead of
+    the documents, so each vector covers one passage rather than a whole
+    article.
+
+    Args:
+        documents (iterable of dict): Documents with an ``_id``.
+        field (str, optional): The field to split. Default is 'Description'.
+        char_len (int, optional): The maximum character length of a chunk. Default is 600.
+        overlap (int, optional): Characters repeated at the start of the next chunk. Default is 150.
+        boundary (str, optional): Break on 'sentence' or 'paragraph' boundaries when possible,
+            or None to break anywhere. Default is 'sentence'.
+
+    Yields:
+        dict: The chunks, in document order.
+    """
+    if not 0 <= overlap < char_len:
+        raise ValueError("overlap must be at least 0 and smaller than char_len")
+    for doc in documents:
+        text = doc[field]
+        spans = chunk_spans(text, char_len, overlap, boundary) if text else [(0, 0)]
+        for n, (start, end) in enumerate(spans):
+            yield {**doc, '_id': f"{doc['_id']}_{n}", field: text[start:end], 'parent_id': doc['_id'],
+                   'chunk_index': n, 'chunk_start': start, 'chunk_end': end}
+
+
+def merge_chunks(hits: Iterable[Dict[str, Any]], field: str = 'Description',
+                 separator: str = ' ... ') -> List[Dict[str, Any]]:
+    """
+    Reassembles retrieved chunks into one passage per parent document.
+
+    Chunks of the same parent are put back in document order; overlapping
+    or adjacent chunks are joined into one continuous span, without
+    repeating the overlap, and separate spans are joined with separator.
+    Hits that are not chunks (no ``parent_id``) are passed through.
+
+    Args:
+        hits (iterable of dict): Search hits of an index of chunk_sources chunks.
+            Their ``parent_id``, ``chunk_start`` and ``chunk_end`` fields must be retrieved.
+        field (str, optional): The chunked field. Default is 'Description'.
+        separator (str, optional): Placed between non-adjacent spans. Default is ' ... '.
+
+    Returns:
+        list of dict: One hit per parent, with the best ``_score`` of its chunks and
+        its ``chunk_spans`` as [start, end] offsets, sorted by score.
+    """
+    by_parent: Dict[Any, List[Dict[str, Any]]] = defaultdict(list)
+    merged = []
+    for hit in hits:
+        if 'parent_id' in hit:
+            by_parent[hit['parent_id']].append(hit)
+        else:
+            merged.append(hit)
+
+    for parent_id, chunks in by_parent.items():
+        chunks.sort(key=lambda h: h['chunk_start'])
+        spans, texts = [], []
+        for chunk in chunks:
+            start, end, text = chunk['chunk_start'], chunk['chunk_end'], chunk[field]
+            if spans and start <= spans[-1][1]:
+                # Overlapping or adjacent: append only the part past the current span
+                if end > spans[-1][1]:
+                    texts[-1] += text[spans[-1][1] - start:]
+                    spans[-1][1] = end
+            else:
+                spans.append([start, end])
+                texts.append(text)
+        best = max(chunks, key=lambda h: h.get('_score', 0.0))
+        merged.append({**best, '_id': parent_id, field: separator.join(texts), 'chunk_spans': spans})
+
+    merged.sort(key=lambda h: h.get('_score', 0.0), reverse=True)
+    return merged
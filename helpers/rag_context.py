@@ -0,0 +1,285 @@
+import math
+import re
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+_WORD = re.compile(r"\w+")
+
+
+def shingles(text: str, n: int = 3) -> FrozenSet[str]:
+    """ The set of n-word shingles of text, lowercased, used to compare passages. """
+    words = _WORD.findall(text.lower())
+    if len(words) < n:
+        return frozenset([' '.join(words)]) if words else frozenset()
+    return frozenset(' '.join(words[i:i + n]) for i in range(len(words) - n + 1))
+
+
+def jaccard(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def get_context_prompt(question: str, context: str) -> str:
+    """ LLM prompt with text-based context from Marqo search, shared by the RAG guides, benchmarks and batch_rag. """
+    return f'Background: \n{context}\n\nQuestion: {question}\n\nAnswer:'
+
+
+def question_offset(question: str, context: str) -> int:
+    """
+    Where the question part starts in get_context_prompt(question, context), i.e. the end of the
+    prefix shared by prompts with the same context. Use it as a PromptStateCache checkpoint; it is
+    computed from the template, so a context or question quoting "Question:" does not move it.
+    """
+    return len(context) + get_context_prompt(question, '').index('Question:')
+
+
+def llama_token_counter(llm) -> Callable[[str], int]:
+    """ Counts tokens with a llama_cpp model's tokenizer, without the beginning of text token. """
+    return lambda text: len(llm.tokenize(text.encode('utf-8'), add_bos=False, special=True))
+
+
+def context_budget(count_tokens: Callable[[str], int], prompt_without_context: str,
+                   n_ctx: int = 4096, max_tokens: int = 512) -> int:
+    """
+    The number of tokens left for the context: the context window, less the
+    tokens reserved for the answer and the rest of the prompt.
+
+    Args:
+        count_tokens (callable): Counts the tokens of a text, e.g. llama_token_counter(LLM).
+        prompt_without_context (str): The prompt with an empty context, e.g. get_context_prompt(question, '').
+        n_ctx (int, optional): The model's context window. Default is 4096.
+        max_tokens (int, optional): The tokens reserved for the answer. Default is 512.
+    """
+    # One token for the beginning of text token llama_cpp adds to the prompt
+    return max(0, n_ctx - max_tokens - count_tokens(prompt_without_context) - 1)
+
+
+@dataclass
+class PackedContext:
+    """ The result of pack_context. """
+    text: str = ''
+    n_tokens: int = 0
+    budget: int = 0
+    # One entry per packed source: {'_id', 'title', 'score', 'tokens', 'truncated'}
+    sources: List[Dict[str, Any]] = field(default_factory=list)
+    # _ids of hits left out as near duplicates of a packed source, and because the budget ran out
+    duplicates: List[Any] = field(default_factory=list)
+    over_budget: List[Any] = field(default_factory=list)
+
+    def summary(self) -> str:
+        lines = [f"context: {self.n_tokens}/{self.budget} tokens from {len(self.sources)} sources, "
+                 f"{len(self.duplicates)} near duplicates and {len(self.over_budget)} hits over budget dropped"]
+        for i, source in enumerate(self.sources):
+            lines.append(f"  Source {i}) {source['tokens']:>5} tokens, score {source['score']:.3f}"
+                         f"{' (truncated)' if source['truncated'] else ''}: {source['title']}")
+        return '\n'.join(lines)
+
+
+def _truncate(text: str, fits: Callable[[str], bool]) -> Optional[str]:
+    """ The longest whole-word prefix of text for which fits is true, None if there is none. """
+    words = text.split()
+    lo, hi = 0, len(words)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if fits(' '.join(words[:mid])):
+            lo = mid
+        else:
+            hi = mid - 1
+    return ' '.join(words[:lo]) if lo else None
+
+
+def pack_context(hits: Iterable[Dict[str, Any]], count_tokens: Callable[[str], int], budget: int,
+                 title_field: str = 'Title', text_field: str = 'Description',
+                 duplicate_threshold: float = 0.8, min_tokens: int = 32) -> PackedContext:
+    """
+    Packs search hits into a RAG context of at most budget tokens.
+
+    Hits are taken greedily by descending _score, each as a line
+    ``Source {i}) {title} || {text}``. A hit whose text is a near duplicate
+    (Jaccard similarity of word shingles at least duplicate_threshold) of an
+    already packed one is skipped. A hit that does not fit is passed over and
+    the later, lower scored hits are still tried. Once every hit has been
+    tried, the best scored hit that did not fit is truncated at a word
+    boundary to the remaining budget, if at least min_tokens remain; the
+    other hits that did not fit are left out.
+
+    Args:
+        hits (iterable of dict): Search hits, e.g. results['hits'].
+        count_tokens (callable): Counts the tokens of a text, e.g. llama_token_counter(LLM).
+        budget (int): Maximum tokens of the context, e.g. from context_budget.
+        title_field (str, optional): The hit field used as title. Default is 'Title'.
+        text_field (str, optional): The hit field used as passage. Default is 'Description'.
+        duplicate_threshold (float, optional): Shingle similarity from which hits count as duplicates. Default is 0.8.
+        min_tokens (int, optional): Smallest remaining budget worth a truncated source. Default is 32.
+
+    Returns:
+        PackedContext: The context text and a per-source token report.
+    """
+    packed = PackedContext(budget=budget)
+    seen: List[FrozenSet[str]] = []
+    lines: List[str] = []
+    # Hits that did not fit whole, with their shingles, best scored first
+    too_long: List[Tuple[Dict[str, Any], FrozenSet[str]]] = []
+
+    def is_duplicate(hit_shingles):
+        return any(jaccard(hit_shingles, s) >= duplicate_threshold for s in seen)
+
+    def add(hit, hit_shingles, line, tokens, truncated):
+        lines.append(line)
+        seen.append(hit_shingles)
+        packed.n_tokens += tokens
+        packed.sources.append({'_id': hit.get('_id'), 'title': hit.get(title_field, ''),
+                               'score': hit.get('_score', 0.0), 'tokens': tokens, 'truncated': truncated})
+
+    for hit in sorted(hits, key=lambda h: h.get('_score', 0.0), reverse=True):
+        hit_shingles = shingles(hit.get(text_field, ''))
+        if is_duplicate(hit_shingles):
+            packed.duplicates.append(hit.get('_id'))
+            continue
+        line = f"Source {len(lines)}) {hit.get(title_field, '')} || {hit.get(text_field, '')}\n"
+        tokens = count_tokens(line)
+        if tokens > budget - packed.n_tokens:
+            too_long.append((hit, hit_shingles))
+            continue
+        add(hit, hit_shingles, line, tokens, truncated=False)
+
+    # Nothing later fits whole, so fill what is left with the start of the best scored hit that did not fit
+    remaining = budget - packed.n_tokens
+    for n, (hit, hit_shingles) in enumerate(too_long):
+        if remaining < min_tokens:
+            packed.over_budget.extend(h.get('_id') for h, _ in too_long[n:])
+            break
+        if is_duplicate(hit_shingles):
+            packed.duplicates.append(hit.get('_id'))
+            continue
+        prefix = f"Source {len(lines)}) {hit.get(title_field, '')} || "
+        text = _truncate(hit.get(text_field, ''), lambda t: count_tokens(f'{prefix}{t}...\n') <= remaining)
+        if text is None:
+            packed.over_budget.append(hit.get('_id'))
+            continue
+        line = f'{prefix}{text}...\n'
+        add(hit, hit_shingles, line, count_tokens(line), truncated=True)
+        packed.over_budget.extend(h.get('_id') for h, _ in too_long[n + 1:])
+        break
+
+    packed.text = ''.join(lines)
+    return packed
+
+
+def hit_vector(hit: Dict[str, Any]) -> Optional[List[float]]:
+    """ The normalised mean of a hit's ``_tensor_facets`` embeddings, or None if it has none. """
+    embeddings = [f['_embedding'] for f in hit.get('_tensor_facets') or [] if f.get('_embedding')]
+    if not embeddings:
+        return None
+    mean = [sum(values) / len(embeddings) for values in zip(*embeddings)]
+    norm = math.sqrt(sum(v * v for v in mean))
+    return [v / norm for v in mean] if norm else mean
+
+
+def fetch_hit_vectors(index, hits: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Adds each hit's ``_tensor_facets`` (its chunks and their embeddings) with
+    one ``get_documents(..., expose_facets=True)`` call, so select_mmr can
+    compare hits by vector. Call it on the hits as returned by search, before
+    merge_chunks.
+    """
+    if not hits:
+        return hits
+    response = index.get_documents([h['_id'] for h in hits], expose_facets=True)
+    facets = {d['_id']: d.get('_tensor_facets') for d in response['results'] if d.get('_found')}
+    return [{**h, '_tensor_facets': facets[h['_id']]} if facets.get(h['_id']) else h for h in hits]
+
+
+@dataclass
+class MMRSelection:
+    """ The result of select_mmr. """
+    hits: List[Dict[str, Any]] = field(default_factory=list)
+    n_candidates: int = 0
+    # How hits were compared: 'vectors' or 'shingles'
+    similarity: str = 'shingles'
+    # _ids of candidates left out as too similar to a selected hit
+    redundant: List[Any] = field(default_factory=list)
+    # Tokens of the k best scored candidates, of the redundant hits among them and of
+    # the selected hits, if count_tokens was given
+    tokens_top_k: int = 0
+    tokens_saved: int = 0
+    tokens_selected: int = 0
+
+    def summary(self) -> str:
+        return (f"selected {len(self.hits)} of {self.n_candidates} hits by {self.similarity}, "
+                f"{len(self.redundant)} redundant; the best scored hits alone "
+                f"would have spent {self.tokens_saved} of {self.tokens_top_k} tokens on redundant passages, "
+                f"the selected hits take {self.tokens_selected} tokens")
+
+
+def select_mmr(hits: Iterable[Dict[str, Any]], k: int = 5, relevance_weight: float = 0.7,
+               redundancy_threshold: Optional[float] = None, text_field: str = 'Description',
+               count_tokens: Optional[Callable[[str], int]] = None) -> MMRSelection:
+    """
+    Picks up to k relevant but mutually different hits by maximal marginal relevance.
+
+    Over-fetch from Marqo (e.g. limit=3 * k) and pass all the hits. Hits are
+    picked one at a time, each maximising
+    ``relevance_weight * relevance - (1 - relevance_weight) * similarity to the hits already picked``,
+    where relevance is the hit's _score scaled to [0, 1] over the
+    candidates. Hits at least redundancy_threshold similar to a picked hit
+    are never picked, so fewer than k hits are returned when the rest only
+    repeat them.
+
+    Hits are compared by cosine similarity of their vectors when every hit
+    has them (see fetch_hit_vectors), otherwise by Jaccard similarity of the
+    word shingles of text_field.
+
+    Args:
+        hits (iterable of dict): The candidate hits.
+        k (int, optional): The maximum number of hits to pick. Default is 5.
+        relevance_weight (float, optional): 1 ranks by score only, 0 by diversity only. Default is 0.7.
+        redundancy_threshold (float, optional): Similarity from which a hit is redundant.
+            Default is 0.9 for vectors and 0.5 for shingles.
+        text_field (str, optional): The hit field compared and counted. Default is 'Description'.
+        count_tokens (callable, optional): Counts tokens, to report the tokens saved.
+
+    Returns:
+        MMRSelection: The picked hits, in the order picked.
+    """
+    candidates = sorted(hits, key=lambda h: h.get('_score', 0.0), reverse=True)
+    selection = MMRSelection(n_candidates=len(candidates))
+    if not candidates:
+        return selection
+
+    vectors = [hit_vector(h) for h in candidates]
+    if all(v is not None for v in vectors):
+        selection.similarity = 'vectors'
+        similarity = lambda i, j: sum(a * b for a, b in zip(vectors[i], vectors[j]))
+    else:
+        features = [shingles(h.get(text_field, '')) for h in candidates]
+        similarity = lambda i, j: jaccard(features[i], features[j])
+    if redundancy_threshold is None:
+        redundancy_threshold = 0.9 if selection.similarity == 'vectors' else 0.5
+
+    scores = [h.get('_score', 0.0) for h in candidates]
+    lo, hi = min(scores), max(scores)
+    relevance = [(s - lo) / (hi - lo) if hi > lo else 1.0 for s in scores]
+    max_similarity = [0.0] * len(candidates)
+    remaining = list(range(len(candidates)))
+    picked = []
+    while remaining and len(picked) < k:
+        best = max(remaining, key=lambda i: relevance_weight * relevance[i]
+                   - (1 - relevance_weight) * max_similarity[i])
+        picked.append(best)
+        remaining.remove(best)
+        for i in remaining:
+            max_similarity[i] = max(max_similarity[i], similarity(best, i))
+        for i in [i for i in remaining if max_similarity[i] >= redundancy_threshold]:
+            selection.redundant.append(candidates[i].get('_id'))
+            remaining.remove(i)
+
+    selection.hits = [candidates[i] for i in picked]
+    if count_tokens is not None:
+        top_k = [count_tokens(h.get(text_field, '')) for h in candidates[:k]]
+        redundant = set(selection.redundant)
+        selection.tokens_top_k = sum(top_k)
+        selection.tokens_saved = sum(n for h, n in zip(candidates[:k], top_k) if h.get('_id') in redundant)
+        selection.tokens_selected = sum(count_tokens(h.get(text_field, '')) for h in selection.hits)
+    return selection
@@ -0,0 +1,183 @@
+import inspect
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+
+class SearchCache:
+    """
+    An opt-in, client-side cache of Marqo search results with LRU eviction and a TTL.
+
+    Wrap an index to use it; every other method passes straight through:
+
+        cache = SearchCache(max_entries=1024, ttl=300)
+        index = cache.index(mq.index(index_name))
+        index.search("what is air made of?")     # round trip to Marqo
+        index.search("what is air made of?")     # served from the cache
+
+    Results are keyed on the index name, the query (weighted dict queries
+    included, independent of key order) and every search argument, such as
+    search_method, filter_string and limit. Calling add_documents,
+    update_documents, delete_documents or delete through a wrapped index
+    drops all cached results of that index, and a search still in flight
+    during the write does not cache its possibly stale result. Changes made
+    to the index by other clients are only picked up once entries expire, so
+    choose the TTL accordingly.
+
+    Cached results are shared between callers; copy them before modifying them.
+
+    Args:
+        max_entries (int, optional): Maximum number of cached results. Default is 1024.
+        ttl (float, optional): Seconds a result stays valid, None for no expiry. Default is 300.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: Optional[float] = 300.0):
+        if max_entries < 1:
+            raise ValueError("max_entries must be at least 1")
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, Any]]" = OrderedDict()
+        # Bumped by every invalidation, for all indexes and per index
+        self._generation = 0
+        self._index_generations: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(index_name: str, q: Any, **search_kwargs) -> Tuple[str, str]:
+        """ The cache key of a search; equal for equivalent searches. """
+        search_kwargs = {k: v for k, v in search_kwargs.items() if v is not None}
+        if 'search_method' in search_kwargs:
+            # SearchMethods.TENSOR and 'tensor' are the same search
+            search_method = search_kwargs['search_method']
+            search_kwargs['search_method'] = str(getattr(search_method, 'value', search_method)).upper()
+        return index_name, json.dumps({'q': q, **search_kwargs}, sort_keys=True, default=str)
+
+    def get(self, key: Tuple[str, str]) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires, result = entry
+                if self.ttl is None or time.monotonic() < expires:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return result
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def generation(self, index_name: str) -> Tuple[int, int]:
+        """ A token that changes whenever the results of index_name are invalidated. """
+        with self._lock:
+            return self._generation, self._index_generations.get(index_name, 0)
+
+    def put(self, key: Tuple[str, str], result: Any, generation: Optional[Tuple[int, int]] = None) -> None:
+        """
+        Caches a search result.
+
+        Args:
+            key: The key from make_key.
+            result: The search result.
+            generation (optional): The index's generation() read before the search was sent. The result
+                is dropped if the index was invalidated since, as it may predate the write.
+        """
+        with self._lock:
+            if generation is not None and generation != (self._generation, self._index_generations.get(key[0], 0)):
+                return
+            expires = time.monotonic() + self.ttl if self.ttl is not None else 0.0
+            self._entries[key] = (expires, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, index_name: Optional[str] = None) -> None:
+        """
+        Drops cached results.
+
+        Args:
+            index_name (str, optional): Only drop the results of this index. Default drops everything.
+        """
+        with self._lock:
+            if index_name is None:
+                self._entries.clear()
+                self._generation += 1
+            else:
+                for key in [k for k in self._entries if k[0] == index_name]:
+                    del self._entries[key]
+                self._index_generations[index_name] = self._index_generations.get(index_name, 0) + 1
+            self.invalidations += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """ Hit/miss counters and current size. """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits, 'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'entries': len(self._entries), 'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
+
+    def index(self, index) -> 'CachedIndex':
+        """ Wraps a Marqo index, e.g. ``mq.index(index_name)``, so its searches go through this cache. """
+        return CachedIndex(index, self)
+
+
+class CachedIndex:
+    """ A Marqo index whose searches are served through a SearchCache, see SearchCache. """
+
+    def __init__(self, index, cache: SearchCache):
+        self._index = index
+        self.cache = cache
+
+    @property
+    def index_name(self) -> str:
+        return self._index.index_name
+
+    def search(self, *args, **kwargs) -> Dict[str, Any]:
+        """ Index.search, through the cache; takes the same positional and keyword arguments. """
+        # Key on argument names with the defaults filled in, so positional, keyword and
+        # default-valued calls share entries
+        signature = inspect.signature(self._index.search)
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        search_kwargs = dict(bound.arguments)
+        for name, parameter in signature.parameters.items():
+            if parameter.kind is parameter.VAR_KEYWORD:
+                search_kwargs.update(search_kwargs.pop(name, {}))
+        q = search_kwargs.pop('q', None)
+        key = self.cache.make_key(self.index_name, q, **search_kwargs)
+        result = self.cache.get(key)
+        if result is None:
+            generation = self.cache.generation(self.index_name)
+            result = self._index.search(*args, **kwargs)
+            self.cache.put(key, result, generation)
+        return result
+
+    def _write(self, method: str, *args, **kwargs):
+        try:
+            return getattr(self._index, method)(*args, **kwargs)
+        finally:
+            # Invalidate even on errors, a failed batch may still have been partly applied
+            self.cache.invalidate(self.index_name)
+
+    def add_documents(self, *args, **kwargs):
+        return self._write('add_documents', *args, **kwargs)
+
+    def update_documents(self, *args, **kwargs):
+        return self._write('update_documents', *args, **kwargs)
+
+    def delete_documents(self, *args, **kwargs):
+        return self._write('delete_documents', *args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        return self._write('delete', *args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._index, name)
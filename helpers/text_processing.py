@@ -0,0 +1,400 @@
+import copy
+import functools
+import hashlib
+import json
+import math
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+
+
+def read_json(filename: str) -> dict:
+    """
+    Reads a JSON file and returns its content as a dictionary.
+
+    Args:
+        filename (str): The path to the JSON file.
+
+    Returns:
+        dict: The content of the JSON file as a dictionary.
+    """
+    with open(filename, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    return data
+
+
+def iter_json_array(filename: str, chunk_size: int = 1 << 16) -> Iterator[dict]:
+    """
+    Lazily yields the items of a JSON file whose top level is an array.
+
+    Only a small window of the file is held in memory at any time, so the
+    memory used is bounded by the largest single item rather than by the
+    size of the file.
+
+    Args:
+        filename (str): The path to the JSON file.
+        chunk_size (int, optional): Number of characters to read at a time. Default is 64k.
+
+    Yields:
+        dict: The items of the top-level array, in file order.
+    """
+    decoder = json.JSONDecoder()
+
+    with open(filename, 'r', encoding='utf-8') as f:
+        buf = f.read(chunk_size)
+        eof = not buf
+        pos = 0
+
+        def skip(chars):
+            # Advance past the given characters, reading more of the file as needed
+            nonlocal buf, pos, eof
+            while True:
+                while pos < len(buf) and buf[pos] in chars:
+                    pos += 1
+                if pos < len(buf) or eof:
+                    return
+                buf, pos = f.read(chunk_size), 0
+                eof = not buf
+
+        skip(' \t\r\n')
+        if pos >= len(buf) or buf[pos] != '[':
+            raise ValueError(f"{filename} does not contain a top-level JSON array")
+        pos += 1
+
+        while True:
+            skip(' \t\r\n,')
+            if pos >= len(buf):
+                raise ValueError(f"{filename} ended before the JSON array was closed")
+            if buf[pos] == ']':
+                return
+
+            try:
+                item, end = decoder.raw_decode(buf, pos)
+                # A bare number at the end of the buffer may continue in the next chunk
+                complete = end < len(buf) or eof
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                complete = False
+
+            if not complete:
+                # Grow the window geometrically so very large items stay linear-time
+                more = f.read(max(chunk_size, len(buf) - pos))
+                eof = not more
+                buf, pos = buf[pos:] + more, 0
+                continue
+
+            yield item
+            pos = end
+            if pos > chunk_size:
+                buf, pos = buf[pos:], 0
+
+
+def clean_data(data: dict) -> dict:
+    """
+    Cleans the data by removing '- Wikipedia' from the title and converting docDate to a string.
+
+    Args:
+        data (dict): The input data dictionary with keys 'title' and 'docDate'.
+
+    Returns:
+        dict: The cleaned data dictionary.
+    """
+    data['title'] = data['title'].replace('- Wikipedia', '')
+    data["docDate"] = str(data["docDate"])
+    return data
+
+
+def split_big_docs(data, field='content', char_len=5e4):
+    """
+    Splits large documents into smaller chunks based on a specified character length.
+
+    Args:
+        data (list): A list of dictionaries, each containing a 'content' field or specified field.
+        field (str, optional): The field name to check for length. Default is 'content'.
+        char_len (float, optional): The maximum character length for each chunk. Default is 5e4.
+
+    Returns:
+        list: A list of dictionaries, each containing a chunked version of the original content.
+    """
+    new_data = []
+    for dat in data:
+        content = dat[field]
+        N = len(content)
+
+        if N >= char_len:
+            n_chunks = math.ceil(N / char_len)
+            new_content = np.array_split(list(content), n_chunks)
+
+            for _content in new_content:
+                new_dat = copy.deepcopy(dat)
+                new_dat[field] = ''.join(_content)
+                new_data.append(new_dat)
+        else:
+            new_data.append(dat)
+    return new_data
+
+
+# Separators that chunk_document is allowed to break on, most preferred first
+BOUNDARIES = {
+    'paragraph': ('\n\n',),
+    'sentence': ('\n\n', '\n', '. ', '! ', '? '),
+}
+
+
+def _chunk_spans(N: int, char_len: int, overlap: int, text: str = None, separators=()) -> Iterator[tuple]:
+    """ Yields (start, end) offsets of the chunks of a string of length N. """
+    if not separators and not overlap:
+        # Same piece sizes as np.array_split: the first N % n_chunks pieces get one extra character
+        n_chunks = math.ceil(N / char_len)
+        size, extra = divmod(N, n_chunks)
+        start = 0
+        for i in range(n_chunks):
+            end = start + size + (i < extra)
+            yield start, end
+            start = end
+        return
+
+    start = 0
+    while start < N:
+        end = min(start + char_len, N)
+        if end < N and separators:
+            # Break after the last separator in the second half of the window, if there is one
+            cuts = [text.rfind(sep, start + char_len // 2, end) for sep in separators]
+            cut = max((i + len(sep) for i, sep in zip(cuts, separators) if i != -1), default=-1)
+            if cut > start:
+                end = cut
+        yield start, end
+        if end >= N:
+            return
+        next_start = max(end - overlap, start + 1)
+        if overlap and separators:
+            # Start the overlapping chunk at the beginning of a sentence/paragraph when possible
+            starts = [text.find(sep, next_start, end) for sep in separators]
+            snapped = min((i + len(sep) for i, sep in zip(starts, separators) if i != -1), default=end)
+            if snapped < end:
+                next_start = snapped
+        start = next_start
+
+
+def chunk_spans(text: str, char_len: float = 5e4, overlap: int = 0, boundary: str = None) -> Iterator[tuple]:
+    """
+    Lazily computes where the chunks of a string start and end, without copying it.
+
+    The arguments are as for chunk_document, which cuts text[start:end] for
+    each span; use the offsets directly to keep track of where a chunk came from.
+
+    Args:
+        text (str): The string to split.
+        char_len (float, optional): The maximum character length for each chunk. Default is 5e4.
+        overlap (int, optional): Number of characters repeated at the start of each following chunk. Default is 0.
+        boundary (str, optional): Break on 'sentence' or 'paragraph' boundaries when one is found
+            in the second half of a chunk. Default is None, which breaks anywhere.
+
+    Yields:
+        tuple: The (start, end) offsets of each chunk, in order; none for an empty string.
+    """
+    char_len = int(char_len)
+    if not 0 <= overlap < char_len:
+        raise ValueError("overlap must be at least 0 and smaller than char_len")
+    if boundary is not None and boundary not in BOUNDARIES:
+        raise ValueError(f"boundary must be one of {sorted(BOUNDARIES)} or None")
+    if text:
+        yield from _chunk_spans(len(text), char_len, overlap, text, BOUNDARIES[boundary] if boundary else ())
+
+
+def chunk_document(doc: dict, field: str = 'content', char_len: float = 5e4, overlap: int = 0,
+                   boundary: str = None) -> Iterator[dict]:
+    """
+    Lazily splits a document into chunks of at most char_len characters.
+
+    Chunks are computed from string offsets, so the only allocations are the
+    chunk strings themselves. Each chunk is a shallow copy of the document:
+    fields other than ``field`` are shared with the original, not copied.
+
+    With the default arguments this yields the same chunks as split_big_docs.
+
+    Args:
+        doc (dict): The document to split.
+        field (str, optional): The field to split. Default is 'content'.
+        char_len (float, optional): The maximum character length for each chunk. Default is 5e4.
+        overlap (int, optional): Number of characters repeated at the start of each following chunk. Default is 0.
+        boundary (str, optional): Break on 'sentence' or 'paragraph' boundaries when one is found
+            in the second half of a chunk. Default is None, which breaks anywhere.
+
+    Yields:
+        dict: The document itself if it is small enough, otherwise its chunks in order.
+    """
+    char_len = int(char_len)
+    if not 0 <= overlap < char_len:
+        raise ValueError("overlap must be at least 0 and smaller than char_len")
+    if boundary is not None and boundary not in BOUNDARIES:
+        raise ValueError(f"boundary must be one of {sorted(BOUNDARIES)} or None")
+
+    content = doc[field]
+    N = len(content)
+    if N < char_len:
+        yield doc
+        return
+
+    separators = BOUNDARIES[boundary] if boundary else ()
+    for start, end in _chunk_spans(N, char_len, overlap, content, separators):
+        yield {**doc, field: content[start:end]}
+
+
+def iter_chunks(data: Iterable[dict], **kwargs) -> Iterator[dict]:
+    """
+    Lazily chunks every document of an iterable, see chunk_document for the arguments.
+
+    Args:
+        data (Iterable[dict]): The documents to split.
+
+    Yields:
+        dict: The chunked documents, in order.
+    """
+    for doc in data:
+        yield from chunk_document(doc, **kwargs)
+
+
+def clean_and_chunk(doc: dict, **chunk_kwargs) -> List[dict]:
+    """ Cleans a raw document and returns its chunks, see chunk_document for the arguments. """
+    return list(chunk_document(clean_data(doc), **chunk_kwargs))
+
+
+def _apply_to_work_item(fn: Callable[[dict], List[dict]], items: List[dict]) -> List[dict]:
+    # Runs in a worker process: one round trip per work item rather than per document
+    return [out for item in items for out in fn(item)]
+
+
+def parallel_map(fn: Callable[[dict], List[dict]], items: Iterable[dict], processes: Optional[int] = None,
+                 chunksize: int = 64, ordered: bool = True, prefetch: int = 2) -> Iterator[dict]:
+    """
+    Applies fn to every item on a process pool and yields the results as they are ready.
+
+    Items are sent to the workers in work items of ``chunksize`` and at most
+    ``prefetch`` work items per process are pending at once, so the input is
+    streamed rather than read up front. Because the workers keep processing
+    while the consumer is busy (e.g. uploading a batch to Marqo), preprocessing
+    time is hidden behind the consumer's own work.
+
+    Args:
+        fn (Callable): A picklable function (module level, or a functools.partial of one)
+            returning a list of outputs for each item.
+        items (Iterable[dict]): The inputs. May be a generator.
+        processes (int, optional): Number of worker processes. Default is os.cpu_count().
+        chunksize (int, optional): Items per work item. Default is 64.
+        ordered (bool, optional): Yield results in input order. If False, work items are yielded
+            as soon as they finish; the outputs of one item always stay together. Default is True.
+        prefetch (int, optional): Pending work items per process. Default is 2.
+
+    Yields:
+        The outputs of fn, flattened.
+    """
+    processes = processes or os.cpu_count() or 1
+    window = prefetch * processes
+    work_items = batched(items, chunksize)
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        pending = deque()
+        for work_item in work_items:
+            pending.append(executor.submit(_apply_to_work_item, fn, work_item))
+            while len(pending) >= window:
+                if ordered:
+                    yield from pending.popleft().result()
+                else:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        pending.remove(future)
+                        yield from future.result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+def stream_documents(filename: str, field: str = 'content', char_len: float = 5e4, overlap: int = 0,
+                     boundary: str = None, processes: int = 1, ordered: bool = True) -> Iterator[dict]:
+    """
+    Streams cleaned and split documents from a JSON dump, one at a time.
+
+    With the default arguments this is the lazy equivalent of
+    ``split_big_docs([clean_data(d) for d in read_json(filename)])``: each document
+    is parsed, cleaned and split only when the consumer asks for it.
+
+    Args:
+        filename (str): The path to the JSON file.
+        field (str, optional): The field name to check for length. Default is 'content'.
+        char_len (float, optional): The maximum character length for each chunk. Default is 5e4.
+        overlap (int, optional): Characters shared between consecutive chunks. Default is 0.
+        boundary (str, optional): 'sentence' or 'paragraph' to prefer breaking there. Default is None.
+        processes (int, optional): Clean and chunk on this many worker processes, see parallel_map.
+            Default is 1, which does everything in the calling process.
+        ordered (bool, optional): With several processes, whether to keep the file order. Default is True.
+
+    Yields:
+        dict: Cleaned documents, with big documents split into chunks.
+    """
+    process = functools.partial(clean_and_chunk, field=field, char_len=char_len, overlap=overlap,
+                                boundary=boundary)
+    if processes is not None and processes <= 1:
+        for doc in iter_json_array(filename):
+            yield from process(doc)
+    else:
+        yield from parallel_map(process, iter_json_array(filename), processes=processes, ordered=ordered)
+
+
+def assign_ids(documents: Iterable[dict], key_fields=('url', 'title')) -> Iterator[dict]:
+    """
+    Gives documents without an '_id' a stable one derived from their source, so
+    that re-running an ingestion produces the same ids for the same documents.
+
+    The chunks of a source document get the ids ``<key hash>-0``,
+    ``<key hash>-1`` and so on, so this should be applied after chunking.
+    The numbering is per key across the whole stream: documents sharing a key
+    (e.g. two articles with the same title) continue each other's numbering
+    rather than overwriting each other, so their ids are only stable while
+    they keep their order in the input. One counter per distinct key is kept
+    in memory.
+
+    Args:
+        documents (Iterable[dict]): The documents, e.g. from stream_documents.
+        key_fields (tuple, optional): Fields identifying the source document, the first present
+            one is used. Default is ('url', 'title').
+
+    Yields:
+        dict: The documents, with '_id' set.
+    """
+    counts: Dict[str, int] = {}
+    for doc in documents:
+        if '_id' not in doc:
+            key = next((str(doc[k]) for k in key_fields if k in doc), None)
+            if key is None:
+                raise ValueError(f"document has none of the fields {key_fields} to derive an _id from")
+            digest = hashlib.sha1(key.encode('utf-8')).hexdigest()[:20]
+            n = counts.get(digest, 0)
+            counts[digest] = n + 1
+            doc['_id'] = f"{digest}-{n}"
+        yield doc
+
+
+def batched(iterable: Iterable, n: int) -> Iterator[List]:
+    """
+    Groups an iterable into lists of at most n items without materialising it.
+
+    Args:
+        iterable (Iterable): The items to group.
+        n (int): The maximum number of items per batch.
+
+    Yields:
+        list: Consecutive batches of items.
+    """
+    if n < 1:
+        raise ValueError("n must be at least one")
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == n:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
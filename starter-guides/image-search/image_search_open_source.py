@@ -51,22 +51,44 @@ documents = [
     {"title": "man stood by a traffic light", "image": "https://raw.githubusercontent.com/marqo-ai/marqo/mainline/examples/ImageSearchGuide/data/image3.jpg"}
 ]
 
-# Add the documents to the index with specific mappings and tensor fields.
-# The mapping 'image_title_multimodal' combines text and image features with specified weights.
-res = mq.index(index_name).add_documents(
-    documents,
-    client_batch_size=1,  # Add documents one at a time for simplicity.
-    mappings={
-        "image_title_multimodal": {
-            "type": "multimodal_combination",  # Combine text and image modalities.
-            "weights": {"title": 0.1, "image": 0.9},  # Assign higher importance to image data.
-        }
-    },
-    tensor_fields=["image_title_multimodal"],  # Specify fields to generate tensors for.
-)
-
-# Print the result of adding documents to verify success.
-pprint(res)
+import os
+import sys
+
+# Make the shared helpers importable
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from helpers.image_validation import validate_documents
+
+# Marqo downloads every image while it indexes a batch, so one dead or slow URL
+# would stall the whole batch. Check every image URL first, concurrently: documents
+# whose image is unreachable, too slow, too large or not a decodable image are set
+# aside in a quarantine report instead of being sent.
+valid_documents, validation = validate_documents(documents, image_fields=["image"], timeout=10)
+print(validation.summary())
+if validation.quarantined:
+    # Written next to this script, to review or retry later
+    validation.write_quarantine(os.path.join(os.path.dirname(os.path.abspath(__file__)), "quarantine.jsonl"))
+
+if valid_documents:
+    # Add the documents to the index with specific mappings and tensor fields.
+    # The mapping 'image_title_multimodal' combines text and image features with specified weights.
+    res = mq.index(index_name).add_documents(
+        valid_documents,
+        client_batch_size=64,  # The images are known to be good, so send them in large batches.
+        mappings={
+            "image_title_multimodal": {
+                "type": "multimodal_combination",  # Combine text and image modalities.
+                "weights": {"title": 0.1, "image": 0.9},  # Assign higher importance to image data.
+            }
+        },
+        tensor_fields=["image_title_multimodal"],  # Specify fields to generate tensors for.
+    )
+
+    # Print the result of adding documents to verify success.
+    pprint(res)
+else:
+    # Every image was quarantined, so there is nothing to index or search
+    pprint(validation.quarantined)
+    sys.exit("No document has a usable image, see the quarantine report above.")
 
 ####################################################
 ### STEP 4: Search using Marqo
@@ -89,16 +111,22 @@ print(search_results['hits'][0])
 
 import matplotlib.pyplot as plt
 import numpy as np
-from PIL import Image
-import urllib.request
-from io import BytesIO
+from helpers.image_cache import ImageCache
+from helpers.result_images import render_gallery
+
+# Images are cached on disk next to this script: running this step again, or showing
+# the same hits again, reads them locally instead of downloading them again.
+# Entries older than an hour are revalidated with the image host (ETag/Last-Modified),
+# and the least recently used images are deleted past 512 MiB.
+image_cache = ImageCache(os.path.join(os.path.dirname(os.path.abspath(__file__)), '.image_cache'),
+                         max_bytes=512 * 2**20, max_age=3600)
 
 # URL of the image
 image_url = top_result['image']
 
-# Open the URL and read the image into a Pillow Image object
-with urllib.request.urlopen(image_url) as url:
-    img = Image.open(BytesIO(url.read()))
+# Read the image into a Pillow Image object, from the cache when possible
+img = image_cache.open_image(image_url)
+print(image_cache.stats())
 
 # Convert the PIL Image object to a NumPy array for matplotlib
 img_array = np.array(img)
@@ -106,4 +134,13 @@ img_array = np.array(img)
 # Display the image using matplotlib
 plt.imshow(img_array)
 plt.axis('off')  # Hide the axis
+plt.show()
+
+# Show every hit as a grid, in ranking order. The images are downloaded concurrently
+# over pooled connections (at most 8 at a time per image host) and decoded while the
+# rest are still downloading, instead of one after another.
+grid, report = render_gallery(search_results['hits'], image_field='image', columns=4, cache=image_cache)
+print(report.summary())
+plt.imshow(np.array(grid))
+plt.axis('off')
 plt.show()
\ No newline at end of file
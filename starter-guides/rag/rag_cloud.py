@@ -17,34 +17,34 @@ api_key = "your_api_key"
 ### STEP 3. Set Up LLM
 #####################################################
 
+import os
+import sys
 from llama_cpp import Llama
 
-# Initialize the Llama model
-LLM = Llama(
-    model_path="starter-guides/rag/models/Meta-Llama-3.1-8B-Instruct-Q4_K_M.gguf",
-    n_ctx=4096,  # Increased context size for handling larger inputs
-    n_gpu_layers=1  # Enable GPU acceleration if available
-)
-
-# Define the question to be asked
-question = "Who won gold in the women's 100 metre race at the Paris Olympics 2024?"
+# The helper functions used in this guide live in the helpers/ folder at the root of this repository
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from helpers.llm import stream_first_paragraph, print_token, BackgroundLoader, StartupTimeline
+from helpers.rag_chunks import chunk_sources, merge_chunks
+from helpers.rag_context import get_context_prompt
 
-# Generate the response using the Llama model
-response_stream = LLM(
-    question, 
-    max_tokens=512,  # Maximum number of tokens in the response
-    stop=["Q:"],  # Stop specifies a list of stop sequences to end the generation
-    stream=True  # The response should be streamed
-)
+# Record when each step of the pipeline runs, to see how much of it overlaps
+timeline = StartupTimeline()
 
-# Capture the output - the response_stream provides a stream of token choices; we join them to form a complete response
-response = ''.join([item['choices'][0]['text'] for item in response_stream])
+def load_llm():
+    """ Initializes the Llama model. """
+    return Llama(
+        model_path="starter-guides/rag/models/Meta-Llama-3.1-8B-Instruct-Q4_K_M.gguf",
+        n_ctx=4096,  # Increased context size for handling larger inputs
+        n_gpu_layers=1  # Enable GPU acceleration if available
+    )
 
-# Extract only the first paragraph from the response - Splits the response by newline and takes the first part
-first_paragraph = response.split('\n', 1)[0].strip()
+# Loading the model takes a while, so it is loaded in the background while Marqo
+# creates the index, adds the documents and searches. llm_loader.result() waits
+# for it the first time the model is needed
+llm_loader = BackgroundLoader(load_llm, timeline=timeline, name='load LLM')
 
-# Print the first paragraph of the response
-print("Just LLM Response:", first_paragraph)
+# Define the question to be asked
+question = "Who won gold in the women's 100 metre race at the Paris Olympics 2024?"
 
 #####################################################
 ### STEP 4. Define Documents to Perform RAG
@@ -86,44 +86,148 @@ except:
     pass
 
 # Create Marqo index
-mq.create_index(index_name)
+with timeline.span('create index'):
+    mq.create_index(index_name)
 
-# Indexing documents 
-mq.index(index_name).add_documents(DOCUMENTS, tensor_fields= ["Title", "Description"])
+# Indexing documents. Each Description is split into overlapping chunks of about 600 characters,
+# each remembering its parent document and offsets, so every vector represents one passage
+# rather than a whole article and only the relevant passages end up in the prompt
+chunks = list(chunk_sources(DOCUMENTS, field='Description', char_len=600, overlap=150))
+with timeline.span('add documents'):
+    mq.index(index_name).add_documents(chunks, tensor_fields= ["Title", "Description"])
 
 # Ensure only documents with this date are included
 date = '2024-08-03'
+filter_string = f"date:{date}"
 
 # Peform search on Marqo index with the same question as before
-results = mq.index(index_name).search(
-    q=question, 
-    filter_string=f"date:{date}", 
-    limit=5)
+with timeline.span('search'):
+    results = mq.index(index_name).search(
+        q=question,
+        filter_string=filter_string,
+        limit=5)
 
 # Print out the results
 print(results)
 
+# Merge the chunks retrieved from the same article back together, joining overlapping and
+# adjacent chunks into one passage, so each article is one source in the prompt
+hits = merge_chunks(results['hits'], field='Description')
+
 # Use the results obtained by Marqo as part of context to the LLM when asking the question again
 context = ''
-for i, hit in enumerate(results['hits']):
-    title =  hit['Title']
-    text = hit['Description']
-    context += f'Source {i}) {title} || {" ".join(text.split()[:60])}... \n'
-
+for i, hit in enumerate(hits):
+    context += f'Source {i}) {hit["Title"]} || {hit["Description"]}\n'
 
-def get_context_prompt(question, context):
-    """ LLM prompt with text-based context from Marqo search. """
-    return f'Background: \n{context}\n\nQuestion: {question}\n\nAnswer:'
-    
 # Obtain the prompt with the content from Marqo
 prompt_w_context = get_context_prompt(question=question, context=context)
 print("Prompt to input into LLM: ", prompt_w_context)
 
-# Generate the response
-response_stream = LLM(prompt_w_context, max_tokens=512, stop=["Q:"], stream=True)
+# The prompt is ready, so wait for the LLM if it is still loading
+LLM = llm_loader.result()
+
+# Generate the response. The tokens are printed as they are streamed, and generation
+# stops at the end of the first paragraph
+print("LLM & Marqo Response: ", end='')
+with timeline.span('generate'):
+    first_paragraph, context_stats = stream_first_paragraph(
+        LLM, prompt_w_context, boundary='\n\n', on_token=print_token, max_tokens=512, stop=["Q:"])
+print()
+
+# Print the time to first token and the generation speed
+print("LLM & Marqo:", context_stats.summary())
+
+# Print the startup timeline: the model loaded while Marqo indexed and searched
+print(timeline.summary())
+
+#####################################################
+### STEP 6. Compare with the LLM Alone
+#####################################################
+
+# Ask the LLM the same question without any context from Marqo, to compare the answers
+print("Just LLM Response: ", end='')
+first_paragraph, stats = stream_first_paragraph(
+    LLM,
+    question,
+    boundary='\n',  # Only the first paragraph of the response is used
+    on_token=print_token,  # Print each token as it arrives
+    max_tokens=512,  # Maximum number of tokens in the response
+    stop=["Q:"]  # Stop specifies a list of stop sequences to end the generation
+)
+print()
+
+# Print the time to first token and the generation speed
+print("Just LLM:", stats.summary())
+
+#####################################################
+### OPTIONAL STEP 7. Choose and Pack the Sources
+#####################################################
+
+# The guide is complete after step 6. Steps 7 and 8 show how to keep the prompt small and
+# relevant as the number of documents grows, and how to skip work for repeated questions
+
+from helpers.llm import PromptStateCache
+from helpers.rag_context import llama_token_counter, context_budget, pack_context, question_offset, select_mmr
+
+# Count tokens with the LLM's own tokenizer
+count_tokens = llama_token_counter(LLM)
+
+# Cache the model's evaluation state for prompt prefixes such as the Background sources,
+# so questions answered from the same sources skip re-evaluating them
+prompt_cache = PromptStateCache(LLM, max_bytes=2 * 2 ** 30)
+
+def rag_answer(question, filter_string):
+    """ Answers the question with the LLM, using the Marqo search results as context. """
+    # Fetch more hits than are used, to choose a diverse set from
+    results = mq.index(index_name).search(q=question, filter_string=filter_string, limit=15)
+    hits = merge_chunks(results['hits'], field='Description')
+
+    # When several articles cover the same event, the top hits repeat each other. Choose up to
+    # 5 hits that are relevant but different from each other (maximal marginal relevance),
+    # comparing their text; helpers.rag_context.fetch_hit_vectors lets it compare vectors instead
+    selection = select_mmr(hits, k=5, text_field='Description', count_tokens=count_tokens)
+    print(selection.summary())
+
+    # The sources are packed by score into the tokens left in the context window (n_ctx=4096) after
+    # the rest of the prompt and the 512 tokens reserved for the answer; near duplicate passages are
+    # skipped, sources too long for what is left make way for shorter ones, and only when none fits
+    # is the best of them truncated, so a higher search limit cannot overflow it
+    budget = context_budget(count_tokens, get_context_prompt(question, ''), n_ctx=4096, max_tokens=512)
+    packed = pack_context(selection.hits, count_tokens, budget, title_field='Title', text_field='Description')
+    print(packed.summary())
+    prompt_w_context = get_context_prompt(question=question, context=packed.text)
+
+    # Restore or save the evaluated state of the prompt up to the question; with several
+    # questions, those answered from the same sources only evaluate their own question
+    prompt_cache.prefill(prompt_w_context, checkpoints=[question_offset(question, packed.text)])
+
+    print("LLM & Marqo Response: ", end='')
+    first_paragraph, stats = stream_first_paragraph(
+        LLM, prompt_w_context, boundary='\n\n', on_token=print_token, max_tokens=512, stop=["Q:"])
+    print()
+    print("LLM & Marqo:", stats.summary())
+    return first_paragraph
+
+first_paragraph = rag_answer(question, filter_string)
+
+#####################################################
+### OPTIONAL STEP 8. Cache Answers to Similar Questions
+#####################################################
+
+from helpers.answer_cache import SemanticAnswerCache
+
+# Cache answers by the Marqo embedding of their question, so a question close enough in meaning
+# to one already answered under the same filter reuses its answer without searching or generating
+answer_cache = SemanticAnswerCache(mq.index(index_name), threshold=0.92, max_entries=1024)
+
+# Store the answer from step 7; a question not cached yet would be answered with rag_answer
+answer_cache.get_or_generate(question, lambda: first_paragraph, filter_string=filter_string)
 
-# Capture and print the output
-response = ''.join([item['choices'][0]['text'] for item in response_stream])
-first_paragraph = response.split('\n\n', 1)[0].strip()
-print("LLM & Marqo Response:", first_paragraph)
+# Ask the same question in other words; if it is within the similarity threshold it is answered from the cache
+rephrased_question = "Who won the women's 100m gold medal at the 2024 Paris Olympics?"
+rephrased_answer = answer_cache.get_or_generate(
+    rephrased_question, lambda: rag_answer(rephrased_question, filter_string), filter_string=filter_string)
+print("Rephrased question:", rephrased_answer)
 
+# Print the cache's hit rate
+print("Answer cache:", answer_cache.stats())
@@ -19,71 +19,16 @@ docker run --name marqo -it -p 8882:8882 marqoai/marqo:latest
 ### STEP 2. Import and Define any Helper Functions
 #####################################################
 
-from marqo import Client
-import json
-import math
-import numpy as np
-import copy
+import os
+import sys
+import itertools
 import pprint
+from marqo import Client
 
-def read_json(filename: str) -> dict:
-    """
-    Reads a JSON file and returns its content as a dictionary.
-
-    Args:
-        filename (str): The path to the JSON file.
-
-    Returns:
-        dict: The content of the JSON file as a dictionary.
-    """
-    with open(filename, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-    return data
-
-
-def clean_data(data: dict) -> dict:
-    """
-    Cleans the data by removing '- Wikipedia' from the title and converting docDate to a string.
-
-    Args:
-        data (dict): The input data dictionary with keys 'title' and 'docDate'.
-
-    Returns:
-        dict: The cleaned data dictionary.
-    """
-    data['title'] = data['title'].replace('- Wikipedia', '')
-    data["docDate"] = str(data["docDate"])
-    return data
-
-
-def split_big_docs(data, field='content', char_len=5e4):
-    """
-    Splits large documents into smaller chunks based on a specified character length.
-
-    Args:
-        data (list): A list of dictionaries, each containing a 'content' field or specified field.
-        field (str, optional): The field name to check for length. Default is 'content'.
-        char_len (float, optional): The maximum character length for each chunk. Default is 5e4.
-
-    Returns:
-        list: A list of dictionaries, each containing a chunked version of the original content.
-    """
-    new_data = []
-    for dat in data:
-        content = dat[field]
-        N = len(content)
-
-        if N >= char_len:
-            n_chunks = math.ceil(N / char_len)
-            new_content = np.array_split(list(content), n_chunks)
-
-            for _content in new_content:
-                new_dat = copy.deepcopy(dat)
-                new_dat[field] = ''.join(_content)
-                new_data.append(new_dat)
-        else:
-            new_data.append(dat)
-    return new_data
+# The helper functions used in this guide live in the helpers/ folder at the root of this repository
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from helpers.text_processing import stream_documents, assign_ids
+from helpers.ingestion import ingest_documents, IngestionManifest
 
 #####################################################
 ### STEP 3. Load the Data
@@ -93,18 +38,17 @@ def split_big_docs(data, field='content', char_len=5e4):
 # Change this to where your 'simplewiki.json' is located
 dataset_file = "./starter-guides/text-search/simplewiki.json"
 
-# Get the data
-data = read_json(dataset_file)
-# Clean up the title
-data = [clean_data(d) for d in data]
-data = split_big_docs(data)
+# Stream the data - documents are parsed, cleaned and split one at a time
+# so memory use stays flat no matter how big the dataset file is. Each document
+# gets a stable '_id' so that re-runs can tell which documents are already indexed.
+# Cleaning and chunking can run on a pool of worker processes (e.g. processes=os.cpu_count())
+# that keeps working while batches are uploaded; this pays off when you add heavier
+# preprocessing, for the light cleaning done here one process is usually fastest
+data = assign_ids(stream_documents(dataset_file, processes=1))
 
 # Take the first 100 entries of the dataset
-N = 100 # Number of entries of the dataset
-subset_data = data[:N]
-
-print(f"loaded data with {len(data)} entries")
-print(f"creating subset with {len(subset_data)} entries")
+N = 100 # Number of entries of the dataset, set to None to index the whole file
+subset_data = itertools.islice(data, N)
 
 #####################################################
 ### STEP 4. Index Some Data with Marqo
@@ -116,29 +60,61 @@ index_name = 'text-search-open-source'
 # Set up the Client
 mq = Client("http://localhost:8882")
 
-# We create the index. Note if it already exists an error will occur
-# as you cannot overwrite an existing index. For this reason, we delete
-# any existing index 
-try:
-    mq.delete_index(index_name)
-except:
-    pass
-
-# Create index
-mq.create_index(
-    index_name, 
-    model='hf/all_datasets_v4_MiniLM-L6'
+# Settings of the index and of the documents we add to it
+model = 'hf/all_datasets_v4_MiniLM-L6'
+tensor_fields = ["title", "content"]
+
+# The manifest records every document the index has acknowledged, so an interrupted
+# run resumes where it stopped and a re-run over a changed dataset only sends new or
+# modified documents. Delete this file to re-index everything from scratch
+manifest = IngestionManifest(
+    f"./starter-guides/text-search/{index_name}.manifest.jsonl",
+    settings={'model': model, 'tensor_fields': tensor_fields}
 )
 
-# Add the subset of data to the index
-responses = mq.index(index_name).add_documents(
+# We create the index. Note if it already exists an error will occur
+# as you cannot overwrite an existing index. For this reason, we delete
+# any existing index - unless there is an earlier run to resume
+existing_indexes = [i['indexName'] for i in mq.get_indexes()['results']]
+if index_name not in existing_indexes or len(manifest) == 0:
+    try:
+        mq.delete_index(index_name)
+    except:
+        pass
+
+    # Create index
+    mq.create_index(
+        index_name, 
+        model=model
+    )
+    manifest.clear()
+
+# Add the subset of data to the index. Batches of 50 documents are sent with up
+# to 4 batches in flight at once, so the server is never left waiting for the next request.
+# Documents already recorded in the manifest are skipped
+report = ingest_documents(
+    mq.index(index_name),
     subset_data, 
-    client_batch_size=50,
-    tensor_fields=["title", "content"]
+    batch_size=50,
+    max_in_flight=4,
+    manifest=manifest,
+    tensor_fields=tensor_fields
 )
 
-# Optionally take a look at the responses
-# pprint.pprint(responses)
+print(report.summary())
+
+# Alternatively, let the batch size adapt to your data and hardware: batches are filled
+# up to a payload size in bytes that grows while throughput improves and shrinks on
+# timeouts or server errors
+# from helpers.ingestion import AdaptiveBatchSize
+# batch_size = AdaptiveBatchSize()
+# report = ingest_documents(mq.index(index_name), subset_data, batch_size=batch_size,
+#                           manifest=manifest, tensor_fields=tensor_fields)
+# pprint.pprint(batch_size.curve())
+
+# Optionally take a look at any documents that failed to index
+# pprint.pprint(report.item_errors)
+# pprint.pprint(report.failed_batches)
 
 #####################################################
 ### STEP 5. Search with Marqo
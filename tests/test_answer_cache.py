@@ -0,0 +1,67 @@
+"""
+Tests for helpers.answer_cache. Run with ``python -m pytest tests``.
+"""
+
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from helpers import answer_cache
+from helpers.answer_cache import SemanticAnswerCache
+
+VECTORS = {
+    'what is air made of?': [1.0, 0.0, 0.0],
+    'what makes up air?': [0.95, 0.3, 0.0],
+    'how deep is the sea?': [0.0, 1.0, 0.0],
+    'how old is the moon?': [0.0, 0.0, 1.0],
+}
+
+
+class FakeIndex:
+    """ Embeds the questions in VECTORS and counts the embed calls. """
+
+    def __init__(self):
+        self.n_embeds = 0
+
+    def embed(self, question):
+        self.n_embeds += 1
+        return {'embeddings': [VECTORS[question]]}
+
+
+def test_rephrased_questions_share_an_answer_and_exact_ones_skip_the_embedding():
+    index = FakeIndex()
+    cache = SemanticAnswerCache(index, threshold=0.9)
+    assert cache.get_or_generate('what is air made of?', lambda: 'nitrogen') == 'nitrogen'
+    assert cache.get_or_generate('what makes up air?', lambda: 'unused') == 'nitrogen'
+    assert cache.get_or_generate('What is  air made of?', lambda: 'unused') == 'nitrogen'
+    assert cache.get_or_generate('what is air made of?', lambda: 'other', filter_string='date:2024') == 'other'
+    assert (cache.hits, cache.exact_hits, cache.misses) == (2, 1, 2)
+    assert index.n_embeds == 3
+
+
+def test_answers_expire_after_the_ttl(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(answer_cache, 'time', SimpleNamespace(monotonic=lambda: now[0], perf_counter=time.perf_counter))
+    cache = SemanticAnswerCache(FakeIndex(), threshold=0.9, ttl=60)
+    cache.put('what is air made of?', 'nitrogen')
+
+    now[0] += 59
+    assert cache.lookup('what makes up air?')[0] == 'nitrogen'
+    now[0] += 1
+    assert cache.lookup('what is air made of?')[0] is None
+    assert cache.lookup('what makes up air?')[0] is None
+
+
+def test_least_recently_used_answers_are_evicted_first():
+    cache = SemanticAnswerCache(FakeIndex(), threshold=0.9, max_entries=2)
+    cache.put('what is air made of?', 'nitrogen')
+    cache.put('how deep is the sea?', 'deep')
+    assert cache.lookup('what is air made of?')[0] == 'nitrogen'
+    cache.put('how old is the moon?', 'old')
+
+    assert cache.evictions == 1
+    assert cache.lookup('how deep is the sea?')[0] is None
+    assert cache.lookup('what is air made of?')[0] == 'nitrogen'
+    assert cache.lookup('how old is the moon?')[0] == 'old'
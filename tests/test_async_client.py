@@ -0,0 +1,63 @@
+"""
+Tests for helpers.async_client against helpers.mock_marqo. Run with ``python -m pytest tests``.
+"""
+
+import asyncio
+import os
+import sys
+
+import pytest
+from marqo import Client
+from marqo.errors import MarqoWebError
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from helpers.async_client import AsyncClient
+from helpers.mock_marqo import MockMarqo
+
+# AsyncClient needs the optional aiohttp dependency
+pytest.importorskip('aiohttp')
+
+DOCUMENTS = [{'_id': str(i), 'Title': f"Article {i}", 'Description': f"rowing news number {i} from the river"}
+             for i in range(10)]
+
+
+@pytest.fixture
+def server():
+    with MockMarqo() as server:
+        yield server
+
+
+def test_async_client_matches_the_blocking_client(server):
+    async def run():
+        async with AsyncClient(server.url, max_concurrency=4) as mq:
+            await mq.create_index('news')
+            index = mq.index('news')
+            responses = await index.add_documents(DOCUMENTS, client_batch_size=3, tensor_fields=['Description'])
+            queries = ['rowing news number 3', 'river', 'rowing']
+            results = await asyncio.gather(*(index.search(q, limit=5) for q in queries))
+            document = await index.get_document('3')
+            indexes = await mq.get_indexes()
+            return responses, results, document, indexes
+
+    responses, results, document, indexes = asyncio.run(run())
+    assert len(responses) == 4 and not any(r['errors'] for r in responses)
+    assert document['Title'] == 'Article 3'
+    assert {'indexName': 'news'} in indexes['results']
+
+    blocking = Client(server.url).index('news')
+    for q, result in zip(['rowing news number 3', 'river', 'rowing'], results):
+        expected = blocking.search(q, limit=5)
+        assert [h['_id'] for h in result['hits']] == [h['_id'] for h in expected['hits']]
+
+
+def test_async_client_raises_marqo_errors_and_rejects_unknown_arguments(server):
+    async def run():
+        async with AsyncClient(server.url) as mq:
+            await mq.create_index('news')
+            with pytest.raises(MarqoWebError) as error:
+                await mq.index('news').get_document('missing')
+            with pytest.raises(TypeError, match='limt'):
+                await mq.index('news').search('rowing', limt=5)
+            return error.value
+
+    assert asyncio.run(run()).status_code == 404
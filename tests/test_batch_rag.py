@@ -0,0 +1,78 @@
+"""
+Tests for helpers.batch_rag. Run with ``python -m pytest tests``.
+"""
+
+import json
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from helpers.batch_rag import answered_ids, run_batch_rag
+from helpers.llm import BackgroundLoader, StartupTimeline
+
+
+class SlowGenerator:
+    """ A generate function whose model loads in the background, like RAGGenerator with a BackgroundLoader. """
+
+    def __init__(self, loader: BackgroundLoader, seconds: float):
+        self.loader = loader
+        self.seconds = seconds
+
+    def load(self):
+        return self.loader.result()
+
+    def __call__(self, question, results):
+        self.load()
+        time.sleep(self.seconds)
+        return {'answer': f"answer to {question['question']}"}
+
+
+def questions(n: int):
+    return ({'id': i, 'question': f"question {i}"} for i in range(n))
+
+
+def search(question):
+    time.sleep(0.01)
+    return {'hits': []}
+
+
+def test_timeline_counts_the_model_load_once(tmp_path):
+    timeline = StartupTimeline()
+    loader = BackgroundLoader(lambda: time.sleep(0.5), timeline=timeline, name='load LLM')
+    report = run_batch_rag(questions(5), search, SlowGenerator(loader, 0.02), str(tmp_path / 'answers.jsonl'),
+                           max_searches_in_flight=1, timeline=timeline)
+
+    spans = {name: (start, end, wait) for name, start, end, wait in timeline.spans}
+    assert set(spans) == {'load LLM', 'wait for load LLM', 'search', 'generate'}
+    assert spans['wait for load LLM'][2] and not spans['generate'][2]
+    # Generation starts once the model is ready, and its latencies leave the wait out
+    assert spans['generate'][0] >= spans['load LLM'][1]
+    assert max(report.generation_latencies) < 0.2
+    # Only the searches overlapped the load
+    overlap = timeline.work - timeline.wall_clock
+    assert 0.0 < overlap < 0.2
+
+
+def test_resume_retries_failures_and_drops_a_torn_last_line(tmp_path):
+    path = str(tmp_path / 'answers.jsonl')
+
+    def flaky(question, results):
+        if question['id'] == 2:
+            raise RuntimeError('model crashed')
+        return {'answer': f"answer to {question['question']}"}
+
+    report = run_batch_rag(questions(4), search, flaky, path)
+    assert (report.n_answered, report.n_failed) == (3, 1)
+    # A crash while writing the answer to question 4
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write('{"id": 4, "answ')
+
+    assert answered_ids(path) == {0, 1, 3}
+    asked = []
+    report = run_batch_rag(questions(5), search, lambda q, r: asked.append(q['id']) or {'answer': 'ok'}, path)
+    assert sorted(asked) == [2, 4] and report.n_skipped == 3
+
+    with open(path, encoding='utf-8') as f:
+        records = [json.loads(line) for line in f]
+    assert sorted(r['id'] for r in records if 'error' not in r) == [0, 1, 2, 3, 4]
@@ -0,0 +1,68 @@
+"""
+Tests for helpers.image_cache. Run with ``python -m pytest tests``.
+"""
+
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from helpers import image_cache
+from helpers.image_cache import ImageCache
+
+
+class FakeResponse:
+    def __init__(self, content: bytes):
+        self.status_code = 200
+        self.content = content
+        self.headers = {'Content-Type': 'image/jpeg'}
+
+    def raise_for_status(self):
+        pass
+
+
+class FakeSession:
+    """ Serves a distinct 1 KiB body per URL after a short delay. """
+
+    def get(self, url, headers=None, timeout=None):
+        time.sleep(0.001)
+        return FakeResponse(url.encode('utf-8').ljust(1024, b'.'))
+
+
+def test_images_being_read_are_not_evicted(tmp_path, monkeypatch):
+    cache = ImageCache(str(tmp_path), max_bytes=4 * 1024, session=FakeSession())
+    urls = [f"http://images.example/{i}.jpg" for i in range(64)]
+
+    # Widen the window between finding an image and reading it, as a slow disk would
+    real_open = open
+
+    def slow_open(path, mode='r', *args, **kwargs):
+        if mode == 'rb':
+            time.sleep(0.005)
+        return real_open(path, mode, *args, **kwargs)
+
+    monkeypatch.setattr(image_cache, 'open', slow_open, raising=False)
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        bodies = list(executor.map(cache.get, urls * 2))
+
+    assert bodies == [url.encode('utf-8').ljust(1024, b'.') for url in urls * 2]
+    assert cache.stats()['evictions'] > 0
+    assert cache.size() <= cache.max_bytes
+
+
+def test_thumbnails_are_dropped_with_their_image(tmp_path):
+    cache = ImageCache(str(tmp_path), max_bytes=2 * 1024, session=FakeSession())
+    cache.get('http://images.example/a.jpg')
+    sha256 = cache._entries['http://images.example/a.jpg']['sha256']
+    cache._thumbs[sha256] = {f"{sha256}_64x64.jpg": 10}
+    cache.get('http://images.example/b.jpg')
+    cache.get('http://images.example/c.jpg')
+
+    assert 'http://images.example/a.jpg' not in cache._entries
+    assert sha256 not in cache._thumbs
+
+    # Thumbnails left behind by an earlier process are dropped on load
+    cache._thumbs['0' * 64] = {'0' * 64 + '_64x64.jpg': 10}
+    cache.flush()
+    assert '0' * 64 not in ImageCache(str(tmp_path), session=FakeSession())._thumbs
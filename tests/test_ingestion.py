@@ -0,0 +1,107 @@
+"""
+Tests for helpers.ingestion. Run with ``python -m pytest tests``.
+"""
+
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from helpers.ingestion import AdaptiveBatchSize, IngestionManifest, ingest_documents
+
+
+class RecordingIndex:
+    """ An index that acknowledges every document except those with an id in reject. """
+
+    def __init__(self, reject=()):
+        self.reject = set(reject)
+        self.sent = []
+
+    def add_documents(self, documents, **kwargs):
+        self.sent.extend(d['_id'] for d in documents)
+        items = [{'_id': d['_id'], 'status': 400 if d['_id'] in self.reject else 200} for d in documents]
+        return {'errors': bool(self.reject), 'items': items}
+
+
+class LatencyModelIndex:
+    """ An index whose add_documents takes a fixed overhead plus the payload over a bandwidth. """
+
+    def __init__(self, overhead: float = 0.02, bytes_per_s: float = 20e6):
+        self.overhead = overhead
+        self.bytes_per_s = bytes_per_s
+        self.n_docs = 0
+        self._lock = threading.Lock()
+
+    def add_documents(self, documents, **kwargs):
+        n_bytes = sum(len(d['text']) for d in documents)
+        time.sleep(self.overhead + n_bytes / self.bytes_per_s)
+        with self._lock:
+            self.n_docs += len(documents)
+        return {'errors': False, 'items': [{'_id': d['_id'], 'status': 200} for d in documents]}
+
+
+def documents(n: int, size: int = 8 * 1024):
+    return ({'_id': str(i), 'text': 'x' * size} for i in range(n))
+
+
+def test_adaptive_batch_size_grows_with_batches_in_flight():
+    # Throughput keeps improving until max_docs caps batches at 128 * 8 KiB = 1 MiB
+    for max_in_flight in (1, 4):
+        adaptive = AdaptiveBatchSize(initial_bytes=16 * 1024)
+        index = LatencyModelIndex()
+        report = ingest_documents(index, documents(2000), batch_size=adaptive, max_in_flight=max_in_flight)
+
+        assert report.n_docs == index.n_docs == 2000
+        assert adaptive.settled
+        assert adaptive.target_bytes >= 512 * 1024, (max_in_flight, adaptive.curve())
+
+
+def test_observe_ignores_batches_built_under_an_earlier_budget():
+    adaptive = AdaptiveBatchSize(initial_bytes=64 * 1024, batches_per_step=3)
+    adaptive.target_bytes = 128 * 1024
+    # Stale batches finishing after the budget grew must not complete the new budget's step
+    for _ in range(3):
+        adaptive.observe(8, 64 * 1024, 0.1, target_bytes=64 * 1024)
+    assert not adaptive.settled and adaptive.target_bytes == 128 * 1024
+    assert [e['target_bytes'] for e in adaptive.history] == [64 * 1024] * 3
+
+
+def test_overload_of_a_stale_larger_batch_does_not_halve_again():
+    adaptive = AdaptiveBatchSize(initial_bytes=256 * 1024)
+    adaptive.observe(8, 256 * 1024, 0.1, overloaded=True, target_bytes=256 * 1024)
+    assert adaptive.target_bytes == 128 * 1024
+    adaptive.observe(8, 256 * 1024, 0.1, overloaded=True, target_bytes=256 * 1024)
+    assert adaptive.target_bytes == 128 * 1024
+
+
+def test_manifest_skips_unchanged_documents_and_resumes_after_a_torn_line(tmp_path):
+    path = str(tmp_path / 'manifest.jsonl')
+    docs = [{'_id': str(i), 'text': f"doc {i}"} for i in range(10)]
+    index = RecordingIndex(reject={'9'})
+    ingest_documents(index, docs, batch_size=4, manifest=IngestionManifest(path, {'tensor_fields': ['text']}),
+                     tensor_fields=['text'])
+    assert len(IngestionManifest(path, {'tensor_fields': ['text']})) == 9
+
+    # A crash mid-write leaves a torn last line; the entries before it still count
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write('{"_id": "10", "ha')
+    docs[3] = {'_id': '3', 'text': 'doc 3, edited'}
+    index = RecordingIndex()
+    manifest = IngestionManifest(path, {'tensor_fields': ['text']})
+    report = ingest_documents(index, docs + [{'_id': '10', 'text': 'doc 10'}], batch_size=4, manifest=manifest,
+                              tensor_fields=['text'])
+    assert sorted(index.sent) == ['10', '3', '9']
+    assert report.n_skipped == 8
+
+    # Different settings need every document re-embedded, so the manifest starts over
+    assert len(IngestionManifest(path, {'tensor_fields': ['title']})) == 0
+
+
+def test_damaged_manifest_header_names_the_file(tmp_path):
+    path = tmp_path / 'manifest.jsonl'
+    path.write_text('{"settings": {"tensor_fields": ["te\n{"_id": "1", "hash": "x"}\n')
+    with pytest.raises(ValueError, match='manifest.jsonl.*delete it'):
+        IngestionManifest(str(path))
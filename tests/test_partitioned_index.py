@@ -0,0 +1,68 @@
+"""
+Tests for helpers.partitioned_index. Run with ``python -m pytest tests``.
+"""
+
+import os
+import sys
+
+import pytest
+from marqo import Client
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from helpers.mock_marqo import MockMarqo, matches_filter
+from helpers.partitioned_index import PartitionedIndex
+
+DOCUMENTS = [
+    {'_id': 'jul-31', 'date': '2024-07-31', 'topic': 'sport', 'text': 'rowing final on the river'},
+    {'_id': 'aug-01', 'date': '2024-08-01', 'topic': 'sport', 'text': 'rowing heats on the river'},
+    {'_id': 'aug-02', 'date': '2024-08-02', 'topic': 'news', 'text': 'rowing club opens on the river'},
+    {'_id': 'aug-20', 'date': '2024-08-20', 'topic': 'sport', 'text': 'rowing regatta on the river'},
+    {'_id': 'sep-01', 'date': '2024-09-01', 'topic': 'sport', 'text': 'rowing season ends on the river'},
+]
+
+
+@pytest.fixture
+def mq():
+    with MockMarqo() as server:
+        yield Client(server.url)
+
+
+def test_documents_are_routed_to_the_partition_of_their_month(mq):
+    news = PartitionedIndex(mq, 'news')
+    news.add_documents(DOCUMENTS, tensor_fields=['text'])
+
+    assert news.partitions() == {'2024-07': 'news-2024-07', '2024-08': 'news-2024-08', '2024-09': 'news-2024-09'}
+    assert mq.index('news-2024-08').get_document('aug-20')['date'] == '2024-08-20'
+
+
+def test_other_indexes_sharing_the_base_name_are_not_partitions(mq):
+    for name in ('news-archive', 'news-2024-13', 'news-2024-08-01', 'news-2024'):
+        mq.create_index(name)
+    assert PartitionedIndex(mq, 'news').partitions() == {}
+    assert PartitionedIndex(mq, 'news', period='year').partitions() == {'2024': 'news-2024'}
+
+
+def test_range_search_filters_partial_partitions_and_merges_by_score(mq):
+    news = PartitionedIndex(mq, 'news')
+    news.add_documents(DOCUMENTS, tensor_fields=['text'])
+    results = news.search('rowing on the river', start='2024-08-01', end='2024-08-02', limit=10)
+
+    assert results['partitions'] == ['news-2024-08']
+    assert sorted(h['_id'] for h in results['hits']) == ['aug-01', 'aug-02']
+    assert all(h['_index'] == 'news-2024-08' for h in results['hits'])
+
+    results = news.search('rowing on the river', start='2024-07-31', end='2024-09-30', limit=3,
+                          filter_string='topic:sport')
+    scores = [h['_score'] for h in results['hits']]
+    assert results['partitions'] == ['news-2024-07', 'news-2024-08', 'news-2024-09']
+    assert len(scores) == 3 and scores == sorted(scores, reverse=True)
+    assert 'aug-02' not in {h['_id'] for h in results['hits']}
+
+
+def test_matches_filter_binds_and_tighter_than_or_and_honours_parentheses():
+    doc = {'date': '2024-08-02', 'topic': 'sport'}
+    assert not matches_filter(doc, '(date:2024-08-01 OR date:2024-08-02) AND (topic:news)')
+    assert matches_filter(doc, '(date:2024-08-01 OR date:2024-08-02) AND (topic:sport)')
+    assert not matches_filter(doc, '(date:2024-08-02 OR date:2024-08-03) AND (topic:news)')
+    assert matches_filter(doc, 'date:2024-08-02 OR date:2024-08-01 AND topic:news')
+    assert not matches_filter(doc, 'date:2024-08-01 OR date:2024-08-02 AND topic:news')
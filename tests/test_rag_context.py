@@ -0,0 +1,65 @@
+"""
+Tests for helpers.rag_context. Run with ``python -m pytest tests``.
+"""
+
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from helpers.rag_context import pack_context, select_mmr
+
+
+def count_words(text):
+    return len(text.split())
+
+
+def hit(_id, score, n_words, word=None):
+    return {'_id': _id, '_score': score, 'Title': _id, 'Description': ' '.join(f"{word or _id}{i}" for i in range(n_words))}
+
+
+def test_pack_context_keeps_packing_after_a_hit_that_does_not_fit():
+    hits = [hit('a', 0.9, 20), hit('b', 0.8, 100), hit('c', 0.7, 20)]
+    packed = pack_context(hits, count_words, budget=50, min_tokens=5)
+
+    assert [s['_id'] for s in packed.sources] == ['a', 'c']
+    assert not any(s['truncated'] for s in packed.sources)
+    assert packed.over_budget == ['b']
+    assert packed.n_tokens <= packed.budget
+
+
+def test_pack_context_truncates_only_when_nothing_later_fits():
+    hits = [hit('a', 0.9, 20), hit('b', 0.8, 100), hit('c', 0.7, 100)]
+    packed = pack_context(hits, count_words, budget=60, min_tokens=5)
+
+    assert [(s['_id'], s['truncated']) for s in packed.sources] == [('a', False), ('b', True)]
+    assert packed.over_budget == ['c']
+    assert packed.n_tokens == count_words(packed.text) <= packed.budget
+    assert packed.text.splitlines()[1].startswith('Source 1) b || b0 b1')
+
+
+def test_pack_context_skips_near_duplicates():
+    hits = [hit('a', 0.9, 20, word='air'), hit('b', 0.8, 20, word='air'), hit('c', 0.7, 20)]
+    packed = pack_context(hits, count_words, budget=1000)
+
+    assert [s['_id'] for s in packed.sources] == ['a', 'c']
+    assert packed.duplicates == ['b']
+
+
+def test_select_mmr_drops_redundant_hits():
+    hits = [hit('a', 0.9, 20, word='air'), hit('b', 0.85, 20, word='air'), hit('c', 0.5, 20), hit('d', 0.4, 20)]
+    selection = select_mmr(hits, k=3, count_tokens=count_words)
+
+    assert selection.similarity == 'shingles'
+    assert [h['_id'] for h in selection.hits] == ['a', 'c', 'd']
+    assert selection.redundant == ['b']
+    assert selection.tokens_saved == 20
+
+
+def test_select_mmr_prefers_diverse_vectors():
+    hits = [{'_id': 'a', '_score': 1.0, '_tensor_facets': [{'_embedding': [1.0, 0.0]}]},
+            {'_id': 'b', '_score': 0.9, '_tensor_facets': [{'_embedding': [0.8, 0.6]}]},
+            {'_id': 'c', '_score': 0.8, '_tensor_facets': [{'_embedding': [0.0, 1.0]}]}]
+    selection = select_mmr(hits, k=2, relevance_weight=0.5)
+
+    assert selection.similarity == 'vectors'
+    assert [h['_id'] for h in selection.hits] == ['a', 'c']
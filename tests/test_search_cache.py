@@ -0,0 +1,69 @@
+"""
+Tests for helpers.search_cache. Run with ``python -m pytest tests``.
+"""
+
+import os
+import sys
+import threading
+
+from marqo.enums import SearchMethods
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from helpers.search_cache import SearchCache
+
+
+class FakeIndex:
+    """ An index whose search can be held mid-flight, to interleave it with a write. """
+
+    index_name = 'docs'
+
+    def __init__(self):
+        self.n_searches = 0
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+
+    def search(self, q=None, limit=10, filter_string=None, search_method=SearchMethods.TENSOR, **kwargs):
+        self.n_searches += 1
+        self.started.set()
+        self.release.wait()
+        return {'hits': [], 'query': q, 'search': self.n_searches}
+
+    def add_documents(self, documents, **kwargs):
+        return {'errors': False, 'items': []}
+
+
+def test_positional_and_keyword_searches_share_an_entry():
+    index = FakeIndex()
+    cached = SearchCache().index(index)
+    first = cached.search('air', 5)
+    assert cached.search('air', limit=5) is first
+    assert cached.search(q='air', limit=5) is first
+    assert cached.search('air', 6) is not first
+    assert index.n_searches == 2
+
+
+def test_default_arguments_and_search_method_spellings_share_an_entry():
+    index = FakeIndex()
+    cached = SearchCache().index(index)
+    first = cached.search('air')
+    assert cached.search('air', limit=10) is first
+    assert cached.search('air', search_method='tensor') is first
+    assert cached.search('air', search_method=SearchMethods.TENSOR) is first
+    assert cached.search('air', search_method=SearchMethods.LEXICAL) is not first
+    assert index.n_searches == 2
+
+
+def test_search_in_flight_during_a_write_is_not_cached():
+    index = FakeIndex()
+    cached = SearchCache().index(index)
+    index.release.clear()
+    search = threading.Thread(target=cached.search, args=('air',))
+    search.start()
+    index.started.wait()
+    cached.add_documents([{'_id': '1', 'text': 'air is mostly nitrogen'}])
+    index.release.set()
+    search.join()
+
+    assert cached.search('air')['search'] == 2
+    assert cached.search('air')['search'] == 2
@@ -0,0 +1,58 @@
+"""
+Tests for helpers.text_processing. Run with ``python -m pytest tests``.
+"""
+
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from helpers.text_processing import assign_ids, chunk_document, chunk_spans, iter_json_array
+
+
+def test_assign_ids_keeps_non_adjacent_duplicate_keys_apart():
+    documents = [{'title': 'Air'}, {'title': 'Air'}, {'title': 'Water'}, {'title': 'Air'}, {'title': 'Water'}]
+    ids = [doc['_id'] for doc in assign_ids(documents)]
+
+    assert len(set(ids)) == len(ids)
+    assert [i.rsplit('-', 1)[1] for i in ids] == ['0', '1', '0', '2', '1']
+    # Stable between runs over the same input
+    assert ids == [doc['_id'] for doc in assign_ids({'title': d['title']} for d in documents)]
+
+
+def test_assign_ids_keeps_existing_ids():
+    assert [doc['_id'] for doc in assign_ids([{'_id': 'a', 'title': 'Air'}])] == ['a']
+
+
+def test_chunk_spans_match_chunk_document():
+    doc = {'content': "Air is a gas. It is mostly nitrogen and oxygen. " * 40}
+    spans = list(chunk_spans(doc['content'], char_len=300, overlap=60, boundary='sentence'))
+    chunks = [c['content'] for c in chunk_document(doc, char_len=300, overlap=60, boundary='sentence')]
+
+    assert [doc['content'][start:end] for start, end in spans] == chunks
+    assert list(chunk_spans('', char_len=300)) == []
+
+
+def test_iter_json_array_matches_json_load_across_chunk_boundaries(tmp_path):
+    items = [{'title': 'Air, "quoted" [and] {braced}', 'n': 12345678901234567890},
+             {'title': 'Wasser \u00fcber alles', 'tags': ['a', 'b'], 'nested': {'x': [1.5, -2e3]}},
+             1234567, 'text', None, []]
+    path = tmp_path / 'items.json'
+    path.write_text(' \n' + json.dumps(items, indent=2, ensure_ascii=False) + '\n', encoding='utf-8')
+
+    for chunk_size in (1, 3, 7, 64, 1 << 16):
+        assert list(iter_json_array(str(path), chunk_size=chunk_size)) == items
+    path.write_text('[]', encoding='utf-8')
+    assert list(iter_json_array(str(path))) == []
+
+
+def test_iter_json_array_rejects_non_arrays_and_truncated_files(tmp_path):
+    path = tmp_path / 'items.json'
+    path.write_text('{"title": "Air"}', encoding='utf-8')
+    with pytest.raises(ValueError, match='top-level JSON array'):
+        list(iter_json_array(str(path)))
+    path.write_text('[{"title": "Air"}, {"title": "Wa', encoding='utf-8')
+    with pytest.raises(ValueError):
+        list(iter_json_array(str(path), chunk_size=4))